@@ -24,6 +24,26 @@ import six
 import tensorflow as tf
 
 
+def _glob_files(file_pattern):
+    """Returns the files matching a comma-separated list of file patterns."""
+    filenames = []
+    seen = set()
+    for pattern in file_pattern.split(","):
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        matches = tf.io.gfile.glob(pattern)
+        if not matches:
+            raise ValueError(f"Found no files matching {pattern}")
+        for filename in matches:
+            if filename not in seen:
+                seen.add(filename)
+                filenames.append(filename)
+    if not filenames:
+        raise ValueError(f"No file patterns in {file_pattern!r}")
+    return filenames
+
+
 def build_dataset(file_pattern,
                   input_config,
                   batch_size,
@@ -31,35 +51,57 @@ def build_dataset(file_pattern,
                   shuffle_filenames=False,
                   shuffle_values_buffer=0,
                   repeat=1,
-                  include_identifiers=False):
-
-    def parse_example(serialized_example):
-        """Parses a single tf.Example into feature and label tensors."""
-        
-        data_fields = {
-            feature_name: tf.io.FixedLenFeature(feature.shape, tf.float32)
-            for feature_name, feature in input_config.features.items()
-        }
-        if include_labels:
-            for n in input_config.label_columns:
-                data_fields[n] = tf.io.FixedLenFeature([], tf.int64)
-        if include_identifiers:
-            assert "astro_id" not in data_fields
-            data_fields["astro_id"] = tf.io.FixedLenFeature([], tf.int64)
-
-
-        parsed_features = tf.io.parse_single_example(serialized_example, features=data_fields)
-
+                  include_identifiers=False,
+                  cycle_length=None,
+                  deterministic=True):
+    """Builds a dataset of batches of examples from TFRecord files.
+
+    Args:
+      file_pattern: Comma-separated list of file patterns matching the
+        TFRecord files.
+      input_config: ConfigDict of the input features and labels.
+      batch_size: Number of examples per batch.
+      include_labels: Whether to return the labels and weights of the examples.
+      shuffle_filenames: Whether to shuffle the order in which files are read.
+      shuffle_values_buffer: Size of the buffer of shuffled examples; 0 does
+        not shuffle them.
+      repeat: Number of passes over the files; None repeats indefinitely.
+      include_identifiers: Whether to return the Astro IDs of the examples.
+      cycle_length: Number of files read concurrently. None lets tf.data
+        choose; 1 reads the files one after the other.
+      deterministic: Whether records of concurrently read files are
+        interleaved in a fixed order. Otherwise they are returned as they are
+        read, which is faster if some reads are slow.
+
+    Returns:
+      A tf.data.Dataset of (features, labels, weights) if include_labels, else
+      (features, identifiers) if include_identifiers, else features.
+    """
+
+    data_fields = {
+        feature_name: tf.io.FixedLenFeature(feature.shape, tf.float32)
+        for feature_name, feature in input_config.features.items()
+    }
+    if include_labels:
+        for n in input_config.label_columns:
+            data_fields[n] = tf.io.FixedLenFeature([], tf.int64)
+    if include_identifiers:
+        assert "astro_id" not in data_fields
+        data_fields["astro_id"] = tf.io.FixedLenFeature([], tf.int64)
+
+    def parse_batch(serialized_examples):
+        """Parses a batch of tf.Examples into feature and label tensors."""
+        parsed_features = tf.io.parse_example(serialized_examples, features=data_fields)
 
         if include_labels:
             label_features = [parsed_features.pop(name) for name in input_config.label_columns]
-            labels = tf.stack(label_features)
+            labels = tf.stack(label_features, axis=1)
             labels_f = tf.cast(labels, tf.float32)
             labels = tf.cast(tf.minimum(labels, 1), tf.float32)
 
-            weights = tf.reduce_max(labels_f) / tf.maximum(tf.reduce_sum(labels_f), 1.0)
-            if labels[input_config.primary_class] < 1:
-                weights /= 2.0
+            weights = tf.reduce_max(labels_f, axis=1) / tf.maximum(
+                tf.reduce_sum(labels_f, axis=1), 1.0)
+            weights = tf.where(labels[:, input_config.primary_class] < 1, weights / 2.0, weights)
 
         if include_identifiers:
             identifiers = parsed_features.pop("astro_id")
@@ -89,10 +131,17 @@ def build_dataset(file_pattern,
         return features
 
 
-    filenames = tf.constant(tf.io.gfile.glob(file_pattern), dtype=tf.string)
-    ds = tf.data.Dataset.from_tensor_slices(filenames)
-    ds = ds.flat_map(tf.data.TFRecordDataset)
-    ds = ds.map(parse_example)
+    filenames = _glob_files(file_pattern)
+    ds = tf.data.Dataset.from_tensor_slices(tf.constant(filenames, dtype=tf.string))
+    if shuffle_filenames:
+        ds = ds.shuffle(len(filenames))
+    ds = ds.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=cycle_length,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=deterministic)
+    # Records are cached serialized and parsed after batching, where one op
+    # parses every feature of a batch.
     if repeat != 1:
         ds = ds.cache()
 
@@ -101,6 +150,7 @@ def build_dataset(file_pattern,
     if repeat != 1:
         ds = ds.repeat(repeat)
     ds = ds.batch(batch_size)
-    ds = ds.prefetch(10)
+    ds = ds.map(parse_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.prefetch(tf.data.AUTOTUNE)
 
     return ds
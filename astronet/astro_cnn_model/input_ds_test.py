@@ -0,0 +1,150 @@
+"""Tests for input_ds.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import os
+import shutil
+import tempfile
+
+from absl.testing import absltest
+import numpy as np
+import tensorflow as tf
+
+from astronet.astro_cnn_model import input_ds
+from astronet.util import configdict
+
+# (name, shape) of some of the time series views of each bkspace.
+_VIEWS = (
+    ("global_view", (201,)),
+    ("global_std", (201,)),
+    ("local_view", (61,)),
+    ("sample_segments_view", (201, 14)),
+    ("local_aperture_m", (61,)),
+)
+
+
+def _example(rng, astro_id):
+  ex = tf.train.Example()
+  for tag in ["", "_0.3"]:
+    for name, shape in _VIEWS:
+      ex.features.feature[name + tag].float_list.value.extend(rng.randn(*shape).reshape(-1))
+    ex.features.feature["local_scale" + tag].float_list.value.append(rng.rand())
+  ex.features.feature["Period"].float_list.value.append(10 * rng.rand())
+  ex.features.feature["Tmag"].float_list.value.append(10 + rng.randn())
+  ex.features.feature["astro_id"].int64_list.value.append(astro_id)
+  for label in ["disp_e", "disp_p"]:
+    ex.features.feature[label].int64_list.value.append(rng.randint(2))
+  return ex
+
+
+class BuildDatasetTest(absltest.TestCase):
+
+  def setUp(self):
+    super(BuildDatasetTest, self).setUp()
+    self.tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tempdir)
+    self.input_config = configdict.ConfigDict({
+        "label_columns": ["disp_e", "disp_p"],
+        "primary_class": 0,
+        "features": {
+            "global_view": {"shape": [201], "is_time_series": True},
+            "local_view_0.3": {"shape": [61], "is_time_series": True},
+            "sample_segments_view_0.3": {"shape": [201, 14], "is_time_series": True},
+            "local_aperture_m": {"shape": [61], "is_time_series": True},
+            "local_scale_0.3": {"shape": [], "is_time_series": False},
+            "Period": {"shape": [], "is_time_series": False, "scale": "log",
+                       "min_val": 0.1, "max_val": 100.0},
+            "Tmag": {"shape": [], "is_time_series": False, "scale": "norm",
+                     "mean": 10.0, "std": 2.0},
+        },
+    })
+
+  def _write(self, examples, name):
+    file_name = os.path.join(self.tempdir, name)
+    with tf.io.TFRecordWriter(file_name) as writer:
+      for ex in examples:
+        writer.write(ex.SerializeToString())
+    return file_name
+
+  def testMatchesExamples(self):
+    rng = np.random.RandomState(0)
+    examples = [_example(rng, astro_id) for astro_id in range(1, 6)]
+    file_name = self._write(examples, "examples")
+
+    for include_labels in [True, False]:
+      ds = input_ds.build_dataset(
+          file_name, self.input_config, batch_size=2, include_labels=include_labels,
+          include_identifiers=not include_labels)
+      batches = list(ds)
+      self.assertLen(batches, 3)
+      features = {name: np.concatenate([b[0][name] for b in batches])
+                  for name in batches[0][0]}
+      for i, ex in enumerate(examples):
+        feature = ex.features.feature
+        for name, cfg in self.input_config.features.items():
+          if cfg.is_time_series:
+            np.testing.assert_array_equal(
+                features[name.lower()][i].reshape(-1),
+                np.float32(feature[name].float_list.value))
+        self.assertAlmostEqual(
+            features["tmag"][i], (feature["Tmag"].float_list.value[0] - 10.0) / 2.0, places=6)
+        self.assertAlmostEqual(
+            features["period"][i],
+            np.log(feature["Period"].float_list.value[0] + 0.9) / np.log(100.0), places=6)
+      if include_labels:
+        labels = np.concatenate([b[1] for b in batches])
+        weights = np.concatenate([b[2] for b in batches])
+        for i, ex in enumerate(examples):
+          expected = [ex.features.feature[n].int64_list.value[0] for n in ["disp_e", "disp_p"]]
+          np.testing.assert_array_equal(labels[i], expected)
+          expected_weight = max(expected) / max(sum(expected), 1)
+          if not expected[0]:
+            expected_weight /= 2
+          self.assertAlmostEqual(weights[i], expected_weight)
+      else:
+        identifiers = np.concatenate([b[1] for b in batches])
+        np.testing.assert_array_equal(identifiers, range(1, 6))
+
+  def _astro_ids(self, ds):
+    return [int(i) for _, ids in ds for i in ids.numpy()]
+
+  def testFilePatterns(self):
+    rng = np.random.RandomState(0)
+    for i in range(4):
+      prefix = "train" if i < 3 else "val"
+      self._write([_example(rng, 10 * i + j) for j in range(3)], f"{prefix}-{i}")
+    pattern = ",".join([os.path.join(self.tempdir, "train-*"),
+                        os.path.join(self.tempdir, "val-3"),
+                        os.path.join(self.tempdir, "train-0")])
+    kwargs = dict(input_config=self.input_config, batch_size=4, include_labels=False,
+                  include_identifiers=True)
+
+    sequential = self._astro_ids(input_ds.build_dataset(pattern, cycle_length=1, **kwargs))
+    self.assertCountEqual(sequential, [10 * i + j for i in range(4) for j in range(3)])
+    # Files are read one after the other.
+    self.assertLen([f for f, _ in itertools.groupby(a // 10 for a in sequential)], 4)
+
+    interleaved = self._astro_ids(input_ds.build_dataset(pattern, cycle_length=4, **kwargs))
+    self.assertCountEqual(interleaved, sequential)
+    self.assertNotEqual(interleaved, sequential)
+    self.assertEqual(
+        self._astro_ids(input_ds.build_dataset(pattern, cycle_length=4, **kwargs)), interleaved)
+
+    for deterministic in [True, False]:
+      self.assertCountEqual(
+          self._astro_ids(input_ds.build_dataset(
+              pattern, shuffle_filenames=True, deterministic=deterministic, **kwargs)),
+          sequential)
+
+  def testMissingFiles(self):
+    with self.assertRaisesRegex(ValueError, "Found no files matching .*missing"):
+      input_ds.build_dataset(
+          self._write([], "empty") + "," + os.path.join(self.tempdir, "missing"),
+          self.input_config, batch_size=2)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -12,9 +12,14 @@ def global_features(
     flux: np.ndarray,
     transit_mask: npt.NDArray[np.bool_],
     period: float,
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
-    view, std, mask, _, _ = preprocess.global_view(tic, time, flux, period)
-    transit_mask, _, _, _, _ = preprocess.tr_mask_view(tic, time, transit_mask, period)
+    view, std, mask, _, _ = preprocess.global_view(
+        tic, time, flux, period, folded=folded
+    )
+    transit_mask, _, _, _, _ = preprocess.tr_mask_view(
+        tic, time, transit_mask, period, folded=folded
+    )
     return {
         "global_view": view,
         "global_std": std,
@@ -29,9 +34,10 @@ def local_features(
     flux: np.ndarray,
     period: float,
     duration: float,
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
     view, std, mask, scale, depth = preprocess.local_view(
-        tic, time, flux, period, duration
+        tic, time, flux, period, duration, folded=folded
     )
     return (
         {
@@ -55,9 +61,10 @@ def aperture_features(
     duration: float,
     scale: Optional[float],
     depth: Optional[float],
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
     view, _, _, _, _ = preprocess.local_view(
-        tic, time, flux, period, duration, scale=scale, depth=depth
+        tic, time, flux, period, duration, scale=scale, depth=depth, folded=folded
     )
     return {f"local_aperture_{aperture_name}": view}
 
@@ -71,9 +78,18 @@ def odd_features(
     duration: float,
     scale: Optional[float],
     depth: Optional[float],
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
+    odd = folded.select(odd_mask) if folded is not None else None
     view, std, mask, _, _ = preprocess.local_view(
-        tic, time[odd_mask], flux[odd_mask], period, duration, scale=scale, depth=depth
+        tic,
+        time[odd_mask],
+        flux[odd_mask],
+        period,
+        duration,
+        scale=scale,
+        depth=depth,
+        folded=odd,
     )
     return {
         "local_view_odd": view,
@@ -91,7 +107,9 @@ def even_features(
     duration: float,
     scale: Optional[float],
     depth: Optional[float],
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
+    even = folded.select(even_mask) if folded is not None else None
     view, std, mask, _, _ = preprocess.local_view(
         tic,
         time[even_mask],
@@ -100,6 +118,7 @@ def even_features(
         duration,
         scale=scale,
         depth=depth,
+        folded=even,
     )
     return {
         "local_view_even": view,
@@ -116,12 +135,13 @@ def secondary_features(
     duration: float,
     scale: Optional[float],
     depth: Optional[float],
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
     (_, _, _, secondary_scale, _), _ = preprocess.secondary_view(
-        tic, time, flux, period, duration
+        tic, time, flux, period, duration, folded=folded
     )
     (view, std, mask, scale, _), t0 = preprocess.secondary_view(
-        tic, time, flux, period, duration, scale=scale, depth=depth
+        tic, time, flux, period, duration, scale=scale, depth=depth, folded=folded
     )
     return (
         {
@@ -149,8 +169,11 @@ def sample_segments_features(
     even_mask: npt.NDArray[np.bool_],
     period: float,
     duration: float,
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
-    view = preprocess.sample_segments_view(tic, time, flux, fold_num, period, duration)
+    view = preprocess.sample_segments_view(
+        tic, time, flux, fold_num, period, duration, folded=folded
+    )
     odd_view = preprocess.sample_segments_view(
         tic,
         time[odd_mask],
@@ -161,6 +184,7 @@ def sample_segments_features(
         num_bins=61,
         num_transits=4,
         local=True,
+        folded=folded.select(odd_mask) if folded is not None else None,
     )
     even_view = preprocess.sample_segments_view(
         tic,
@@ -172,6 +196,7 @@ def sample_segments_features(
         num_bins=61,
         num_transits=4,
         local=True,
+        folded=folded.select(even_mask) if folded is not None else None,
     )
     local_view = np.concatenate([odd_view, even_view], axis=-1)
     return {
@@ -185,8 +210,11 @@ def double_period_features(
     time: np.ndarray,
     flux: np.ndarray,
     period: float,
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
-    view, std, mask, _, _ = preprocess.global_view(tic, time, flux, period * 2)
+    view, std, mask, _, _ = preprocess.global_view(
+        tic, time, flux, period * 2, folded=folded
+    )
     return {
         "global_view_double_period": view,
         "global_view_double_period_std": std,
@@ -200,12 +228,13 @@ def half_period_features(
     flux: np.ndarray,
     period: float,
     duration: float,
+    folded: Optional[preprocess.FoldedLightCurve] = None,
 ):
     global_view, global_std, global_mask, _, _ = preprocess.global_view(
-        tic, time, flux, period / 2
+        tic, time, flux, period / 2, folded=folded
     )
     local_view, local_std, local_mask, _, _ = preprocess.local_view(
-        tic, time, flux, period / 2, duration
+        tic, time, flux, period / 2, duration, folded=folded
     )
     return {
         "global_view_half_period": global_view,
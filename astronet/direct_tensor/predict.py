@@ -3,6 +3,7 @@ Make astronet predictions without creating and serializing tf.training.Examples.
 """
 
 import json
+from concurrent.futures import Executor
 from itertools import starmap
 from multiprocessing import Pool
 from pathlib import Path
@@ -25,10 +26,16 @@ from astronet.direct_tensor.features import (
     secondary_features,
 )
 from astronet.preprocess import preprocess
+from astronet.preprocess.detrend_cache import DetrendCache
 
 
 class LCGetter(Protocol):
-    """Take astro_id and optionally aperture name and return (time, flux)."""
+    """Take astro_id and optionally aperture name and return (time, flux).
+
+    Getters may also define read_apertures(astro_id, apertures), returning a
+    dict of (time, flux) per aperture, to read all apertures at once in vetting
+    mode (see preprocess.LightCurveGetter).
+    """
 
     def __call__(
         self, astro_id: int, aperture: Optional[Literal["s", "m", "l"]] = None
@@ -47,6 +54,9 @@ def standard_view_features(
     duration: float,
     breakspace: Optional[float],
     aperture_fluxes: dict[str, tuple[np.ndarray, np.ndarray]],
+    detrend_cache: Optional[DetrendCache] = None,
+    spline_executor: Optional[Executor] = None,
+    bkspace_patience: Optional[int] = None,
 ) -> tuple[dict[str, Union[float, np.ndarray]], npt.NDArray[np.int_]]:
     """
     Process lightcurve and create standard view inputs that depend on time/flux
@@ -74,7 +84,16 @@ def standard_view_features(
         For triage model: empty dict.
         For vetting model: {aperture_name: (lightcurve_time, lightcurve_flux)}
         for all apertures to be considered ('s', 'm', 'l').
-
+    detrend_cache: DetrendCache | None
+        Optional on-disk cache of detrended lightcurves, shared with
+        generate_input_records.
+    spline_executor: Executor | None
+        Optional executor fitting the breakspaces tried when breakspace is
+        None concurrently; see keplersplinev2.choose_kepler_spline.
+    bkspace_patience: int | None
+        Optional number of consecutive breakspaces with an increasing BIC
+        after which the breakspace search stops; see
+        keplersplinev2.choose_kepler_spline.
 
     Returns
     -------
@@ -89,44 +108,67 @@ def standard_view_features(
     all_features = {}
 
     det_time, det_flux, transit_mask = preprocess.detrend_and_filter(
-        tic, time, flux, period, epoch, duration, breakspace
+        tic,
+        time,
+        flux,
+        period,
+        epoch,
+        duration,
+        breakspace,
+        executor=spline_executor,
+        patience=bkspace_patience,
+        cache=detrend_cache,
+    )
+    folded = preprocess.FoldedLightCurve(
+        det_time, det_flux, transit_mask, period, epoch
     )
     folded_time, folded_flux, fold_num, normal_transit_mask = (
-        preprocess.phase_fold_and_sort_light_curve(
-            det_time, det_flux, transit_mask, period, epoch
-        )
+        folded.time,
+        folded.flux,
+        folded.fold_num,
+        folded.mask,
     )
     odd_mask = fold_num % 2 == 1
     even_mask = fold_num % 2 == 0
 
     all_features.update(
-        global_features(tic, folded_time, folded_flux, normal_transit_mask, period)
+        global_features(
+            tic, folded_time, folded_flux, normal_transit_mask, period, folded=folded
+        )
     )
 
     loc_features, local_scale, local_depth = local_features(
-        tic, folded_time, folded_flux, period, duration
+        tic, folded_time, folded_flux, period, duration, folded=folded
     )
     all_features.update(loc_features)
 
     for aperture, (ap_time, ap_flux) in aperture_fluxes.items():
         ap_det_time, ap_det_flux, ap_transit_mask = preprocess.detrend_and_filter(
-            tic, ap_time, ap_flux
+            tic,
+            ap_time,
+            ap_flux,
+            period,
+            epoch,
+            duration,
+            breakspace,
+            executor=spline_executor,
+            patience=bkspace_patience,
+            cache=detrend_cache,
         )
-        ap_folded_time, ap_folded_flux, _, _ = (
-            preprocess.phase_fold_and_sort_light_curve(
-                ap_det_time, ap_det_flux, ap_transit_mask, period, epoch
-            )
+        ap_folded = preprocess.FoldedLightCurve(
+            ap_det_time, ap_det_flux, ap_transit_mask, period, epoch
         )
         all_features.update(
             aperture_features(
                 aperture,
                 tic,
-                ap_folded_time,
-                ap_folded_flux,
+                ap_folded.time,
+                ap_folded.flux,
                 period,
                 duration,
                 local_scale,
                 local_depth,
+                folded=ap_folded,
             )
         )
 
@@ -140,6 +182,7 @@ def standard_view_features(
             duration,
             local_scale,
             local_depth,
+            folded=folded,
         )
     )
     all_features.update(
@@ -152,11 +195,19 @@ def standard_view_features(
             duration,
             local_scale,
             local_depth,
+            folded=folded,
         )
     )
 
     sec_features, secondary_scale = secondary_features(
-        tic, folded_time, folded_flux, period, duration, local_scale, local_depth
+        tic,
+        folded_time,
+        folded_flux,
+        period,
+        duration,
+        local_scale,
+        local_depth,
+        folded=folded,
     )
     all_features.update(sec_features)
 
@@ -170,23 +221,31 @@ def standard_view_features(
             even_mask,
             period,
             duration,
+            folded=folded,
         )
     )
 
-    double_fold_time, double_fold_flux, _, _ = (
-        preprocess.phase_fold_and_sort_light_curve(
-            det_time, det_flux, transit_mask, period * 2, epoch - period / 2
-        )
+    double_folded = preprocess.FoldedLightCurve(
+        det_time, det_flux, transit_mask, period * 2, epoch - period / 2
     )
     all_features.update(
-        double_period_features(tic, double_fold_time, double_fold_flux, period)
+        double_period_features(
+            tic, double_folded.time, double_folded.flux, period, folded=double_folded
+        )
     )
 
-    half_fold_time, half_fold_flux, _, _ = preprocess.phase_fold_and_sort_light_curve(
+    half_folded = preprocess.FoldedLightCurve(
         det_time, det_flux, transit_mask, period / 2, epoch
     )
     all_features.update(
-        half_period_features(tic, half_fold_time, half_fold_flux, period, duration)
+        half_period_features(
+            tic,
+            half_folded.time,
+            half_folded.flux,
+            period,
+            duration,
+            folded=half_folded,
+        )
     )
 
     tag = "" if breakspace is None else f"_{breakspace}".replace(".", "_")
@@ -198,6 +257,9 @@ def prediction_features(
     time: np.ndarray,
     flux: np.ndarray,
     aperture_fluxes: dict[str, tuple[np.ndarray, np.ndarray]],
+    detrend_cache: Optional[DetrendCache] = None,
+    spline_executor: Optional[Executor] = None,
+    bkspace_patience: Optional[int] = None,
 ):
     """
     Assemble all input features for a lightcurve.
@@ -216,6 +278,12 @@ def prediction_features(
         For triage model: empty dict.
         For vetting model: {aperture_name: (lightcurve_time, lightcurve_flux)}
             for all apertures to be considered ('s', 'm', 'l').
+    detrend_cache: DetrendCache | None
+        Optional on-disk cache of detrended lightcurves.
+    spline_executor: Executor | None
+        See standard_view_features.
+    bkspace_patience: int | None
+        See standard_view_features.
 
     Returns
     -------
@@ -235,6 +303,9 @@ def prediction_features(
             tce["Dur"],
             breakspace,
             aperture_fluxes,
+            detrend_cache,
+            spline_executor,
+            bkspace_patience,
         )
         all_features.update(breakspace_features)
         fold_nums.append(fold_num)
@@ -282,15 +353,27 @@ def prepare_input(
     tce: pd.Series,
     get_lc: LCGetter,
     mode: Literal["triage", "vetting"],
+    detrend_cache: Optional[DetrendCache] = None,
+    spline_executor: Optional[Executor] = None,
+    bkspace_patience: Optional[int] = None,
 ) -> dict:
     """Assemble input features for TCE and normalize values where necessary."""
-    time, flux = get_lc(tce["Astro ID"])
-    aperture_fluxes = {}
     if mode == "vetting":
-        aperture_fluxes = {
-            aperture: get_lc(tce["Astro ID"], aperture) for aperture in ["s", "m", "l"]
-        }
-    tce_features = prediction_features(tce, time, flux, aperture_fluxes)
+        aperture_fluxes = preprocess.read_apertures(
+            get_lc, tce["Astro ID"], [None, "s", "m", "l"]
+        )
+    else:
+        aperture_fluxes = {None: get_lc(tce["Astro ID"])}
+    time, flux = aperture_fluxes.pop(None)
+    tce_features = prediction_features(
+        tce,
+        time,
+        flux,
+        aperture_fluxes,
+        detrend_cache,
+        spline_executor,
+        bkspace_patience,
+    )
     tce_features = {
         name: value for name, value in tce_features.items() if name in feature_cfg
     }
@@ -326,9 +409,21 @@ def build_dataset(
     get_lc: LCGetter,
     mode: Literal["triage", "vetting"],
     nprocs: int = 1,
+    detrend_cache: Optional[DetrendCache] = None,
+    spline_executor: Optional[Executor] = None,
+    bkspace_patience: Optional[int] = None,
 ) -> tf.data.Dataset:
-    """Create Dataset object containing input tensors for all tces."""
-    tasks = [(feature_cfg, tce.to_dict(), get_lc, mode) for _, tce in tces.iterrows()]
+    """Create Dataset object containing input tensors for all tces.
+
+    An executor cannot be sent to worker processes, so spline_executor
+    requires nprocs=1.
+    """
+    if spline_executor is not None and nprocs != 1:
+        raise ValueError("spline_executor requires nprocs=1.")
+    tasks = [
+        (feature_cfg, tce, get_lc, mode, detrend_cache, spline_executor, bkspace_patience)
+        for tce in tces.to_dict("records")
+    ]
     if nprocs == 1:
         all_tces_features = starmap(prepare_input, tasks)
     else:
@@ -355,11 +450,17 @@ def batch_predict(
     mode: Literal["triage", "vetting"],
     nruns: Optional[int] = None,
     nprocs: int = 1,
+    detrend_cache: Optional[DetrendCache] = None,
+    spline_executor: Optional[Executor] = None,
+    bkspace_patience: Optional[int] = None,
 ):
     """
     Run predictions from multiple model checkpoints for all TCEs.
 
     Assembles dataset in parallel, then runs model predictions in serial.
+    Detrended lightcurves are read from and stored in detrend_cache, if given.
+    spline_executor and bkspace_patience are passed to the spline detrending;
+    see standard_view_features.
 
     Returns
     -------
@@ -390,7 +491,16 @@ def batch_predict(
                 f"\n{model_dir}:\n{model_cfg['inputs']['label_columns']}"
             )
 
-    dataset = build_dataset(input_features_cfg, tces, get_lc, mode, nprocs)
+    dataset = build_dataset(
+        input_features_cfg,
+        tces,
+        get_lc,
+        mode,
+        nprocs,
+        detrend_cache,
+        spline_executor,
+        bkspace_patience,
+    )
     predictions = [
         tf.keras.models.load_model(model_dir).predict(dataset)
         for model_dir in model_dirs
@@ -0,0 +1,63 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Converts a directory of QLP FITS files into a columnar light curve store.
+
+The store is read by generate_input_records with --light_curve_store. Running
+this again on the same output file only adds files which are not already in
+it.
+
+Usage:
+  python -m astronet.preprocess.build_light_curve_store \
+      --tess_data_dir=/mnt/tess/lc --output_file=/mnt/tess/lc.h5
+"""
+import argparse
+import sys
+
+from absl import app, logging
+
+from light_curve_util import light_curve_store
+
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument(
+    "--tess_data_dir",
+    type=str,
+    required=True)
+
+parser.add_argument(
+    "--output_file",
+    type=str,
+    required=True)
+
+parser.add_argument(
+    "--pattern",
+    type=str,
+    default="**/*.fits*",
+    help="Glob pattern of the FITS files, relative to tess_data_dir.")
+
+parser.add_argument(
+    "--overwrite",
+    action="store_true",
+    help="Replace light curves which are already in the store.")
+
+
+def main(_):
+    num_written = light_curve_store.ingest(
+        FLAGS.tess_data_dir, FLAGS.output_file, FLAGS.pattern, FLAGS.overwrite)
+    logging.info("Wrote %d light curves to %s", num_written, FLAGS.output_file)
+
+
+if __name__ == "__main__":
+  logging.set_verbosity(logging.INFO)
+  FLAGS, unparsed = parser.parse_known_args()
+  app.run(main=main, argv=[sys.argv[0]] + unparsed)
@@ -0,0 +1,173 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Caches of detrended light curves."""
+import collections
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+# Bump to invalidate existing entries when the detrending output changes.
+_VERSION = 1
+
+_SUFFIX = '.npz'
+
+# Fraction of max_bytes the cache is trimmed to when it overflows, so that
+# eviction does not run on every insertion once the cache is full.
+_LOW_WATER = 0.9
+
+
+class DetrendCache(object):
+  """A size-bounded, content-addressed cache of detrend_and_filter outputs.
+
+  Entries are keyed by a hash of the raw time and flux arrays and of the
+  detrending parameters, so the same light curve read for a different TCE
+  table row, label or model configuration hits the same entry. The cache
+  directory can be shared by several processes: entries are written
+  atomically, and the least recently used ones are evicted once the total
+  size exceeds max_bytes. Each process only counts its own insertions
+  between scans of the directory, so the bound is approximate.
+
+  Attributes:
+    cache_dir: Directory holding the cache entries.
+    max_bytes: Approximate maximum total size of the entries.
+  """
+
+  def __init__(self, cache_dir, max_bytes=10 * 2**30):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self._size = None
+    os.makedirs(cache_dir, exist_ok=True)
+
+  @staticmethod
+  def key(time, flux, *params):
+    """Returns the cache key of a light curve and detrending parameters.
+
+    Args:
+      time: 1D numpy array of time values.
+      flux: 1D numpy array of flux values.
+      *params: Scalar parameters, strings or None that the result depends on.
+
+    Returns:
+      A hex digest string.
+    """
+    h = hashlib.sha1()
+    params = tuple(p if p is None or isinstance(p, str) else float(p) for p in params)
+    h.update(repr((_VERSION,) + params).encode())
+    for a in (time, flux):
+      a = np.ascontiguousarray(a)
+      h.update(a.dtype.str.encode())
+      h.update(str(a.shape).encode())
+      h.update(a.tobytes())
+    return h.hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self.cache_dir, key[:2], key + _SUFFIX)
+
+  def get(self, key):
+    """Returns the cached (time, flux, mask) arrays, or None on a miss."""
+    path = self._path(key)
+    try:
+      with np.load(path) as data:
+        result = data['time'], data['flux'], data['mask']
+      os.utime(path)  # Mark as recently used.
+    except (OSError, ValueError, KeyError):
+      # Missing, concurrently evicted or unreadable entries are misses.
+      return None
+    return result
+
+  def put(self, key, time, flux, mask):
+    """Stores the (time, flux, mask) arrays under key."""
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        np.savez(f, time=time, flux=flux, mask=mask)
+      size = os.path.getsize(tmp_path)
+      os.replace(tmp_path, path)
+    except BaseException:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+      raise
+
+    if self._size is None:
+      self._size = self._scan()[1]
+    else:
+      self._size += size
+    if self._size > self.max_bytes:
+      self._evict()
+
+  def _scan(self):
+    """Returns the (mtime, size, path) of all entries and their total size."""
+    entries = []
+    for subdir in os.scandir(self.cache_dir):
+      if not subdir.is_dir():
+        continue
+      for entry in os.scandir(subdir.path):
+        if not entry.name.endswith(_SUFFIX):
+          continue
+        try:
+          stat = entry.stat()
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries, sum(size for _, size, _ in entries)
+
+  def _evict(self):
+    """Removes the least recently used entries until under the low water mark."""
+    entries, total = self._scan()
+    entries.sort()
+    for _, size, path in entries:
+      if total <= self.max_bytes * _LOW_WATER:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      total -= size
+    self._size = total
+
+
+class MemoryDetrendCache(object):
+  """An in-memory LRU cache with the same interface as DetrendCache.
+
+  Used to share star-level detrending between the TCEs of a star when no
+  on-disk cache is configured.
+
+  Attributes:
+    max_entries: Maximum number of cached results.
+  """
+
+  key = staticmethod(DetrendCache.key)
+
+  def __init__(self, max_entries=16):
+    self.max_entries = max_entries
+    self._entries = collections.OrderedDict()
+
+  def get(self, key):
+    """Returns the cached (time, flux, mask) arrays, or None on a miss."""
+    result = self._entries.get(key)
+    if result is not None:
+      self._entries.move_to_end(key)
+    return result
+
+  def put(self, key, time, flux, mask):
+    """Stores the (time, flux, mask) arrays under key."""
+    self._entries[key] = time, flux, mask
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_entries:
+      self._entries.popitem(last=False)
@@ -0,0 +1,98 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for detrend_cache.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+from absl.testing import absltest
+import numpy as np
+
+from astronet.preprocess import detrend_cache
+from astronet.preprocess import preprocess
+
+
+def _light_curve(seed=0):
+  rng = np.random.RandomState(seed)
+  time = np.arange(1325.0, 1352.0, 30.0 / 60.0 / 24)
+  flux = 1000 * (1 + 0.002 * np.sin(time / 3) + 5e-4 * rng.randn(len(time)))
+  return time, flux
+
+
+class DetrendCacheTest(absltest.TestCase):
+
+  def _tempdir(self):
+    path = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, path)
+    return path
+
+  def testKey(self):
+    time, flux = _light_curve()
+    key = detrend_cache.DetrendCache.key(time, flux, 3.7, 1326.3, 0.15, None)
+    self.assertEqual(key, detrend_cache.DetrendCache.key(
+        time.copy(), flux.copy(), np.float64(3.7), 1326.3, 0.15, None))
+    self.assertNotEqual(key, detrend_cache.DetrendCache.key(time, flux, 3.7, 1326.3, 0.15, 0.3))
+    self.assertNotEqual(key, detrend_cache.DetrendCache.key(time, flux * 1.01, 3.7, 1326.3, 0.15, None))
+
+  def testRoundTrip(self):
+    cache = detrend_cache.DetrendCache(self._tempdir())
+    time, flux = _light_curve()
+    mask = flux > 1000
+    self.assertIsNone(cache.get('0123'))
+    cache.put('0123', time, flux, mask)
+    for e, a in zip((time, flux, mask), cache.get('0123')):
+      np.testing.assert_array_equal(a, e)
+
+  def testDetrendAndFilter(self):
+    cache = detrend_cache.DetrendCache(self._tempdir())
+    time, flux = _light_curve()
+    for bkspace in [0.3, None]:
+      expected = preprocess.detrend_and_filter(0, time, flux, 3.7, 1326.3, 0.15, bkspace)
+      for _ in range(2):  # A miss, then a hit.
+        actual = preprocess.detrend_and_filter(
+            0, time, flux, 3.7, 1326.3, 0.15, bkspace, cache=cache)
+        for e, a in zip(expected, actual):
+          np.testing.assert_array_equal(a, e)
+
+  def testLeastRecentlyUsedEviction(self):
+    cache_dir = self._tempdir()
+    time, flux = _light_curve()
+    mask = np.ones_like(time, dtype=bool)
+
+    probe = detrend_cache.DetrendCache(cache_dir)
+    probe.put('ff', time, flux, mask)
+    entry_size = os.path.getsize(os.path.join(cache_dir, 'ff', 'ff.npz'))
+    os.remove(os.path.join(cache_dir, 'ff', 'ff.npz'))
+
+    cache = detrend_cache.DetrendCache(cache_dir, max_bytes=int(3.5 * entry_size))
+    keys = ['a0', 'b0', 'c0']
+    for i, key in enumerate(keys):
+      cache.put(key, time, flux, mask)
+      os.utime(os.path.join(cache_dir, key[:2], key + '.npz'), (i, i))
+    self.assertIsNotNone(cache.get('a0'))  # Now the most recently used.
+    cache.put('d0', time, flux, mask)
+
+    self.assertIsNone(cache.get('b0'))
+    for key in ['a0', 'c0', 'd0']:
+      self.assertIsNotNone(cache.get(key))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -11,10 +11,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import argparse
+from concurrent import futures
 import multiprocessing
 import os
 import sys
-from typing import Literal, Optional
+from typing import Literal, Optional, Sequence
 
 import numpy as np
 import pandas as pd
@@ -22,7 +23,10 @@ import tensorflow as tf
 from absl import app, logging
 from typing_extensions import Protocol
 
+from astronet.preprocess import detrend_cache as detrend_cache_lib
 from astronet.preprocess import preprocess
+from astronet.preprocess import shard_manifest
+from light_curve_util import light_curve_store as light_curve_store_lib
 
 
 class LCGetter(Protocol):
@@ -42,6 +46,12 @@ parser.add_argument(
     type=str,
     required=True)
 
+parser.add_argument(
+    "--light_curve_store",
+    type=str,
+    default=None,
+    help="HDF5 store of the files in tess_data_dir, written by build_light_curve_store.")
+
 parser.add_argument(
     "--output_dir",
     type=str,
@@ -62,16 +72,97 @@ parser.add_argument(
    "--not-training",
    action="store_true")
 
+parser.add_argument(
+    "--num_processes",
+    type=int,
+    default=1,
+    help="Number of worker processes; TCEs are distributed to them individually.")
+
+parser.add_argument(
+    "--chunk_size",
+    type=int,
+    default=4,
+    help="Number of consecutive TCEs sent to a worker process at a time.")
+
+parser.add_argument(
+    "--manifest_dir",
+    type=str,
+    default=None,
+    help="Directory, outside output_dir, of manifests of the TCEs in each shard. If set, "
+    "new examples are appended to part files of the shards instead of rewriting them.")
+
+parser.add_argument(
+    "--compact",
+    action="store_true",
+    help="Merge the part files of each shard into the shard file after processing.")
+
+parser.add_argument(
+    "--detrend_cache_dir",
+    type=str,
+    default=None,
+    help="Directory of an on-disk cache of detrended light curves, shared with direct_tensor.")
+
+parser.add_argument(
+    "--detrend_cache_gb",
+    type=float,
+    default=10.0,
+    help="Approximate maximum size of the detrending cache, in GB.")
+
+parser.add_argument(
+    "--star_level_detrending",
+    action="store_true",
+    help="Mask the transits of all TCEs of a star jointly and detrend each star once. TCEs are "
+         "assigned to shards as without it, and grouped by star within each shard.")
+
+parser.add_argument(
+    "--warm_start_splines",
+    action="store_true",
+    help="Fit detrending splines with light_curve_util.banded_spline instead of pydl.")
+
+parser.add_argument(
+    "--bkspace_patience",
+    type=int,
+    default=None,
+    help="Stop the search for the detrending spline's break-point spacing after this many "
+    "consecutive spacings with an increasing BIC. All spacings are tried if not set.")
+
+parser.add_argument(
+    "--spline_workers",
+    type=int,
+    default=0,
+    help="Number of processes fitting the break-point spacings of a TCE concurrently. Only "
+    "supported with --num_processes=1.")
+
+
+def _varint(n):
+  """Encodes a non-negative int as a protobuf varint."""
+  out = bytearray()
+  while n >= 0x80:
+    out.append((n & 0x7F) | 0x80)
+    n >>= 7
+  out.append(n)
+  return bytes(out)
+
+
+def _float_list_bytes(values):
+  """Serializes a tensorflow.train.FloatList, with its values packed.
+
+  Setting the values of a FloatList one Python float at a time dominates the
+  cost of building an example. The packed encoding of the values is just their
+  little-endian float32 bytes, so the serialized FloatList can be built with
+  numpy and parsed by the protobuf library in a single call.
+  """
+  data = np.asarray(values, dtype='<f4').tobytes()
+  return b'\n' + _varint(len(data)) + data  # Field 1 (value), length delimited.
+
 
 def _set_float_feature(ex, name, value):
   """Sets the value of a float feature in a tensorflow.train.Example proto."""
   assert name not in ex.features.feature, "Duplicate feature: %s" % name
-  if isinstance(value, np.ndarray):
-    value = value.reshape((-1,))
-  values = [float(v) for v in value]
-  if any(np.isnan(values)):
+  values = np.asarray(value, dtype=np.float64).reshape((-1,))
+  if np.isnan(values).any():
     raise ValueError(f'NaNs in {name}')
-  ex.features.feature[name].float_list.value.extend(values)
+  ex.features.feature[name].float_list.MergeFromString(_float_list_bytes(values))
 
 
 def _set_bytes_feature(ex, name, value):
@@ -86,27 +177,32 @@ def _set_int64_feature(ex, name, value):
   ex.features.feature[name].int64_list.value.extend([int(v) for v in value])
 
 
-def _standard_views(ex, tic, time, flux, period, epoc, duration, bkspace, aperture_fluxes):
+def _standard_views(ex, tic, time, flux, period, epoc, duration, bkspace, aperture_fluxes,
+                    detrend_cache=None, ephemerides=None, warm_start=False, spline_executor=None,
+                    bkspace_patience=None):
   if bkspace is None:
     tag = ''
   else:
     tag = f'_{bkspace}'
 
-  detrended_time, detrended_flux, transit_mask = preprocess.detrend_and_filter(tic, time, flux, period, epoc, duration, bkspace)
+  detrended_time, detrended_flux, transit_mask = preprocess.detrend_and_filter(
+      tic, time, flux, period, epoc, duration, bkspace, executor=spline_executor,
+      patience=bkspace_patience, cache=detrend_cache, ephemerides=ephemerides,
+      warm_start=warm_start)
 
-  time, flux, fold_num, tr_mask = preprocess.phase_fold_and_sort_light_curve(
-      detrended_time, detrended_flux, transit_mask, period, epoc)
+  folded = preprocess.FoldedLightCurve(detrended_time, detrended_flux, transit_mask, period, epoc)
+  time, flux, fold_num, tr_mask = folded.time, folded.flux, folded.fold_num, folded.mask
   odds = ((fold_num % 2) == 1)
   evens = ((fold_num % 2) == 0)
 
-  view, std, mask, _, _ = preprocess.global_view(tic, time, flux, period)
-  tr_mask, _, _, _, _ = preprocess.tr_mask_view(tic, time, tr_mask, period)
+  view, std, mask, _, _ = preprocess.global_view(tic, time, flux, period, folded=folded)
+  tr_mask, _, _, _, _ = preprocess.tr_mask_view(tic, time, tr_mask, period, folded=folded)
   _set_float_feature(ex, f'global_view{tag}', view)
   _set_float_feature(ex, f'global_std{tag}', std)
   _set_float_feature(ex, f'global_mask{tag}', mask)
   _set_float_feature(ex, f'global_transit_mask{tag}', tr_mask)
 
-  view, std, mask, scale, depth = preprocess.local_view(tic, time, flux, period, duration)
+  view, std, mask, scale, depth = preprocess.local_view(tic, time, flux, period, duration, folded=folded)
   _set_float_feature(ex, f'local_view{tag}', view)
   _set_float_feature(ex, f'local_std{tag}', std)
   _set_float_feature(ex, f'local_mask{tag}', mask)
@@ -117,23 +213,32 @@ def _standard_views(ex, tic, time, flux, period, epoc, duration, bkspace, apertu
     _set_float_feature(ex, f'local_scale{tag}', [0.0])
     _set_float_feature(ex, f'local_scale_present{tag}', [0.0])
   for k, (t, f) in aperture_fluxes.items():
-    t, f, m = preprocess.detrend_and_filter(tic, t, f, period, epoc, duration, bkspace)
-    t, f, _, _ = preprocess.phase_fold_and_sort_light_curve(t, f, m, period, epoc)
-    view, std, _, _, _ = preprocess.local_view(tic, t, f, period, duration, scale=scale, depth=depth)
+    t, f, m = preprocess.detrend_and_filter(
+        tic, t, f, period, epoc, duration, bkspace, executor=spline_executor,
+        patience=bkspace_patience, cache=detrend_cache, ephemerides=ephemerides,
+        warm_start=warm_start)
+    aperture = preprocess.FoldedLightCurve(t, f, m, period, epoc)
+    view, std, _, _, _ = preprocess.local_view(
+        tic, aperture.time, aperture.flux, period, duration, scale=scale, depth=depth, folded=aperture)
     _set_float_feature(ex, f'local_aperture_{k}{tag}', view)
 
-  view, std, mask, _, _ = preprocess.local_view(tic, time[odds], flux[odds], period, duration, scale=scale, depth=depth)
+  odd = folded.select(odds)
+  view, std, mask, _, _ = preprocess.local_view(
+      tic, odd.time, odd.flux, period, duration, scale=scale, depth=depth, folded=odd)
   _set_float_feature(ex, f'local_view_odd{tag}', view)
   _set_float_feature(ex, f'local_std_odd{tag}', std)
   _set_float_feature(ex, f'local_mask_odd{tag}', mask)
 
-  view, std, mask, _, _ = preprocess.local_view(tic, time[evens], flux[evens], period, duration, scale=scale, depth=depth)
+  even = folded.select(evens)
+  view, std, mask, _, _ = preprocess.local_view(
+      tic, even.time, even.flux, period, duration, scale=scale, depth=depth, folded=even)
   _set_float_feature(ex, f'local_view_even{tag}', view)
   _set_float_feature(ex, f'local_std_even{tag}', std)
   _set_float_feature(ex, f'local_mask_even{tag}', mask)
 
-  (_, _, _, sec_scale, _), t0 = preprocess.secondary_view(tic, time, flux, period, duration)
-  (view, std, mask, scale, _), t0 = preprocess.secondary_view(tic, time, flux, period, duration, scale=scale, depth=depth)
+  (_, _, _, sec_scale, _), t0 = preprocess.secondary_view(tic, time, flux, period, duration, folded=folded)
+  (view, std, mask, scale, _), t0 = preprocess.secondary_view(
+      tic, time, flux, period, duration, scale=scale, depth=depth, folded=folded)
   _set_float_feature(ex, f'secondary_view{tag}', view)
   _set_float_feature(ex, f'secondary_std{tag}', std)
   _set_float_feature(ex, f'secondary_mask{tag}', mask)
@@ -145,31 +250,35 @@ def _standard_views(ex, tic, time, flux, period, epoc, duration, bkspace, apertu
     _set_float_feature(ex, f'secondary_scale{tag}', [0.0])
     _set_float_feature(ex, f'secondary_scale_present{tag}', [0.0])
 
-  full_view = preprocess.sample_segments_view(tic, time, flux, fold_num, period, duration)
+  full_view = preprocess.sample_segments_view(tic, time, flux, fold_num, period, duration, folded=folded)
   _set_float_feature(ex, f'sample_segments_view{tag}', full_view)
 
   odd_view = preprocess.sample_segments_view(
-      tic, time[odds], flux[odds], fold_num[odds], period, duration, num_bins=61, num_transits=4, local=True)
+      tic, odd.time, odd.flux, odd.fold_num, period, duration, num_bins=61, num_transits=4, local=True,
+      folded=odd)
   even_view = preprocess.sample_segments_view(
-      tic, time[evens], flux[evens], fold_num[evens], period, duration, num_bins=61, num_transits=4, local=True)
+      tic, even.time, even.flux, even.fold_num, period, duration, num_bins=61, num_transits=4, local=True,
+      folded=even)
   full_view = np.concatenate([odd_view, even_view], axis=-1)
   _set_float_feature(ex, f'sample_segments_local_view{tag}', full_view)
   
-  time, flux, fold_num, _ = preprocess.phase_fold_and_sort_light_curve(
+  folded = preprocess.FoldedLightCurve(
       detrended_time, detrended_flux, transit_mask, period * 2, epoc - period / 2)
-  view, std, mask, scale, _ = preprocess.global_view(tic, time, flux, period * 2)
+  time, flux, fold_num = folded.time, folded.flux, folded.fold_num
+  view, std, mask, scale, _ = preprocess.global_view(tic, time, flux, period * 2, folded=folded)
   _set_float_feature(ex, f'global_view_double_period{tag}', view)
   _set_float_feature(ex, f'global_view_double_period_std{tag}', std)
   _set_float_feature(ex, f'global_view_double_period_mask{tag}', mask)
 
-  time, flux, fold_num, _ = preprocess.phase_fold_and_sort_light_curve(
+  folded = preprocess.FoldedLightCurve(
       detrended_time, detrended_flux, transit_mask, period / 2, epoc)
-  view, std, mask, scale, _ = preprocess.global_view(tic, time, flux, period / 2)
+  time, flux, fold_num = folded.time, folded.flux, folded.fold_num
+  view, std, mask, scale, _ = preprocess.global_view(tic, time, flux, period / 2, folded=folded)
   _set_float_feature(ex, f'global_view_half_period{tag}', view)
   _set_float_feature(ex, f'global_view_half_period_std{tag}', std)
   _set_float_feature(ex, f'global_view_half_period_mask{tag}', mask)
   
-  view, std, mask, scale, _ = preprocess.local_view(tic, time, flux, period / 2, duration)
+  view, std, mask, scale, _ = preprocess.local_view(tic, time, flux, period / 2, duration, folded=folded)
   _set_float_feature(ex, f'local_view_half_period{tag}', view)
   _set_float_feature(ex, f'local_view_half_period_std{tag}', std)
   _set_float_feature(ex, f'local_view_half_period_mask{tag}', mask)
@@ -181,22 +290,29 @@ def _process_tce(
     tce,
     get_lightcurve: LCGetter,
     mode: AstronetMode,
-    training: bool
+    training: bool,
+    detrend_cache: Optional[detrend_cache_lib.DetrendCache] = None,
+    star_ephemerides: Optional[dict] = None,
+    warm_start: bool = False,
+    spline_executor=None,
+    bkspace_patience: Optional[int] = None,
 ):
-  time, flux = get_lightcurve(tce['Astro ID'])
   if mode == 'vetting':
-    apertures = {
-      's': get_lightcurve(tce['Astro ID'], aperture='s'),
-      'm': get_lightcurve(tce['Astro ID'], aperture='m'),
-      'l': get_lightcurve(tce['Astro ID'], aperture='l'),
-    }
+    apertures = preprocess.read_apertures(get_lightcurve, tce['Astro ID'], [None, 's', 'm', 'l'])
+  else:
+    apertures = {None: get_lightcurve(tce['Astro ID'])}
+  time, flux = apertures.pop(None)
+  if star_ephemerides is not None:
+    ephemerides = star_ephemerides[(tce['TIC ID'], tce['File'])]
   else:
-    apertures = {}
+    ephemerides = None
 
   ex = tf.train.Example()
 
   for bkspace in [0.3, 5.0, None]:
-    fold_num = _standard_views(ex, tce['TIC ID'], time, flux, tce.Per, tce.Epoc, tce.Dur, bkspace, apertures)
+    fold_num = _standard_views(
+        ex, tce['TIC ID'], time, flux, tce['Per'], tce['Epoc'], tce['Dur'], bkspace, apertures,
+        detrend_cache, ephemerides, warm_start, spline_executor, bkspace_patience)
 
   _set_int64_feature(ex, 'astro_id', [tce['Astro ID']])
 
@@ -218,39 +334,39 @@ def _process_tce(
     else:
       raise ValueError(f'Mode "{mode}" not supported.')
 
-  assert not np.isnan(tce.Per)
-  _set_float_feature(ex, 'Period', [tce.Per])
+  assert not np.isnan(tce['Per'])
+  _set_float_feature(ex, 'Period', [tce['Per']])
 
-  assert not np.isnan(tce.Dur)
-  _set_float_feature(ex, 'Duration', [tce.Dur])
+  assert not np.isnan(tce['Dur'])
+  _set_float_feature(ex, 'Duration', [tce['Dur']])
 
-  assert not np.isnan(tce.Depth)
-  _set_float_feature(ex, 'Transit_Depth', [tce.Depth])
+  assert not np.isnan(tce['Depth'])
+  _set_float_feature(ex, 'Transit_Depth', [tce['Depth']])
 
-  assert not np.isnan(tce.Tmag)
-  _set_float_feature(ex, 'Tmag', [tce.Tmag])
+  assert not np.isnan(tce['Tmag'])
+  _set_float_feature(ex, 'Tmag', [tce['Tmag']])
 
   # _set_float_feature(ex, 'centroid_dist', [tce.centroid_dist])
 
-  if np.isnan(tce.SMass):
+  if np.isnan(tce['SMass']):
     _set_float_feature(ex, 'star_mass', [0])
     _set_float_feature(ex, 'star_mass_present', [0])
   else:
-    _set_float_feature(ex, 'star_mass', [tce.SMass])
+    _set_float_feature(ex, 'star_mass', [tce['SMass']])
     _set_float_feature(ex, 'star_mass_present', [1])
 
-  if np.isnan(tce.SRad):
+  if np.isnan(tce['SRad']):
     _set_float_feature(ex, 'star_rad', [0])
     _set_float_feature(ex, 'star_rad_present', [0])
   else:
-    _set_float_feature(ex, 'star_rad', [tce.SRad])
+    _set_float_feature(ex, 'star_rad', [tce['SRad']])
     _set_float_feature(ex, 'star_rad_present', [1])
 
-  if np.isnan(tce.SRadEst):
+  if np.isnan(tce['SRadEst']):
     _set_float_feature(ex, 'star_rad_est', [0])
     _set_float_feature(ex, 'star_rad_est_present', [0])
   else:
-    _set_float_feature(ex, 'star_rad_est', [tce.SRadEst])
+    _set_float_feature(ex, 'star_rad_est', [tce['SRadEst']])
     _set_float_feature(ex, 'star_rad_est_present', [1])
 
   _set_float_feature(ex, 'n_folds', [len(set(fold_num))])
@@ -259,17 +375,8 @@ def _process_tce(
   return ex
 
 
-def _process_file_shard(
-  tce_table: pd.DataFrame,
-  file_name: str,
-  get_lightcurve: LCGetter,
-  mode: AstronetMode,
-  training: bool,
-):
-  process_name = multiprocessing.current_process().name
-  shard_name = os.path.basename(file_name)
-  shard_size = len(tce_table)
-    
+def _read_existing(file_name):
+  """Returns the serialized examples of a shard file by Astro ID, if it exists."""
   existing = {}
   try:
     tfr = tf.data.TFRecordDataset(file_name)
@@ -279,45 +386,191 @@ def _process_file_shard(
       existing[ex.features.feature['astro_id'].int64_list.value[0]] = ex_str
   except:
     pass
+  return existing
+
+
+class _ShardWriter(object):
+  """Writes the examples of a shard file in TCE order as they are completed.
+
+  Examples which are already in the file are kept, so that an interrupted run
+  can be resumed. Examples completed out of order are held until the ones
+  before them have been written, so the file is the same as a serial run's.
+
+  The shard is rewritten to a temporary file, opened when its first new
+  example arrives, which only replaces the shard once all of its examples
+  have been written. A failed run leaves the shard unchanged, and shards
+  without missing TCEs are never rewritten.
+  """
+
+  def __init__(self, file_name: str, astro_ids: Sequence[int], existing: dict):
+    """Initializes the writer.
+
+    Args:
+      file_name: Name of the shard file.
+      astro_ids: Astro IDs of the TCEs of the shard, in order.
+      existing: Dict of the serialized examples already in the shard file by
+        Astro ID, see _read_existing(). Only those of a shard with missing
+        TCEs are kept until the shard is rewritten.
+    """
+    self.file_name = file_name
+    self.size = len(astro_ids)
+    self._missing = [i for i, astro_id in enumerate(astro_ids) if astro_id not in existing]
+    self.num_existing = self.size - len(self._missing)
+    self._pending = None
+    if self._missing:
+      self._pending = {
+          i: existing[astro_id] for i, astro_id in enumerate(astro_ids) if astro_id in existing
+      }
+    self._next = 0
+    self._writer = None
+    if self.size == 0 and not tf.io.gfile.exists(file_name):
+      tf.io.TFRecordWriter(file_name).close()
+
+  def missing(self) -> list[int]:
+    """Returns the indices of the TCEs which have to be processed."""
+    return list(self._missing)
+
+  def add(self, index: int, ex_str: bytes):
+    if self._writer is None:
+      self._writer = tf.io.TFRecordWriter(self.file_name + ".tmp")
+    self._pending[index] = ex_str
+    self._flush()
+
+  def _flush(self):
+    while self._next in self._pending:
+      self._writer.write(self._pending.pop(self._next))
+      self._next += 1
+    if self._next == self.size:
+      self._writer.close()
+      self._writer = None
+      tf.io.gfile.rename(self.file_name + ".tmp", self.file_name, overwrite=True)
+      logging.info("%s: %d TCEs, %d new", os.path.basename(self.file_name), self.size,
+                   self.size - self.num_existing)
+
+  def close(self):
+    """Discards the temporary file of a shard which was not completed."""
+    if self._writer is not None:
+      self._writer.close()
+      self._writer = None
+      self._pending = None
+      tf.io.gfile.remove(self.file_name + ".tmp")
+
+
+# The arguments of _process_tce which are the same for all TCEs. They are set
+# once per worker process by _init_worker rather than pickled with every task.
+_worker_args = None
+
+
+def _init_worker(*args):
+  global _worker_args
+  _worker_args = args
+
+
+def _process_tce_task(task):
+  """Processes a (shard, index, tce) task; returns (shard, index, serialized example)."""
+  shard, index, tce = task
+  ex = _process_tce(tce, *_worker_args)
+  return shard, index, ex.SerializeToString()
+
+
+def _write_results(writers, results, num_tasks):
+  try:
+    for num_done, (shard, index, ex_str) in enumerate(results, 1):
+      writers[shard].add(index, ex_str)
+      if num_done % 100 == 0 or num_done == num_tasks:
+        logging.info("Processed %d/%d TCEs", num_done, num_tasks)
+  finally:
+    for writer in writers:
+      writer.close()
+
+
+def _process_shards(
+    tces: Sequence[dict],
+    shards: Sequence[tuple[int, int, str]],
+    get_lightcurve: LCGetter,
+    mode: AstronetMode,
+    training: bool,
+    detrend_cache: Optional[detrend_cache_lib.DetrendCache] = None,
+    star_ephemerides: Optional[dict] = None,
+    warm_start: bool = False,
+    num_processes: int = 1,
+    chunk_size: int = 4,
+    manifest_dir: Optional[str] = None,
+    bkspace_patience: Optional[int] = None,
+    spline_workers: int = 0,
+):
+  """Processes TCEs on a pool of processes and writes them to shard files.
+
+  TCEs are scheduled individually rather than by shard, so a few expensive TCEs
+  do not leave the other workers idle, and the main process writes each
+  finished example to its shard.
+
+  Args:
+    tces: Sequence of TCE records.
+    shards: List of (start, end, file_name); tces[start:end] are written to
+      file_name.
+    get_lightcurve: LCGetter of the TCEs.
+    mode: AstronetMode.
+    training: Whether to write the labels of the TCEs.
+    detrend_cache: Optional cache of detrended light curves. Each worker gets
+      a copy, so in-memory caches are per process.
+    star_ephemerides: Optional dict of the ephemerides of each star, for
+      star-level detrending. The TCEs of each shard are then processed grouped
+      by star, so that they share the star's detrending. Which TCEs are in
+      which shard does not change.
+    warm_start: Whether to fit detrending splines with banded_spline.
+    num_processes: Number of worker processes; 1 processes the TCEs serially
+      in this process.
+    chunk_size: Number of consecutive TCEs sent to a worker at a time. The TCEs
+      of a star in one chunk share the star's detrending through an in-memory
+      cache.
+    manifest_dir: Optional directory of shard manifests. If given, new examples
+      are appended to new part files of the shards (see shard_manifest)
+      instead of rewriting them.
+    bkspace_patience: Optional patience of the search for the break-point
+      spacing of detrending splines; see keplersplinev2.choose_kepler_spline.
+    spline_workers: Number of processes fitting the break-point spacings of
+      each TCE concurrently, or 0 to fit them serially. Requires
+      num_processes=1, since pool workers cannot start processes.
+
+  Raises:
+    ValueError: If spline_workers is used with several worker processes.
+  """
+  if spline_workers and num_processes != 1:
+    raise ValueError("spline_workers requires num_processes=1.")
+  writers = []
+  for start, end, file_name in shards:
+    astro_ids = [int(tce['Astro ID']) for tce in tces[start:end]]
+    if manifest_dir:
+      writers.append(shard_manifest.AppendingShardWriter(file_name, astro_ids, manifest_dir))
+    elif shard_manifest.part_files(file_name):
+      raise ValueError(f"{file_name} has part files; pass its manifest_dir or compact it first.")
+    else:
+      writers.append(_ShardWriter(file_name, astro_ids, _read_existing(file_name)))
+  tasks = []
+  for shard, (start, _, _) in enumerate(shards):
+    missing = writers[shard].missing()
+    if star_ephemerides is not None:
+      missing.sort(key=lambda i: (tces[start + i]['TIC ID'], tces[start + i]['File']))
+    tasks.extend((shard, i, tces[start + i]) for i in missing)
+  logging.info("Processing %d new TCEs", len(tasks))
+
+  worker_args = (get_lightcurve, mode, training, detrend_cache, star_ephemerides, warm_start)
+  if num_processes == 1:
+    spline_executor = futures.ProcessPoolExecutor(spline_workers) if spline_workers else None
+    try:
+      _init_worker(*worker_args, spline_executor, bkspace_patience)
+      _write_results(writers, map(_process_tce_task, tasks), len(tasks))
+    finally:
+      if spline_executor is not None:
+        spline_executor.shutdown()
+  else:
+    worker_args += (None, bkspace_patience)
+    with multiprocessing.Pool(num_processes, _init_worker, worker_args) as pool:
+      _write_results(
+          writers, pool.imap_unordered(_process_tce_task, tasks, chunksize=chunk_size),
+          len(tasks))
 
-  with tf.io.TFRecordWriter(file_name) as writer:
-    num_processed = 0
-    num_skipped = 0
-    num_existing = 0
-    print("", end='')
-    for _, tce in tce_table.iterrows():
-      num_processed += 1
-      recid = int(tce['Astro ID'])
-      print("\r                                      ", end="")
-      print(f"\r[{num_processed}/{shard_size}] {recid}", end="")
-
-      if recid in existing:
-        print(" exists", end="")
-        sys.stdout.flush()
-        writer.write(existing[recid])
-        num_existing += 1
-        continue
-
-      examples = []
-      try:
-        print(" processing", end="")
-        sys.stdout.flush()
-        ex = _process_tce(tce, get_lightcurve, mode, training)
-        examples.append(ex)
-      except Exception as e:
-        raise
-        print(f" *** error: {e}")
-        num_skipped += 1
-        continue
-
-      print(" writing                   ", end="")
-      sys.stdout.flush()
-      for example in examples:
-        writer.write(example.SerializeToString())
-        
-
-  num_new = num_processed - num_skipped - num_existing
-  print(f"\r{shard_name}: {num_processed}/{shard_size} {num_new} new {num_skipped} bad            ")
 
 def create(
     tce_table: pd.DataFrame,
@@ -327,12 +580,23 @@ def create(
     mode: AstronetMode,
     training: bool,
     get_lightcurve: LCGetter,
+    detrend_cache: Optional[detrend_cache_lib.DetrendCache] = None,
+    star_ephemerides: Optional[dict] = None,
+    warm_start: bool = False,
+    chunk_size: int = 4,
+    manifest_dir: Optional[str] = None,
+    compact: bool = False,
+    bkspace_patience: Optional[int] = None,
+    spline_workers: int = 0,
 ):
     tf.io.gfile.makedirs(output_dir)
     logging.info(f"Processing {len(tce_table)} TCEs")
 
-    tce_shards: tuple[pd.DataFrame, str] = []  # List of (tce_table_shard, file_name)
-    boundaries = np.linspace(0, len(tce_table), num_shards + 1).astype(np.int)
+    # Workers get TCEs as plain dicts, which are cheaper to pickle and index
+    # than pandas rows.
+    tces = tce_table.to_dict("records")
+    tce_shards: tuple[int, int, str] = []  # List of (start, end, file_name)
+    boundaries = np.linspace(0, len(tce_table), num_shards + 1).astype(int)
     for i in range(num_shards):
         start, end = boundaries[i : i + 2]
         tce_shards.append(
@@ -340,69 +604,64 @@ def create(
         )
     logging.info(f"Processing {len(tce_table)} TCEs in {len(tce_shards)} shards.")
 
-    if num_processes == 1:
-        for start, end, file in tce_shards:
-            _process_file_shard(
-                tce_table[start:end],
-                file,
-                get_lightcurve,
-                mode,
-                training
-            )
-    else:
-        with multiprocessing.Pool(num_processes) as pool:
-            pool.starmap(
-                _process_file_shard,
-                [
-                    (
-                        tce_table[start:end],
-                        file,
-                        get_lightcurve,
-                        mode,
-                        training,
-                    )
-                    for start, end, file in tce_shards
-                ],
-            )
+    _process_shards(
+        tces,
+        tce_shards,
+        get_lightcurve,
+        mode,
+        training,
+        detrend_cache,
+        star_ephemerides,
+        warm_start,
+        num_processes,
+        chunk_size,
+        manifest_dir,
+        bkspace_patience,
+        spline_workers,
+    )
+    if compact:
+        for _, _, file in tce_shards:
+            shard_manifest.compact(file, manifest_dir)
     logging.info("Finished processing")
 
 
 def main(_):
+    if FLAGS.compact and not FLAGS.manifest_dir:
+        raise ValueError("--compact requires --manifest_dir.")
+    if FLAGS.spline_workers and FLAGS.num_processes != 1:
+        raise ValueError("--spline_workers requires --num_processes=1.")
     tf.io.gfile.makedirs(FLAGS.output_dir)
 
     tce_table = pd.read_csv(FLAGS.input_tce_csv_file, header=0, low_memory=False)
 
-    def get_lightcurve(astro_id: int, aperture: Optional[str] = None) -> tuple[np.ndarray, np.ndarray]:
-        aperture_key_map = {
-            "s": "SAP_FLUX_SML",
-            "m": "SAP_FLUX_MID",
-            "l": "SAP_FLUX_LAG",
-            None: "SAP_FLUX",
-        }
-        matching_tces = tce_table[tce_table["Astro ID"] == astro_id] # tce_table.where(tce_table["Astro ID"] == astro_id)
-        try:
-            _, tce = next(matching_tces.iterrows())
-        except StopIteration as e:
-            raise ValueError(f"Astro ID not found: {astro_id}") from e
-        if "MinT" not in tce:
-            tce["MinT"] = -np.inf
-        if "MaxT" not in tce:
-            tce["MaxT"] = np.inf
-        return preprocess.read_and_process_light_curve(
-           FLAGS.tess_data_dir,
-           aperture_key_map[aperture],
-           tce.File,
-           tce.MinT,
-           tce.MaxT,
-        )
+    light_curve_store = None
+    if FLAGS.light_curve_store:
+        light_curve_store = light_curve_store_lib.LightCurveStore(FLAGS.light_curve_store)
+
+    get_lightcurve = preprocess.LightCurveGetter(
+        FLAGS.tess_data_dir, tce_table, store=light_curve_store)
 
     num_tces = len(tce_table)
     logging.info("Read %d TCEs", num_tces)
 
+    detrend_cache = None
+    if FLAGS.detrend_cache_dir:
+        detrend_cache = detrend_cache_lib.DetrendCache(
+            FLAGS.detrend_cache_dir, max_bytes=int(FLAGS.detrend_cache_gb * 2**30))
+
+    star_ephemerides = None
+    if FLAGS.star_level_detrending:
+        star_ephemerides = preprocess.star_ephemerides(tce_table)
+        if detrend_cache is None:
+            # One entry per light curve, aperture and bkspace of the last few stars.
+            detrend_cache = detrend_cache_lib.MemoryDetrendCache(max_entries=48)
+
+    tces = tce_table.to_dict("records")
+
     # Further split training TCEs into file shards.
-    file_shards = []  # List of (tce_table_shard, file_name).
+    file_shards = []  # List of (start, end, file_name).
     boundaries = np.linspace(
-        0, len(tce_table), FLAGS.num_shards + 1).astype(np.int)
+        0, len(tce_table), FLAGS.num_shards + 1).astype(int)
     for i in range(FLAGS.num_shards):
       start = boundaries[i]
       end = boundaries[i + 1]
@@ -413,8 +672,13 @@ def main(_):
       ))
 
     logging.info("Processing %d total file shards", len(file_shards))
-    for start, end, file_shard in file_shards:
-        _process_file_shard(tce_table[start:end], file_shard, get_lightcurve, FLAGS.mode, not FLAGS.not_training)
+    _process_shards(
+        tces, file_shards, get_lightcurve, FLAGS.mode, not FLAGS.not_training, detrend_cache,
+        star_ephemerides, FLAGS.warm_start_splines, FLAGS.num_processes, FLAGS.chunk_size,
+        FLAGS.manifest_dir, FLAGS.bkspace_patience, FLAGS.spline_workers)
+    if FLAGS.compact:
+        for _, _, file_shard in file_shards:
+            shard_manifest.compact(file_shard, FLAGS.manifest_dir)
     logging.info("Finished processing %d total file shards", len(file_shards))
 
 
@@ -0,0 +1,185 @@
+"""Tests for generate_input_records.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent import futures
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from absl.testing import absltest
+import numpy as np
+import tensorflow as tf
+
+from astronet.preprocess import generate_input_records
+from astronet.preprocess import shard_manifest
+
+
+def _fake_process_tce(tce, get_lightcurve, mode, training, *args):
+  # Later TCEs finish first, so that results arrive out of order.
+  time.sleep(0.01 * (tce['Astro ID'] % 3))
+  ex = tf.train.Example()
+  generate_input_records._set_int64_feature(ex, 'astro_id', [tce['Astro ID']])
+  generate_input_records._set_bytes_feature(ex, 'mode', [mode])
+  return ex
+
+
+def _read_shard(file_name):
+  examples = [tf.train.Example.FromString(r.numpy()) for r in tf.data.TFRecordDataset(file_name)]
+  return [(ex.features.feature['astro_id'].int64_list.value[0],
+           ex.features.feature['mode'].bytes_list.value[0].decode()) for ex in examples]
+
+
+class SetFloatFeatureTest(absltest.TestCase):
+
+  def testMatchesFloatListValues(self):
+    rng = np.random.RandomState(0)
+    for value in [rng.randn(201, 14), rng.randn(201).astype(np.float32), [2.5], [0], [],
+                  np.array([1e39, -1e-40, 300])]:
+      ex = tf.train.Example()
+      with np.errstate(over='ignore'):
+        generate_input_records._set_float_feature(ex, 'x', value)
+      expected = tf.train.Example()
+      expected.features.feature['x'].float_list.value.extend(
+          [float(v) for v in np.reshape(value, (-1,))])
+      self.assertEqual(ex.SerializeToString(), expected.SerializeToString())
+
+  def testNaN(self):
+    with self.assertRaisesRegex(ValueError, 'NaNs in x'):
+      generate_input_records._set_float_feature(tf.train.Example(), 'x', [1.0, np.nan])
+
+
+class ProcessShardsTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ProcessShardsTest, self).setUp()
+    self.tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tempdir)
+    self.tces = [{'Astro ID': astro_id} for astro_id in range(100, 130)]
+    output_dir = os.path.join(self.tempdir, 'records')
+    os.makedirs(output_dir)
+    self.shards = [(0, 12, os.path.join(output_dir, 'a')),
+                   (12, 12, os.path.join(output_dir, 'b')),
+                   (12, 30, os.path.join(output_dir, 'c'))]
+
+  @mock.patch.object(generate_input_records, '_process_tce', _fake_process_tce)
+  def testParallelMatchesTceOrder(self):
+    generate_input_records._process_shards(
+        self.tces, self.shards, None, 'vetting', True, num_processes=3, chunk_size=2)
+    for start, end, file_name in self.shards:
+      self.assertEqual(_read_shard(file_name),
+                       [(tce['Astro ID'], 'vetting') for tce in self.tces[start:end]])
+
+  def testSplineSettings(self):
+    spline_args = []
+
+    def record_args(tce, *args):
+      spline_args.append(args[-2:])
+      return _fake_process_tce(tce, *args)
+
+    with mock.patch.object(generate_input_records, '_process_tce', record_args):
+      generate_input_records._process_shards(
+          self.tces, self.shards, None, 'vetting', True, bkspace_patience=2, spline_workers=2)
+    self.assertLen(spline_args, len(self.tces))
+    for executor, patience in spline_args:
+      self.assertIsInstance(executor, futures.ProcessPoolExecutor)
+      self.assertEqual(patience, 2)
+
+    with self.assertRaisesRegex(ValueError, 'spline_workers requires num_processes=1'):
+      generate_input_records._process_shards(
+          self.tces, self.shards, None, 'vetting', True, num_processes=2, spline_workers=2)
+
+  def testStarLevelKeepsShards(self):
+    for tce in self.tces:
+      tce.update({'TIC ID': tce['Astro ID'] % 4, 'File': 'f'})
+    processed = []
+
+    def record_order(tce, *args):
+      processed.append(tce['Astro ID'])
+      return _fake_process_tce(tce, *args)
+
+    with mock.patch.object(generate_input_records, '_process_tce', record_order):
+      generate_input_records._process_shards(
+          self.tces, self.shards, None, 'vetting', True, star_ephemerides={})
+    for start, end, file_name in self.shards:
+      self.assertEqual(_read_shard(file_name),
+                       [(tce['Astro ID'], 'vetting') for tce in self.tces[start:end]])
+    # The TCEs of each shard are processed grouped by star.
+    self.assertEqual(processed, sorted(range(100, 112), key=lambda a: a % 4) +
+                     sorted(range(112, 130), key=lambda a: a % 4))
+
+  @mock.patch.object(generate_input_records, '_process_tce', _fake_process_tce)
+  def testResume(self):
+    generate_input_records._process_shards(self.tces[:5], [self.shards[0]], None, 'old', True)
+    with mock.patch.object(generate_input_records, '_read_existing',
+                           wraps=generate_input_records._read_existing) as read_existing:
+      generate_input_records._process_shards(self.tces, self.shards, None, 'new', True)
+    # Each shard file is read once.
+    self.assertCountEqual([c.args for c in read_existing.call_args_list],
+                          [(file_name,) for _, _, file_name in self.shards])
+    self.assertEqual(_read_shard(self.shards[0][2]),
+                     [(astro_id, 'old') for astro_id in range(100, 105)] +
+                     [(astro_id, 'new') for astro_id in range(105, 112)])
+    self.assertEmpty(_read_shard(self.shards[1][2]))
+
+  def testFailureLeavesShardsUnchanged(self):
+    shards = [(0, 10, self.shards[0][2]), (10, 20, self.shards[2][2])]
+    with mock.patch.object(generate_input_records, '_process_tce', _fake_process_tce):
+      for start, end, file_name in shards:
+        tces = self.tces[start:end]
+        generate_input_records._process_shards(
+            tces[:4] + tces[5:], [(0, 9, file_name)], None, 'old', True)
+    contents = {}
+    for _, _, file_name in shards:
+      with open(file_name, 'rb') as f:
+        contents[file_name] = f.read()
+
+    def fail_on_one_tce(tce, *args):
+      if tce['Astro ID'] == 104:
+        raise RuntimeError('Failed TCE')
+      return _fake_process_tce(tce, *args)
+
+    with mock.patch.object(generate_input_records, '_process_tce', fail_on_one_tce):
+      for num_processes in [1, 2]:
+        with self.assertRaisesRegex(RuntimeError, 'Failed TCE'):
+          generate_input_records._process_shards(
+              self.tces[:20], shards, None, 'new', True, num_processes=num_processes)
+        first, second = [file_name for _, _, file_name in shards]
+        with open(first, 'rb') as f:
+          self.assertEqual(f.read(), contents[first])
+        if num_processes == 1:
+          with open(second, 'rb') as f:
+            self.assertEqual(f.read(), contents[second])
+        else:
+          # The second shard may have been completed before the failure.
+          self.assertContainsSubset(
+              [(astro_id, 'old') for astro_id in range(110, 120) if astro_id != 114],
+              _read_shard(second))
+        for file_name in [first, second]:
+          self.assertFalse(os.path.exists(file_name + '.tmp'))
+
+  @mock.patch.object(generate_input_records, '_process_tce', _fake_process_tce)
+  def testManifestResume(self):
+    manifest_dir = os.path.join(self.tempdir, 'manifests')
+    generate_input_records._process_shards(self.tces[:5], [self.shards[0]], None, 'old', True)
+    generate_input_records._process_shards(
+        self.tces, self.shards, None, 'new', True, num_processes=2, manifest_dir=manifest_dir)
+    self.assertLen(shard_manifest.part_files(self.shards[0][2]), 1)
+    with self.assertRaisesRegex(ValueError, 'has part files'):
+      generate_input_records._process_shards(self.tces, self.shards, None, 'new', True)
+
+    for _, _, file_name in self.shards:
+      shard_manifest.compact(file_name, manifest_dir)
+    self.assertEqual(_read_shard(self.shards[0][2]),
+                     [(astro_id, 'old') for astro_id in range(100, 105)] +
+                     [(astro_id, 'new') for astro_id in range(105, 112)])
+    self.assertCountEqual(_read_shard(self.shards[2][2]),
+                          [(astro_id, 'new') for astro_id in range(112, 130)])
+
+
+if __name__ == '__main__':
+  absltest.main()
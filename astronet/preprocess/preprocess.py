@@ -28,16 +28,105 @@ from light_curve_util import tess_io
 from statsmodels.robust import scale
 
 
-def read_and_process_light_curve(tess_data_dir, flux_key, filename, min_t, max_t):
-  filename = os.path.join(tess_data_dir, filename) 
-  all_time, all_mag = tess_io.read_tess_light_curve(filename, flux_key)
-    
-  mask = np.logical_and(all_time >= min_t, all_time <= max_t)
-  all_time = all_time[mask]
-  all_mag = all_mag[mask]
+# Flux column of each aperture; None is the default (optimal) aperture.
+APERTURE_FLUX_KEYS = {
+    None: "SAP_FLUX",
+    "s": "SAP_FLUX_SML",
+    "m": "SAP_FLUX_MID",
+    "l": "SAP_FLUX_LAG",
+}
+
+
+def read_and_process_light_curve(tess_data_dir, flux_key, filename, min_t, max_t, store=None):
+  return read_and_process_light_curves(
+      tess_data_dir, [flux_key], filename, min_t, max_t, store=store)[flux_key]
+
+
+def read_and_process_light_curves(tess_data_dir, flux_keys, filename, min_t, max_t, store=None):
+  """Reads several flux columns of a light curve, opening the file once.
+
+  Args:
+    tess_data_dir: Directory containing the light curve files.
+    flux_keys: Keys of the flux columns to read.
+    filename: Name of the light curve file, relative to tess_data_dir.
+    min_t: Minimum time value to keep.
+    max_t: Maximum time value to keep.
+    store: Optional light_curve_store.LightCurveStore of the files in
+      tess_data_dir, to read from instead of the FITS file.
+
+  Returns:
+    Dict mapping each of flux_keys to (time, flux).
+  """
+  if store is not None:
+    light_curves = store.read_tess_light_curves(filename, flux_keys)
+  else:
+    filename = os.path.join(tess_data_dir, filename) 
+    light_curves = tess_io.read_tess_light_curves(filename, flux_keys)
+
+  processed = {}
+  for flux_key, (all_time, all_mag) in light_curves.items():
+    mask = np.logical_and(all_time >= min_t, all_time <= max_t)
+    all_time = all_time[mask]
+    all_mag = all_mag[mask]
+
+    assert len(all_time)
+    processed[flux_key] = all_time, all_mag
+  return processed
+
 
-  assert len(all_time)
-  return all_time, all_mag
+class LightCurveGetter(object):
+  """Reads the light curves of the TCEs of a table from tess_data_dir.
+
+  Implements the LCGetter protocol of generate_input_records and
+  direct_tensor.predict, and reads all apertures of a TCE with one open of its
+  file through read_apertures().
+  """
+
+  def __init__(self, tess_data_dir, tce_table, store=None):
+    self.tess_data_dir = tess_data_dir
+    self.store = store
+    # The file and time range of each Astro ID, looked up in O(1) rather than
+    # by scanning the table. The first TCE with an Astro ID is used.
+    min_t = tce_table["MinT"] if "MinT" in tce_table else np.full(len(tce_table), -np.inf)
+    max_t = tce_table["MaxT"] if "MaxT" in tce_table else np.full(len(tce_table), np.inf)
+    self._files = {}
+    for astro_id, record in zip(
+        tce_table["Astro ID"].tolist(), zip(tce_table["File"], min_t, max_t)):
+      self._files.setdefault(astro_id, record)
+
+  def __call__(self, astro_id, aperture=None):
+    return self.read_apertures(astro_id, [aperture])[aperture]
+
+  def read_apertures(self, astro_id, apertures):
+    """Returns a dict mapping each of apertures to the (time, flux) of a TCE."""
+    try:
+      filename, min_t, max_t = self._files[astro_id]
+    except KeyError as e:
+      raise ValueError(f"Astro ID not found: {astro_id}") from e
+    light_curves = read_and_process_light_curves(
+        self.tess_data_dir,
+        [APERTURE_FLUX_KEYS[aperture] for aperture in apertures],
+        filename,
+        min_t,
+        max_t,
+        store=self.store,
+    )
+    return {aperture: light_curves[APERTURE_FLUX_KEYS[aperture]] for aperture in apertures}
+
+
+def read_apertures(get_lc, astro_id, apertures):
+  """Reads several apertures of a TCE from an LCGetter.
+
+  Uses get_lc.read_apertures() if it has one, so that getters which can read
+  all apertures at once (like LightCurveGetter) do so, and calls get_lc once per
+  aperture otherwise.
+
+  Returns:
+    Dict mapping each of apertures to (time, flux).
+  """
+  if hasattr(get_lc, "read_apertures"):
+    return get_lc.read_apertures(astro_id, apertures)
+  return {aperture: get_lc(astro_id, aperture) for aperture in apertures}
 
 
 def get_spline_mask(time, period, t0, tdur):
@@ -51,31 +140,201 @@ def filter_outliers(time, flux, mask):
   return time[valid], flux[valid], mask[valid]
 
 
-def detrend_and_filter(tic_id, time, flux, period, epoch, duration, fixed_bkspace):
+def get_joint_spline_mask(time, ephemerides):
+  """Masks the transits of several (period, t0, tdur) ephemerides jointly."""
+  outtran = np.ones_like(time, dtype=bool)
+  for period, t0, tdur in ephemerides:
+    outtran &= get_spline_mask(time, period, t0, tdur)
+  return outtran
+
+
+def star_ephemerides(tce_table):
+  """Groups the (Per, Epoc, Dur) ephemerides of a TCE table by (TIC ID, File)."""
+  groups = tce_table.groupby(['TIC ID', 'File'], sort=False)
+  return {
+      star: sorted(zip(tces.Per, tces.Epoc, tces.Dur)) for star, tces in groups
+  }
+
+
+def detrend_star(time, flux, ephemerides, fixed_bkspace, executor=None, patience=None,
+                 cache=None, warm_start=False):
+  """Detrends a light curve with the transits of all its TCEs masked.
+
+  The result only depends on the light curve and the star's ephemerides, so
+  with a cache it is computed once and shared by every TCE of the star.
+
+  Args:
+    time: 1D numpy array of time values.
+    flux: 1D numpy array of flux values.
+    ephemerides: List of (period, epoch, duration) of the star's TCEs.
+    fixed_bkspace: Spline break-point spacing, or None to choose one by BIC.
+    executor: Optional executor passed to choosekeplersplinev2.
+    patience: Optional patience passed to choosekeplersplinev2.
+    cache: Optional DetrendCache or MemoryDetrendCache.
+    warm_start: Whether to fit the splines with banded_spline.BandedSpline.
+
+  Returns:
+    1D numpy array of detrended flux values.
+  """
+  if cache is not None:
+    params = [p for ephemeris in sorted(ephemerides) for p in ephemeris]
+    key = cache.key(time, flux, 'star', fixed_bkspace, patience, warm_start, *params)
+    result = cache.get(key)
+    if result is not None:
+      return result[1]
+
+  input_mask = get_joint_spline_mask(time, ephemerides)
+  spline_flux = keplersplinev2.choosekeplersplinev2(
+      time, flux, input_mask=input_mask, fixed_bkspace=fixed_bkspace, executor=executor,
+      patience=patience, warm_start=warm_start)
+  detrended_flux = flux / spline_flux
+
+  if cache is not None:
+    cache.put(key, time, detrended_flux, input_mask)
+  return detrended_flux
+
+
+def detrend_and_filter(tic_id, time, flux, period, epoch, duration, fixed_bkspace,
+                       executor=None, patience=None, cache=None, ephemerides=None,
+                       warm_start=False):
+  if ephemerides is not None:
+    # Star-level detrending: the spline masks the transits of every TCE of the
+    # star, and only the transit mask is specific to this TCE.
+    detrended_flux = detrend_star(
+        time, flux, ephemerides, fixed_bkspace, executor=executor, patience=patience,
+        cache=cache, warm_start=warm_start)
+    return filter_outliers(time, detrended_flux, get_spline_mask(time, period, epoch, duration))
+
+  if cache is not None:
+    key = cache.key(time, flux, period, epoch, duration, fixed_bkspace, patience, warm_start)
+    result = cache.get(key)
+    if result is not None:
+      return result
+
   input_mask = get_spline_mask(time, period, epoch, duration)
   spline_flux, metadata = keplersplinev2.choosekeplersplinev2(
-      time, flux, input_mask=input_mask, fixed_bkspace=fixed_bkspace, return_metadata=True)
+      time, flux, input_mask=input_mask, fixed_bkspace=fixed_bkspace, return_metadata=True,
+      executor=executor, patience=patience, warm_start=warm_start)
   detrended_flux = flux / spline_flux
-  return filter_outliers(time, detrended_flux, input_mask)
+  result = filter_outliers(time, detrended_flux, input_mask)
 
+  if cache is not None:
+    cache.put(key, *result)
+  return result
 
-def phase_fold_and_sort_light_curve(time, flux, mask, period, t0):
-  if not len(time):
-    return np.array([]), np.array([]), np.array([]), np.array([])
 
+def _phase_fold_and_sort(time, period, t0):
   # Phase fold time.
   time, fold_num = util.phase_fold_time(time, period, t0)
 
   # Sort by ascending time.
   sorted_i = np.argsort(time)
-  time = time[sorted_i]
+  return time[sorted_i], fold_num[sorted_i], sorted_i
+
+
+def phase_fold_and_sort_light_curve(time, flux, mask, period, t0):
+  if not len(time):
+    return np.array([]), np.array([]), np.array([]), np.array([])
+
+  time, fold_num, sorted_i = _phase_fold_and_sort(time, period, t0)
   flux = flux[sorted_i]
   mask = mask[sorted_i]
-  fold_num = fold_num[sorted_i]
 
   return time, flux, fold_num, mask
 
 
+class FoldedLightCurve(object):
+  """A phase folded and sorted light curve that caches its binning indices.
+
+  Every view of the same folded light curve over the same (num_bins, t_min,
+  t_max) window assigns points to bins identically, so the bin membership is
+  computed once and reused, e.g. by the flux and transit mask global views.
+
+  Attributes:
+    time: 1D array of phase folded time values, sorted in ascending order.
+    flux: 1D array of flux values.
+    fold_num: 1D array of the fold number of each point.
+    mask: 1D array of the transit mask of each point.
+    half_cadence: 1D array of the half exposure time of each point, from its
+      unfolded time.
+    period: The period the light curve was folded over.
+  """
+
+  def __init__(self, time, flux, mask, period, t0):
+    if len(time):
+      self.time, self.fold_num, sorted_i = _phase_fold_and_sort(time, period, t0)
+      self.flux = flux[sorted_i]
+      self.mask = mask[sorted_i]
+      self.half_cadence = median_filter2.half_cadence(time)[sorted_i]
+    else:
+      self.time, self.flux, self.fold_num, self.mask = (
+          np.array([]), np.array([]), np.array([]), np.array([]))
+      self.half_cadence = np.array([])
+    self.period = period
+    self._parent = None
+    self._keep = None
+    self._bin_indices = {}
+    self._secondaries = {}
+
+  def _rearranged(self, index):
+    """Returns a light curve of the points at index, in that order."""
+    lc = FoldedLightCurve.__new__(FoldedLightCurve)
+    lc.time = self.time[index]
+    lc.flux = self.flux[index]
+    lc.fold_num = self.fold_num[index]
+    lc.mask = self.mask[index]
+    lc.half_cadence = self.half_cadence[index]
+    lc.period = self.period
+    lc._parent = None
+    lc._keep = None
+    lc._bin_indices = {}
+    lc._secondaries = {}
+    return lc
+
+  def select(self, keep):
+    """Returns the light curve restricted to the points where keep is True.
+
+    Bin indices of the selection are derived from those of this light curve
+    when it has already computed them.
+    """
+    subset = self._rearranged(keep)
+    subset._parent = self
+    subset._keep = keep
+    return subset
+
+  def secondary(self, duration):
+    """Returns the (cached) result of find_secondary for this light curve.
+
+    Args:
+      duration: The duration of the event (in days).
+
+    Returns:
+      t0: Time of centre of most likely secondary.
+      light_curve: FoldedLightCurve of the points searched, with time running
+        from 0 to period and flux as returned by find_secondary.
+    """
+    if duration not in self._secondaries:
+      t0, new_time, new_flux, index = _find_secondary(
+          self.time, self.flux, duration, self.period)
+      light_curve = self._rearranged(index)
+      light_curve.time = new_time
+      light_curve.flux = new_flux
+      self._secondaries[duration] = (t0, light_curve)
+    return self._secondaries[duration]
+
+  def bin_index(self, num_bins, t_min, t_max):
+    """Returns the (cached) median_filter2.BinIndex for the given window."""
+    key = (num_bins, t_min, t_max)
+    if key not in self._bin_indices:
+      if self._parent is not None and key in self._parent._bin_indices:
+        index = self._parent._bin_indices[key].subset(self._keep)
+      else:
+        index = median_filter2.BinIndex(
+            self.time, self.period, num_bins, t_min, t_max, half_cadence=self.half_cadence)
+      self._bin_indices[key] = index
+    return self._bin_indices[key]
+
+
 def generate_view(tic_id,
                   time,
                   flux,
@@ -88,6 +347,8 @@ def generate_view(tic_id,
                   trim_edges=False,
                   scale=None,
                   depth=None,
+                  folded=None,
+                  half_cadence=None,
                  ):
   """Generates a view of a phase-folded light curve using a median filter.
 
@@ -98,15 +359,32 @@ def generate_view(tic_id,
     t_min: The inclusive leftmost value to consider on the time axis.
     t_max: The exclusive rightmost value to consider on the time axis.
     normalize: Whether to center the median at 1 and minimum value at 0.
+    folded: Optional FoldedLightCurve whose time array is `time`; gives the
+      exposure time of each point and is used to reuse bin indices between
+      views.
+    half_cadence: Optional array of the half exposure time of each point, see
+      median_filter2.half_cadence(). If neither this nor folded is given, it is
+      inferred from `time` itself, which assumes the 30 minute cadence for
+      phase folded times.
 
   Returns:
     1D NumPy array of size num_bins containing the median flux values of
     uniformly spaced bins on the phase-folded time axis.
   """
+  bin_index = None
+  if folded is not None:
+    bin_index = folded.bin_index(num_bins, t_min, t_max)
+  elif half_cadence is None:
+    half_cadence = median_filter2.half_cadence(time)
+
   if binning is None:
-    view, mask, std = median_filter2.new_binning(time, flux, period, num_bins, t_min, t_max, trim_edges=trim_edges)
+    view, mask, std = median_filter2.new_binning(
+        time, flux, period, num_bins, t_min, t_max, trim_edges=trim_edges, bin_index=bin_index,
+        half_cadence=half_cadence)
   else:
-    view, mask, std = median_filter2.new_binning(time, flux, period, num_bins, t_min, t_max, method=binning, trim_edges=trim_edges)
+    view, mask, std = median_filter2.new_binning(
+        time, flux, period, num_bins, t_min, t_max, method=binning, trim_edges=trim_edges,
+        bin_index=bin_index, half_cadence=half_cadence)
 
   if normalize:
     # Normalization places:
@@ -134,7 +412,7 @@ def generate_view(tic_id,
   return view, std, mask, scale, depth
 
 
-def global_view(tic_id, time, flux, period, num_bins=201):
+def global_view(tic_id, time, flux, period, num_bins=201, folded=None):
   """Generates a 'global view' of a phase folded light curve.
 
   See Section 3.3 of Shallue & Vanderburg, 2018, The Astronomical Journal.
@@ -145,6 +423,9 @@ def global_view(tic_id, time, flux, period, num_bins=201):
     flux: 1D array of flux values.
     period: The period of the event (in days).
     num_bins: The number of intervals to divide the time axis into.
+    folded: Optional FoldedLightCurve whose time array is `time`. It gives the
+      exposure time of each point from its unfolded time; without it, the 30
+      minute cadence is assumed.
 
   Returns:
     1D NumPy array of size num_bins containing the median flux values of
@@ -157,10 +438,11 @@ def global_view(tic_id, time, flux, period, num_bins=201):
       period,
       num_bins=num_bins,
       t_min=-period / 2,
-      t_max=period / 2)
+      t_max=period / 2,
+      folded=folded)
 
 
-def tr_mask_view(tic_id, time, tr_mask, period, num_bins=201):
+def tr_mask_view(tic_id, time, tr_mask, period, num_bins=201, folded=None):
   return generate_view(
       tic_id, 
       time,
@@ -170,7 +452,8 @@ def tr_mask_view(tic_id, time, tr_mask, period, num_bins=201):
       t_min=-period / 2,
       t_max=period / 2,
       normalize=False,
-      binning='max')
+      binning='max',
+      folded=folded)
 
 
 def local_view(tic_id, 
@@ -181,7 +464,8 @@ def local_view(tic_id,
                num_bins=61,
                num_durations=2,
                scale=None,
-               depth=None):
+               depth=None,
+               folded=None):
   """Generates a 'local view' of a phase folded light curve.
   See Section 3.3 of Shallue & Vanderburg, 2018, The Astronomical Journal.
   http://iopscience.iop.org/article/10.3847/1538-3881/aa9e09/meta
@@ -193,6 +477,9 @@ def local_view(tic_id,
     num_bins: The number of intervals to divide the time axis into.
     num_durations: The number of durations to consider on either side of 0 (the
         event is assumed to be centered at 0).
+    folded: Optional FoldedLightCurve whose time array is `time`. It gives the
+      exposure time of each point from its unfolded time; without it, the 30
+      minute cadence is assumed.
   Returns:
     1D NumPy array of size num_bins containing the median flux values of
     uniformly spaced bins on the phase-folded time axis.
@@ -207,14 +494,10 @@ def local_view(tic_id,
       t_max=min(period / 2, duration * num_durations),
       scale=scale,
       depth=depth,
+      folded=folded,
   )
 
 
-def mask_transit(time, duration, period, mask_width=2, phase_limit=0.1):
-    mask = [(abs(t) > duration * mask_width / 2) and (abs(t) > period * phase_limit) for t in time]
-    return np.array(mask)
-
-
 def find_secondary(time, flux, duration, period, mask_width=2, phase_limit=0.1):
     """
     Mask out transits, rearrange LC such that time goes from 0 to period. Then perform grid search for most likely
@@ -227,14 +510,16 @@ def find_secondary(time, flux, duration, period, mask_width=2, phase_limit=0.1):
     :param phase_limit: minimum phase to search for secondary eclipse.
     :return: time of centre of most likely secondary.
     """
+    best_t0, new_time, new_flux, _ = _find_secondary(time, flux, duration, period, mask_width, phase_limit)
+    return best_t0, new_time, new_flux
+
+
+def _find_secondary(time, flux, duration, period, mask_width=2, phase_limit=0.1):
+    """find_secondary, also returning the indices into time of the points searched."""
     if period < 1:
         mask_width = 1
 
-    mask = mask_transit(time, duration, period, mask_width, phase_limit)
-    if not any(mask):
-        mask = mask_transit(time, duration, period, mask_width / 2, phase_limit)
-        if not any(mask):
-            mask = mask_transit(time, duration, period, mask_width / 2, phase_limit/10)
+    mask = util.mask_transit_with_fallback(time, duration, period, mask_width, phase_limit)
 
     new_time = time[mask]
     new_flux = flux[mask]
@@ -245,35 +530,44 @@ def find_secondary(time, flux, duration, period, mask_width=2, phase_limit=0.1):
     new_time = new_time[new_index]
     new_flux = new_flux[new_index]
     new_flux -= 1.  # centre flux at zero
+    index = np.flatnonzero(mask)[new_index]
 
     # grid search for secondary. Fix duration to duration of primary.
     time_grid = np.arange(new_time[0]+duration, new_time[-1]-duration, duration*0.1)
-    min_index = 0
-    max_index = min_index
     best_t0 = period / 2
     best_SR = 0
 
-    for t0 in time_grid:
-        while new_time[min_index] < (t0 - duration):
-            min_index += 1
-        min_in_transit = min_index
-        max_in_transit = min_in_transit
-        while (new_time[max_index] < (t0 + duration)) and (max_index < len(new_time)):
-            max_index += 1
-        while new_time[min_in_transit] < (t0 - duration/2):
-            min_in_transit += 1
-        while new_time[max_in_transit] < (t0 + duration/2):
-            max_in_transit += 1
-        if max_index - min_index < 5:
-            continue
-        r = float(max_in_transit - min_in_transit + 1) / len(new_time)  # assuming identical uniform weights
-        s = sum(new_flux[min_in_transit:max_in_transit] / float(len(new_time)))
-
-        SR = s**2 / (r*(1-r))
-        if SR > best_SR:
-            best_t0 = t0
-            best_SR = SR
-    return best_t0, new_time, new_flux + 1.
+    # Every trial t0 is evaluated at once: binary search for the bounds of the
+    # search window (t0 +/- duration) and of the box (t0 +/- duration / 2),
+    # then take the in-box flux sums from a cumulative sum.
+    min_index = np.searchsorted(new_time, time_grid - duration, 'left')
+    max_index = np.searchsorted(new_time, time_grid + duration, 'left')
+    min_in_transit = np.searchsorted(new_time, time_grid - duration/2, 'left')
+    max_in_transit = np.searchsorted(new_time, time_grid + duration/2, 'left')
+
+    n = len(new_time)
+    scaled_flux = new_flux / float(n)
+    cum_flux = np.concatenate([[0.0], np.cumsum(scaled_flux)])
+    r = (max_in_transit - min_in_transit + 1) / float(n)  # assuming identical uniform weights
+    s = cum_flux[max_in_transit] - cum_flux[min_in_transit]
+
+    # Differences of the cumulative sum can round differently from summing
+    # each box directly. Bound that error, and re-evaluate exactly only the
+    # trials that could be the best one, so the result matches a direct search.
+    s_err = 4 * n * np.finfo(float).eps * np.sum(np.abs(scaled_flux))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        SR_hi = (np.abs(s) + s_err)**2 / (r*(1-r))
+        SR_lo = np.maximum(np.abs(s) - s_err, 0)**2 / (r*(1-r))
+    valid = (max_index - min_index) >= 5
+    if np.any(valid):
+        candidates = valid & (SR_hi >= np.nanmax(np.where(valid, SR_lo, 0))) & (SR_hi > 0)
+        for i in np.flatnonzero(candidates):
+            s_i = sum(scaled_flux[min_in_transit[i]:max_in_transit[i]])
+            SR = s_i**2 / (r[i]*(1-r[i]))
+            if SR > best_SR:
+                best_t0 = time_grid[i]
+                best_SR = SR
+    return best_t0, new_time, new_flux + 1., index
 
 
 def secondary_view(tic_id, 
@@ -284,7 +578,8 @@ def secondary_view(tic_id,
                    num_bins=61,
                    num_durations=2,
                    scale=None,
-                   depth=None):
+                   depth=None,
+                   folded=None):
     """Generates a 'local view' of a phase folded light curve, centered on phase 0.5.
       See Section 3.3 of Shallue & Vanderburg, 2018, The Astronomical Journal.
       http://iopscience.iop.org/article/10.3847/1538-3881/aa9e09/meta
@@ -296,17 +591,27 @@ def secondary_view(tic_id,
         num_bins: The number of intervals to divide the time axis into.
         num_durations: The number of durations to consider on either side of 0 (the
             event is assumed to be centered at 0).
+        folded: Optional FoldedLightCurve whose time array is `time`. It gives
+            the exposure time of each point from its unfolded time; without it,
+            the 30 minute cadence is assumed. The secondary eclipse search is
+            done once and shared between calls.
       Returns:
         1D NumPy array of size num_bins containing the median flux values of
         uniformly spaced bins on the phase-folded time axis.
       """
     
+    secondary = None
     if len(time):
-        t0, new_time, new_flux = find_secondary(time, flux, duration, period)
+        if folded is not None:
+            t0, secondary = folded.secondary(duration)
+            new_time, new_flux = secondary.time, secondary.flux
+        else:
+            t0, new_time, new_flux = find_secondary(time, flux, duration, period)
         t_min = max(t0 - period / 2, t0 - duration * num_durations, new_time[0])
         t_max = min(t0 + period / 2, t0 + duration * num_durations, new_time[-1])
     else:
         t0, new_time, new_flux = 0.0, time, flux
+        secondary = folded
         t_min = 0.0
         t_max = 0.0
 
@@ -320,7 +625,8 @@ def secondary_view(tic_id,
             t_min=t_min,
             t_max=t_max,
             scale=scale,
-            depth=depth
+            depth=depth,
+            folded=secondary,
         ),
         t0,
     )
@@ -353,7 +659,8 @@ def sample_segments_view(tic_id,
                          duration,
                          num_bins=201,
                          num_transits=7,
-                         local=False
+                         local=False,
+                         folded=None,
                         ):
     times, fluxes, nums = sample_segments(time, flux, fold_num, period, num_transits=num_transits)
     full_view = []
@@ -364,6 +671,7 @@ def sample_segments_view(tic_id,
         if local:
             t_min = max(t_min, 2 * duration)
             t_max = min(t_max, 2 * duration)
+        segment = folded.select(folded.fold_num == n) if folded is not None else None
         view, _, mask, _, _ = generate_view(
                 tic_id, 
                 t,
@@ -374,6 +682,7 @@ def sample_segments_view(tic_id,
                 t_max=period * n + t_min,
                 normalize=False,
                 trim_edges=True,
+                folded=segment,
             )
         full_view.append(view)
         full_view.append(mask)
@@ -0,0 +1,253 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for preprocess.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+from absl.testing import absltest
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+
+from astronet.preprocess import detrend_cache
+from astronet.preprocess import preprocess
+from light_curve_util import util
+
+
+def _reference_secondary_search(new_time, new_flux, duration, period):
+  """The original loop over trial t0 values of find_secondary."""
+  new_flux = new_flux - 1.
+  time_grid = np.arange(new_time[0]+duration, new_time[-1]-duration, duration*0.1)
+  min_index = 0
+  max_index = min_index
+  best_t0 = period / 2
+  best_SR = 0
+  for t0 in time_grid:
+    while new_time[min_index] < (t0 - duration):
+      min_index += 1
+    min_in_transit = min_index
+    max_in_transit = min_in_transit
+    while (new_time[max_index] < (t0 + duration)) and (max_index < len(new_time)):
+      max_index += 1
+    while new_time[min_in_transit] < (t0 - duration/2):
+      min_in_transit += 1
+    while new_time[max_in_transit] < (t0 + duration/2):
+      max_in_transit += 1
+    if max_index - min_index < 5:
+      continue
+    r = float(max_in_transit - min_in_transit + 1) / len(new_time)
+    s = sum(new_flux[min_in_transit:max_in_transit] / float(len(new_time)))
+    SR = s**2 / (r*(1-r))
+    if SR > best_SR:
+      best_t0 = t0
+      best_SR = SR
+  return best_t0
+
+
+def _folded_light_curve(period, duration, secondary_phase, seed=0):
+  rng = np.random.RandomState(seed)
+  time = np.arange(1325.0, 1352.0, 30.0 / 60.0 / 24)
+  time = time[(time < 1338.0) | (time > 1339.5)]
+  flux = 1.0 + 1e-3 * rng.randn(len(time))
+  folded, _ = util.phase_fold_time(time, period, 1326.3)
+  flux[np.abs(folded) < duration / 2] -= 0.01
+  secondary = folded - secondary_phase * period
+  flux[np.abs(secondary) < duration / 2] -= 0.002
+  order = np.argsort(folded)
+  return folded[order], flux[order]
+
+
+class FindSecondaryTest(absltest.TestCase):
+
+  def testMatchesDirectSearch(self):
+    for period, duration, phase in [(3.7, 0.12, 0.5), (11.3, 0.2, -0.3), (0.8, 0.05, 0.4)]:
+      time, flux = _folded_light_curve(period, duration, phase)
+      t0, new_time, new_flux = preprocess.find_secondary(time, flux, duration, period)
+      self.assertEqual(t0, _reference_secondary_search(new_time, new_flux, duration, period))
+      self.assertAlmostEqual(t0 / period, phase % 1, delta=0.02)
+
+  def testNoSignal(self):
+    time, _ = _folded_light_curve(3.7, 0.12, 0.5)
+    flux = np.ones_like(time)
+    t0, _, _ = preprocess.find_secondary(time, flux, 0.12, 3.7)
+    self.assertEqual(t0, 3.7 / 2)
+
+
+class FoldedLightCurveTest(absltest.TestCase):
+
+  def testSecondaryViewSharesSearch(self):
+    period, duration = 3.7, 0.12
+    rng = np.random.RandomState(0)
+    time = np.arange(1325.0, 1352.0, 30.0 / 60.0 / 24)
+    flux = 1.0 + 1e-3 * rng.randn(len(time))
+    folded = preprocess.FoldedLightCurve(
+        time, flux, np.ones_like(time, dtype=bool), period, 1326.3)
+
+    # Without folded, secondary_view runs its own uncached search.
+    expected, expected_t0 = preprocess.secondary_view(
+        0, folded.time, folded.flux, period, duration)
+    self.assertEqual(
+        expected_t0, preprocess.find_secondary(folded.time, folded.flux, duration, period)[0])
+    for _ in range(2):
+      actual, t0 = preprocess.secondary_view(
+          0, folded.time, folded.flux, period, duration, folded=folded)
+      self.assertEqual(t0, expected_t0)
+      for e, a in zip(expected, actual):
+        np.testing.assert_array_equal(a, e)
+
+    _, secondary = folded.secondary(duration)
+    self.assertIs(folded.secondary(duration)[1], secondary)
+    self.assertLen(secondary.half_cadence, len(secondary.time))
+
+  def testViewsWithoutFoldedLightCurve(self):
+    # With 30 minute cadence data, the views built from the folded time alone
+    # match those built from a FoldedLightCurve.
+    period, duration = 3.7, 0.12
+    rng = np.random.RandomState(0)
+    time = np.arange(1325.0, 1352.0, 30.0 / 60.0 / 24)
+    flux = 1.0 + 1e-3 * rng.randn(len(time))
+    tr_mask = np.zeros_like(time, dtype=bool)
+    folded = preprocess.FoldedLightCurve(time, flux, tr_mask, period, 1326.3)
+    args = (0, folded.time, folded.flux, period)
+
+    for view_fn, view_args in [
+        (preprocess.global_view, args),
+        (preprocess.tr_mask_view, (0, folded.time, folded.mask, period)),
+        (preprocess.local_view, args + (duration,)),
+    ]:
+      expected = view_fn(*view_args, folded=folded)
+      actual = view_fn(*view_args)
+      for e, a in zip(expected, actual):
+        np.testing.assert_array_equal(a, e)
+
+    expected, expected_t0 = preprocess.secondary_view(*args, duration, folded=folded)
+    actual, t0 = preprocess.secondary_view(*args, duration)
+    self.assertEqual(t0, expected_t0)
+    for e, a in zip(expected, actual):
+      np.testing.assert_array_equal(a, e)
+
+    for local in [False, True]:
+      np.random.seed(0)
+      expected = preprocess.sample_segments_view(
+          0, folded.time, folded.flux, folded.fold_num, period, duration, local=local,
+          folded=folded)
+      np.random.seed(0)
+      actual = preprocess.sample_segments_view(
+          0, folded.time, folded.flux, folded.fold_num, period, duration, local=local)
+      np.testing.assert_array_equal(actual, expected)
+
+  def testEmptyLightCurve(self):
+    empty = np.array([])
+    folded = preprocess.FoldedLightCurve(empty, empty, empty, 3.7, 1326.3)
+    for kwargs in [{}, {'folded': folded}]:
+      (view, std, mask, scale, _), t0 = preprocess.secondary_view(
+          0, empty, empty, 3.7, 0.12, **kwargs)
+      self.assertEqual(t0, 0.0)
+      self.assertIsNone(scale)
+      for v in [view, std, mask]:
+        np.testing.assert_array_equal(v, np.zeros(61))
+
+
+class StarLevelDetrendingTest(absltest.TestCase):
+
+  def testSharesOneFitPerStar(self):
+    rng = np.random.RandomState(0)
+    time = np.arange(1325.0, 1352.0, 30.0 / 60.0 / 24)
+    flux = 1.0 + 0.002 * np.sin(time / 3) + 5e-4 * rng.randn(len(time))
+    tces = pd.DataFrame({
+        'TIC ID': [7, 7, 8],
+        'File': ['a.h5', 'a.h5', 'b.h5'],
+        'Per': [3.7, 5.1, 2.0],
+        'Epoc': [1326.3, 1327.0, 1325.5],
+        'Dur': [0.15, 0.2, 0.1],
+    })
+    ephemerides = preprocess.star_ephemerides(tces)
+    self.assertEqual(ephemerides[(7, 'a.h5')], [(3.7, 1326.3, 0.15), (5.1, 1327.0, 0.2)])
+    self.assertEqual(ephemerides[(8, 'b.h5')], [(2.0, 1325.5, 0.1)])
+
+    # A single TCE star is detrended as before.
+    expected = preprocess.detrend_and_filter(0, time, flux, 2.0, 1325.5, 0.1, 5.0)
+    actual = preprocess.detrend_and_filter(
+        0, time, flux, 2.0, 1325.5, 0.1, 5.0, ephemerides=ephemerides[(8, 'b.h5')])
+    for e, a in zip(expected, actual):
+      np.testing.assert_array_equal(a, e)
+
+    cache = detrend_cache.MemoryDetrendCache()
+    results = [
+        preprocess.detrend_and_filter(
+            0, time, flux, period, epoch, duration, 5.0, cache=cache,
+            ephemerides=ephemerides[(7, 'a.h5')])
+        for period, epoch, duration in ephemerides[(7, 'a.h5')]
+    ]
+    self.assertLen(cache._entries, 1)
+    np.testing.assert_array_equal(results[0][1], results[1][1])
+    np.testing.assert_array_equal(
+        results[0][2], preprocess.get_spline_mask(time, 3.7, 1326.3, 0.15))
+    np.testing.assert_array_equal(
+        results[1][2], preprocess.get_spline_mask(time, 5.1, 1327.0, 0.2))
+
+    joint = preprocess.get_joint_spline_mask(time, ephemerides[(7, 'a.h5')])
+    np.testing.assert_array_equal(joint, results[0][2] & results[1][2])
+
+
+class LightCurveGetterTest(absltest.TestCase):
+
+  def setUp(self):
+    super(LightCurveGetterTest, self).setUp()
+    self.tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tempdir)
+    rng = np.random.RandomState(0)
+    columns = [
+        fits.Column(name="TIME", format="D", array=np.linspace(2000.0, 2027.0, 1000)),
+        fits.Column(name="QUALITY", format="J", array=np.zeros(1000, dtype=np.int32)),
+    ]
+    for key in preprocess.APERTURE_FLUX_KEYS.values():
+      columns.append(fits.Column(name=key, format="E", array=rng.rand(1000)))
+    fits.BinTableHDU.from_columns(columns).writeto(os.path.join(self.tempdir, "a.fits"))
+    self.tce_table = pd.DataFrame({
+        "Astro ID": [1, 2, 2],
+        "File": ["a.fits", "a.fits", "missing.fits"],
+        "MinT": [-np.inf, 2010.0, 2020.0],
+    })
+
+  def testReadApertures(self):
+    get_lc = preprocess.LightCurveGetter(self.tempdir, self.tce_table)
+    apertures = preprocess.read_apertures(get_lc, 2, [None, "s", "m", "l"])
+    self.assertEqual(list(apertures), [None, "s", "m", "l"])
+    for aperture, (time, flux) in apertures.items():
+      # The first TCE of an Astro ID is used.
+      self.assertBetween(time.min(), 2010.0, 2020.0)
+      expected_time, expected_flux = get_lc(2, aperture)
+      np.testing.assert_array_equal(time, expected_time)
+      np.testing.assert_array_equal(flux, expected_flux)
+    self.assertLen(get_lc(1)[0], 1000)
+
+    # Getters without read_apertures are called once per aperture.
+    plain = preprocess.read_apertures(lambda *args: get_lc(*args), 2, ["m", None])
+    self.assertEqual(list(plain), ["m", None])
+    np.testing.assert_array_equal(plain["m"][1], apertures["m"][1])
+
+    with self.assertRaisesRegex(ValueError, "Astro ID not found"):
+      get_lc(3)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,234 @@
+"""Append-only TFRecord shards with manifests of their completed TCEs.
+
+By default generate_input_records rewrites each shard file on every run, after
+reading the examples already in it into memory. With a manifest directory, a
+run instead appends its new examples to a new part file of the shard,
+
+  <shard>.part-00001, <shard>.part-00002, ...
+
+and, as soon as each example is written, appends its Astro ID, part file and
+end offset to <manifest_dir>/<shard>.manifest. A resumed run only reads the
+manifests, so it costs O(new work). compact() merges the part files of a shard
+back into the shard file.
+
+The manifests must not be in the output directory, since training reads every
+file there as a TFRecord file. Only local file systems are supported: data
+written after the last manifest entry of a part file, e.g. by a run which was
+killed, is truncated when the shard is recovered.
+"""
+import glob
+import os
+import re
+
+from absl import logging
+import tensorflow as tf
+
+# A TFRecord is its length, a CRC of the length, the data and a CRC of the data.
+_RECORD_OVERHEAD = 16
+
+_PART_RE = re.compile(r"\.part-(\d+)\Z")
+
+
+def _manifest_path(manifest_dir, file_name):
+  return os.path.join(manifest_dir, os.path.basename(file_name) + ".manifest")
+
+
+def _part_number(part_file):
+  m = _PART_RE.search(part_file)
+  return None if m is None else int(m.group(1))
+
+
+def part_files(file_name):
+  """Returns the part files of a shard, in order."""
+  parts = [f for f in glob.glob(glob.escape(file_name) + ".part-*") if _part_number(f) is not None]
+  return sorted(parts, key=_part_number)
+
+
+def shard_files(file_name):
+  """Returns the shard file, if it exists, and the part files of a shard."""
+  return ([file_name] if os.path.exists(file_name) else []) + part_files(file_name)
+
+
+def _scan(file_name):
+  """Returns the (Astro ID, end offset) of each complete record of a TFRecord file."""
+  entries = []
+  offset = 0
+  try:
+    for record in tf.data.TFRecordDataset(file_name):
+      ex_str = record.numpy()
+      ex = tf.train.Example.FromString(ex_str)
+      offset += len(ex_str) + _RECORD_OVERHEAD
+      entries.append((ex.features.feature["astro_id"].int64_list.value[0], offset))
+  except tf.errors.DataLossError:
+    pass  # A partly written record at the end of the file.
+  return entries
+
+
+def _read_manifest(path):
+  """Returns the (Astro ID, part file name, end offset) entries of a manifest."""
+  entries = []
+  if os.path.exists(path):
+    with open(path) as f:
+      for line in f:
+        fields = line.split("\t")
+        if len(fields) != 3 or not line.endswith("\n"):
+          break  # A partly written last line.
+        entries.append((int(fields[0]), fields[1], int(fields[2])))
+  return entries
+
+
+def _write_manifest(path, entries):
+  with open(path, "w") as f:
+    f.writelines(f"{astro_id}\t{part}\t{offset}\n" for astro_id, part, offset in entries)
+
+
+def recover(file_name, manifest_dir):
+  """Makes the files of a shard consistent with its manifest.
+
+  Data after the last manifest entry of each part file is truncated, and part
+  files without entries are removed. A shard file without entries, written by a
+  run without a manifest, is scanned once and added to the manifest. An
+  interrupted compact() is completed if its manifest was written, and undone
+  otherwise.
+
+  Args:
+    file_name: Path of the shard file.
+    manifest_dir: Directory of the manifests.
+
+  Returns:
+    List of the (Astro ID, part file name, end offset) of the examples of the
+    shard.
+  """
+  os.makedirs(manifest_dir, exist_ok=True)
+  path = _manifest_path(manifest_dir, file_name)
+  entries = _read_manifest(path)
+  base = os.path.basename(file_name)
+  compacting = base + ".compacting"
+  if any(part == compacting for _, part, _ in entries):
+    # compact() wrote its manifest, so the compacted file has every record.
+    if os.path.exists(file_name + ".compacting"):
+      os.replace(file_name + ".compacting", file_name)
+    entries = [(astro_id, base, offset) for astro_id, _, offset in entries]
+  elif os.path.exists(file_name + ".compacting"):
+    os.remove(file_name + ".compacting")  # Left by an interrupted compact().
+  ends = {}
+  for _, part, offset in entries:
+    ends[part] = max(ends.get(part, 0), offset)
+
+  if base not in ends and os.path.exists(file_name) and os.path.getsize(file_name):
+    scanned = [(astro_id, base, offset) for astro_id, offset in _scan(file_name)]
+    entries = scanned + entries
+    ends[base] = scanned[-1][2] if scanned else 0
+
+  for part_file in shard_files(file_name):
+    part = os.path.basename(part_file)
+    end = ends.get(part, 0)
+    if part != base and end == 0:
+      os.remove(part_file)
+    elif os.path.getsize(part_file) > end:
+      os.truncate(part_file, end)
+  _write_manifest(path, entries)
+  return entries
+
+
+class AppendingShardWriter(object):
+  """Appends the new examples of a shard to a new part file.
+
+  Has the interface of generate_input_records._ShardWriter, but writes examples
+  in the order in which they are added.
+  """
+
+  def __init__(self, file_name, astro_ids, manifest_dir):
+    output_dir = os.path.dirname(os.path.abspath(file_name))
+    if os.path.commonpath([output_dir, os.path.abspath(manifest_dir)]) == output_dir:
+      raise ValueError(
+          f"The manifest directory {manifest_dir} must not be in the output directory.")
+    self.file_name = file_name
+    self.size = len(astro_ids)
+    self._astro_ids = astro_ids
+    done = {astro_id for astro_id, _, _ in recover(file_name, manifest_dir)}
+    self._missing = [i for i, astro_id in enumerate(astro_ids) if astro_id not in done]
+    self.num_existing = self.size - len(self._missing)
+    self._manifest_path = _manifest_path(manifest_dir, file_name)
+    self._manifest = None
+    self._writer = None
+    self._num_added = 0
+    self._check_done()
+
+  def missing(self):
+    """Returns the indices of the TCEs which have to be processed."""
+    return list(self._missing)
+
+  def add(self, index, ex_str):
+    if self._writer is None:
+      numbers = [_part_number(f) for f in part_files(self.file_name)]
+      self._part = f"{os.path.basename(self.file_name)}.part-{max(numbers, default=0) + 1:05d}"
+      self._writer = tf.io.TFRecordWriter(
+          os.path.join(os.path.dirname(self.file_name), self._part))
+      self._offset = 0
+      self._manifest = open(self._manifest_path, "a")
+    self._writer.write(ex_str)
+    self._writer.flush()
+    self._offset += len(ex_str) + _RECORD_OVERHEAD
+    self._manifest.write(f"{self._astro_ids[index]}\t{self._part}\t{self._offset}\n")
+    self._manifest.flush()
+    self._num_added += 1
+    self._check_done()
+
+  def _check_done(self):
+    if self._num_added == len(self._missing):
+      self.close()
+      logging.info("%s: %d TCEs, %d new", os.path.basename(self.file_name), self.size,
+                   self._num_added)
+
+  def close(self):
+    if self._writer is not None:
+      self._writer.close()
+      self._manifest.close()
+    self._writer = None
+    self._manifest = None
+
+
+def compact(file_name, manifest_dir):
+  """Merges the part files of a shard into the shard file.
+
+  Records are streamed, so the shard is never held in memory. The records are
+  written to <shard>.compacting, and replacing the manifest with one that
+  lists them in that file commits the compaction. If this is interrupted,
+  recover() discards the compacting file before that point and completes the
+  compaction after it, so no record is lost or listed twice.
+
+  Args:
+    file_name: Path of the shard file.
+    manifest_dir: Directory of the manifests.
+  """
+  entries = recover(file_name, manifest_dir)
+  parts = part_files(file_name)
+  if not parts:
+    return
+  files = shard_files(file_name)
+  astro_ids = {}  # Part file name to the Astro IDs of its records, in order.
+  for astro_id, part, _ in entries:
+    astro_ids.setdefault(part, []).append(astro_id)
+
+  base = os.path.basename(file_name)
+  compacting = base + ".compacting"
+  new_entries = []
+  offset = 0
+  with tf.io.TFRecordWriter(file_name + ".compacting") as writer:
+    for part_file in files:
+      records = tf.data.TFRecordDataset(part_file)
+      for astro_id, record in zip(astro_ids.get(os.path.basename(part_file), []), records):
+        ex_str = record.numpy()
+        writer.write(ex_str)
+        offset += len(ex_str) + _RECORD_OVERHEAD
+        new_entries.append((astro_id, compacting, offset))
+
+  path = _manifest_path(manifest_dir, file_name)
+  _write_manifest(path + ".tmp", new_entries)
+  os.replace(path + ".tmp", path)
+  os.replace(file_name + ".compacting", file_name)
+  _write_manifest(path + ".tmp", [(astro_id, base, offset) for astro_id, _, offset in new_entries])
+  os.replace(path + ".tmp", path)
+  for part_file in parts:
+    os.remove(part_file)
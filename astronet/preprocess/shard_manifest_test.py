@@ -0,0 +1,168 @@
+"""Tests for shard_manifest.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+import tensorflow as tf
+
+from astronet.preprocess import shard_manifest
+
+
+def _example(astro_id, payload=b""):
+  ex = tf.train.Example()
+  ex.features.feature["astro_id"].int64_list.value.append(astro_id)
+  ex.features.feature["payload"].bytes_list.value.append(payload * astro_id)
+  return ex.SerializeToString()
+
+
+def _read_shard(file_name):
+  """Returns the Astro IDs of the records in all files of a shard."""
+  astro_ids = []
+  for f in shard_manifest.shard_files(file_name):
+    for record in tf.data.TFRecordDataset(f):
+      ex = tf.train.Example.FromString(record.numpy())
+      astro_ids.append(ex.features.feature["astro_id"].int64_list.value[0])
+  return astro_ids
+
+
+class ShardManifestTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ShardManifestTest, self).setUp()
+    self.tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tempdir)
+    os.makedirs(os.path.join(self.tempdir, "records"))
+    self.file_name = os.path.join(self.tempdir, "records", "00000-of-00001")
+    self.manifest_dir = os.path.join(self.tempdir, "manifests")
+    self.astro_ids = list(range(1, 8))
+
+  def _writer(self):
+    return shard_manifest.AppendingShardWriter(self.file_name, self.astro_ids, self.manifest_dir)
+
+  def testResume(self):
+    writer = self._writer()
+    self.assertEqual(writer.missing(), list(range(7)))
+    for i in [2, 0, 5]:
+      writer.add(i, _example(self.astro_ids[i], b"x"))
+    writer.close()  # Interrupted.
+
+    writer = self._writer()
+    self.assertEqual(writer.missing(), [1, 3, 4, 6])
+    for i in writer.missing():
+      writer.add(i, _example(self.astro_ids[i], b"y"))
+    self.assertEqual([os.path.basename(f) for f in shard_manifest.part_files(self.file_name)],
+                     ["00000-of-00001.part-00001", "00000-of-00001.part-00002"])
+    self.assertEqual(_read_shard(self.file_name), [3, 1, 6, 2, 4, 5, 7])
+    self.assertEmpty(self._writer().missing())
+
+  def testRecoversFromKilledRun(self):
+    writer = self._writer()
+    writer.add(0, _example(1, b"x"))
+    writer.add(1, _example(2, b"x"))
+    writer.close()
+    part_file = shard_manifest.part_files(self.file_name)[0]
+    size = os.path.getsize(part_file)
+    with open(part_file, "ab") as f:
+      f.write(_example(3)[:5])  # A record without a manifest entry.
+    with open(os.path.join(self.manifest_dir, "00000-of-00001.manifest"), "a") as f:
+      f.write("3\t00000-of")  # A partly written entry.
+    with open(self.file_name + ".part-00007", "wb") as f:
+      f.write(b"orphan")
+
+    self.assertEqual(self._writer().missing(), list(range(2, 7)))
+    self.assertEqual(os.path.getsize(part_file), size)
+    self.assertEqual(shard_manifest.part_files(self.file_name), [part_file])
+    self.assertEqual(_read_shard(self.file_name), [1, 2])
+
+  def testExistingShardWithoutManifest(self):
+    with tf.io.TFRecordWriter(self.file_name) as writer:
+      for astro_id in [1, 2, 3]:
+        writer.write(_example(astro_id, b"z"))
+    writer = self._writer()
+    self.assertEqual(writer.missing(), [3, 4, 5, 6])
+    writer.add(4, _example(5))
+    self.assertEqual(_read_shard(self.file_name), [1, 2, 3, 5])
+
+  def testCompact(self):
+    with tf.io.TFRecordWriter(self.file_name) as writer:
+      writer.write(_example(1, b"z"))
+    for indices in [[1, 2], [4]]:
+      writer = self._writer()
+      for i in indices:
+        writer.add(i, _example(self.astro_ids[i], b"x"))
+      writer.close()
+
+    shard_manifest.compact(self.file_name, self.manifest_dir)
+    self.assertEqual(shard_manifest.shard_files(self.file_name), [self.file_name])
+    self.assertEqual(_read_shard(self.file_name), [1, 2, 3, 5])
+    self.assertEqual(self._writer().missing(), [3, 5, 6])
+
+    # The manifest offsets of the compacted shard are valid.
+    writer = self._writer()
+    writer.add(3, _example(4))
+    writer.close()
+    self.assertEqual(self._writer().missing(), [5, 6])
+    self.assertEqual(_read_shard(self.file_name), [1, 2, 3, 5, 4])
+
+  def testInterruptedCompact(self):
+    for compacted_before in [False, True]:
+      for interrupt_at in range(1, 10):
+        shutil.rmtree(self.tempdir)
+        os.makedirs(os.path.join(self.tempdir, "records"))
+        for indices in [[0, 1], [2]]:
+          writer = self._writer()
+          for i in indices:
+            writer.add(i, _example(self.astro_ids[i], b"x"))
+          writer.close()
+          if compacted_before:
+            shard_manifest.compact(self.file_name, self.manifest_dir)
+        writer = self._writer()
+        writer.add(3, _example(4, b"x"))
+        writer.close()
+
+        # Killed before the interrupt_at-th file is replaced or removed.
+        real_replace, real_remove = os.replace, os.remove
+        calls = []
+
+        def interrupt(real):
+          def call(*args):
+            calls.append(args)
+            if len(calls) == interrupt_at:
+              raise KeyboardInterrupt()
+            real(*args)
+          return call
+
+        with mock.patch.object(shard_manifest.os, "replace", interrupt(real_replace)), \
+             mock.patch.object(shard_manifest.os, "remove", interrupt(real_remove)):
+          try:
+            shard_manifest.compact(self.file_name, self.manifest_dir)
+            interrupted = False
+          except KeyboardInterrupt:
+            interrupted = True
+
+        self.assertEqual(self._writer().missing(), list(range(4, 7)))
+        self.assertEqual(_read_shard(self.file_name), [1, 2, 3, 4])
+        self.assertFalse(os.path.exists(self.file_name + ".compacting"))
+        shard_manifest.compact(self.file_name, self.manifest_dir)
+        self.assertEqual(shard_manifest.shard_files(self.file_name), [self.file_name])
+        self.assertEqual(_read_shard(self.file_name), [1, 2, 3, 4])
+        self.assertEqual(self._writer().missing(), list(range(4, 7)))
+        if not interrupted:
+          break
+      self.assertFalse(interrupted)
+
+  def testManifestInOutputDir(self):
+    with self.assertRaisesRegex(ValueError, "must not be in the output directory"):
+      shard_manifest.AppendingShardWriter(
+          self.file_name, self.astro_ids, os.path.join(self.tempdir, "records", "manifests"))
+
+
+if __name__ == "__main__":
+  absltest.main()
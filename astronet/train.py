@@ -81,6 +81,12 @@ parser.add_argument(
     default=1,
     help="Total number of epochs to train the model for.")
 
+parser.add_argument(
+    "--cycle_length",
+    type=int,
+    default=None,
+    help="Number of TFRecord files read concurrently; by default tf.data chooses.")
+
 parser.add_argument(
     "--shuffle_buffer_size",
     type=int,
@@ -104,7 +110,9 @@ def train(model, config):
         include_labels=True,
         shuffle_filenames=True,
         shuffle_values_buffer=FLAGS.shuffle_buffer_size,
-        repeat=None)
+        repeat=None,
+        cycle_length=FLAGS.cycle_length,
+        deterministic=False)
 
     if FLAGS.eval_files:
         eval_ds = input_ds.build_dataset(
@@ -113,7 +121,8 @@ def train(model, config):
             batch_size=config.hparams.batch_size,
             include_labels=True,
             shuffle_filenames=False,
-            repeat=1)
+            repeat=1,
+            cycle_length=FLAGS.cycle_length)
     else:
         eval_ds = None
 
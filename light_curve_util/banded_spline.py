@@ -0,0 +1,175 @@
+"""Least-squares cubic B-spline fits with a banded normal equation solver."""
+import numpy as np
+from scipy import linalg
+
+
+class IllConditionedError(Exception):
+  """Indicates that the normal equations of a spline fit are ill-conditioned."""
+  pass
+
+
+def _breakpoints(x, bkspace, nord):
+  """Places breakpoints the same way as pydl.pydlutils.bspline.bspline.
+
+  Args:
+    x: 1D numpy array of the time values being fit.
+    bkspace: Spline break point spacing in time units.
+    nord: Order of the spline.
+
+  Returns:
+    1D numpy array of breakpoints, padded by nord - 1 on each side.
+  """
+  startx = x.min()
+  rangex = x.max() - startx
+  if not rangex > 0:
+    raise IllConditionedError("All time values are equal.")
+  nbkpts = max(int(rangex / bkspace) + 1, 2)
+  tempbkspace = rangex / float(nbkpts - 1)
+  bkpt = np.arange(nbkpts, dtype='f') * tempbkspace + startx
+  bkpt[0] = min(bkpt[0], startx)
+  bkpt[-1] = max(bkpt[-1], x.max())
+
+  pad = (bkpt[1] - bkpt[0]) * np.arange(1, nord, dtype=np.float32)
+  return np.concatenate([bkpt[0] - pad[::-1], bkpt, bkpt[-1] + pad])
+
+
+def _basis(breakpoints, x, nord):
+  """Evaluates the nonzero B-splines at each of x.
+
+  Args:
+    breakpoints: 1D numpy array of padded breakpoints.
+    x: 1D numpy array of time values.
+    nord: Order of the spline.
+
+  Returns:
+    first: Integer numpy array; the index of the first nonzero B-spline at each
+      point.
+    basis: 2D numpy array of shape [len(x), nord]; the values of the nonzero
+      B-splines. Points outside the breakpoints use the polynomial of the
+      nearest interval.
+  """
+  ncoeff = len(breakpoints) - nord
+  ileft = np.searchsorted(breakpoints, x, side='left') - 1
+  ileft = np.clip(ileft, nord - 1, ncoeff - 1)
+
+  # The recurrence of de Boor's BSPLVN, over all points at once.
+  basis = np.zeros((len(x), nord))
+  deltap = np.zeros((len(x), nord))
+  deltam = np.zeros((len(x), nord))
+  basis[:, 0] = 1.0
+  for j in range(nord - 1):
+    deltap[:, j] = breakpoints[ileft + j + 1] - x
+    deltam[:, j] = x - breakpoints[ileft - j]
+    vmprev = 0.0
+    for l in range(j + 1):
+      vm = basis[:, l] / (deltap[:, l] + deltam[:, j - l])
+      basis[:, l] = vm * deltap[:, l] + vmprev
+      vmprev = vm * deltam[:, j - l]
+    basis[:, j + 1] = vmprev
+  return ileft - (nord - 1), basis
+
+
+class BandedSpline(object):
+  """A least-squares cubic B-spline with uniformly spaced breakpoints.
+
+  The design matrix has nord nonzero entries per point, so the normal
+  equations are banded and are accumulated directly in banded storage and
+  solved with a banded Cholesky factorization, in O(N + ncoeff) time.
+
+  fit() gives the same spline as pydl.pydlutils.bspline.iterfit with its
+  default arguments, up to rounding: iterfit returns its first successful fit,
+  so its own outlier rejection does not change the spline. Calling fit() again
+  with the same time array and bkspace, e.g. after removing outliers from the
+  mask, reuses the basis functions and only updates the normal equations with
+  the points that entered or left the mask, while the breakpoints (which
+  depend on the first and last points in the mask) are unchanged.
+
+  Attributes:
+    nord: Order of the spline.
+    breakpoints: 1D numpy array of padded breakpoints of the last fit.
+    coeff: 1D numpy array of B-spline coefficients of the last fit.
+  """
+
+  def __init__(self, nord=4):
+    self.nord = nord
+    self.breakpoints = None
+    self.coeff = None
+    self._time = None
+    self._flux = None
+    self._mask = None
+
+  def fit(self, time, flux, mask, bkspace):
+    """Fits the points of a light curve in mask.
+
+    Args:
+      time: 1D numpy array of time values, sorted in ascending order.
+      flux: 1D numpy array of flux values.
+      mask: 1D boolean numpy array; the points to fit.
+      bkspace: Spline break point spacing in time units.
+
+    Returns:
+      self.
+
+    Raises:
+      IllConditionedError: If the normal equations are ill-conditioned, for
+        example if bkspace is too small for the gaps in the masked points.
+    """
+    breakpoints = _breakpoints(time[mask], bkspace, self.nord)
+    if (time is not self._time or flux is not self._flux
+        or not np.array_equal(breakpoints, self.breakpoints)):
+      self._time = time
+      self._flux = flux
+      self.breakpoints = breakpoints
+      self._first, self._basis = _basis(breakpoints, time, self.nord)
+      self._alpha = np.zeros((self.nord, len(breakpoints) - self.nord))
+      self._beta = np.zeros(len(breakpoints) - self.nord)
+      self._mask = np.zeros_like(time, dtype=bool)
+    self._update(np.flatnonzero(mask & ~self._mask), 1)
+    self._update(np.flatnonzero(self._mask & ~mask), -1)
+    self._mask = mask.copy()
+    self.coeff = None
+
+    # pydl treats coefficients as unconstrained below this influence (relative
+    # to a unit weight per point). A margin is kept so that borderline cases
+    # are reported as ill-conditioned.
+    ncoeff = len(self._beta)
+    min_influence = 1e-10 * np.sum(mask) / ncoeff
+    if (np.any(self._alpha[0] <= 10 * min_influence)
+        or not np.all(np.isfinite(self._alpha)) or not np.all(np.isfinite(self._beta))):
+      raise IllConditionedError("Coefficients without enough influence.")
+    try:
+      chol = linalg.cholesky_banded(self._alpha, lower=True)
+    except linalg.LinAlgError as e:
+      raise IllConditionedError(str(e))
+    self.coeff = linalg.cho_solve_banded((chol, True), self._beta)
+    return self
+
+  def _update(self, index, sign):
+    """Adds (sign=1) or removes (sign=-1) points from the normal equations."""
+    basis = self._basis[index]
+    first = self._first[index]
+    ncoeff = len(self._beta)
+    for j in range(self.nord):
+      self._beta += sign * np.bincount(
+          first + j, weights=self._flux[index] * basis[:, j], minlength=ncoeff)
+      for d in range(self.nord - j):
+        # Lower banded storage: alpha[d, c] is the (c + d, c) entry.
+        self._alpha[d] += sign * np.bincount(
+            first + j, weights=basis[:, j] * basis[:, j + d], minlength=ncoeff)
+
+  def evaluate(self, time):
+    """Evaluates the spline of the last fit.
+
+    Args:
+      time: 1D numpy array of time values.
+
+    Returns:
+      1D numpy array of spline values.
+    """
+    if self.coeff is None:
+      raise ValueError("The spline has not been fit.")
+    if time is self._time:
+      first, basis = self._first, self._basis
+    else:
+      first, basis = _basis(self.breakpoints, time, self.nord)
+    return np.sum(basis * self.coeff[first[:, np.newaxis] + np.arange(self.nord)], axis=1)
@@ -0,0 +1,83 @@
+"""Tests for banded_spline.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import warnings
+
+from absl.testing import absltest
+import numpy as np
+from pydl.pydlutils import bspline
+
+from light_curve_util import banded_spline
+
+
+def _light_curve(seed=0):
+  rng = np.random.RandomState(seed)
+  time = np.linspace(0.0, 1.0, 3000)
+  flux = 1.0 + 0.01 * np.sin(20 * time) + 1e-3 * rng.randn(len(time))
+  return time, flux
+
+
+def _iterfit(time, flux, bkspace):
+  with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    return bspline.iterfit(time, flux, bkspace=bkspace)[0]
+
+
+class BandedSplineTest(absltest.TestCase):
+
+  def testBreakpointsMatchPydl(self):
+    time, _ = _light_curve()
+    for bkspace in [0.013, 0.1, 0.7, 2.0]:
+      for x in [time, time[17:-5]]:
+        with warnings.catch_warnings():
+          warnings.simplefilter("ignore")
+          expected = bspline.bspline(x, bkspace=bkspace).breakpoints
+        np.testing.assert_array_equal(banded_spline._breakpoints(x, bkspace, 4), expected)
+
+  def testMatchesIterfit(self):
+    time, flux = _light_curve()
+    mask = np.ones_like(time, dtype=bool)
+    mask[100:130] = False
+    mask[::7] = False
+    other_time = np.linspace(-0.1, 1.1, 77)
+    for bkspace in [0.01, 0.05, 0.3]:
+      spline = banded_spline.BandedSpline().fit(time, flux, mask, bkspace)
+      curve = _iterfit(time[mask], flux[mask], bkspace)
+      np.testing.assert_allclose(spline.evaluate(time), curve.value(time)[0], rtol=1e-12)
+      # Extrapolation beyond the data amplifies rounding differences.
+      np.testing.assert_allclose(
+          spline.evaluate(other_time), curve.value(other_time)[0], rtol=1e-9)
+
+  def testWarmStart(self):
+    time, flux = _light_curve()
+    mask = np.ones_like(time, dtype=bool)
+    spline = banded_spline.BandedSpline().fit(time, flux, mask, 0.05)
+    breakpoints = spline.breakpoints
+
+    mask[[10, 500, 501, 2000]] = False
+    spline.fit(time, flux, mask, 0.05)
+    self.assertIs(spline.breakpoints, breakpoints)  # Updated, not rebuilt.
+    expected = banded_spline.BandedSpline().fit(time, flux, mask, 0.05)
+    np.testing.assert_allclose(spline.evaluate(time), expected.evaluate(time), rtol=1e-12)
+
+    mask[0] = False  # Moves the breakpoints.
+    spline.fit(time, flux, mask, 0.05)
+    self.assertIsNot(spline.breakpoints, breakpoints)
+    expected = banded_spline.BandedSpline().fit(time, flux, mask, 0.05)
+    np.testing.assert_array_equal(spline.evaluate(time), expected.evaluate(time))
+
+  def testIllConditioned(self):
+    time, flux = _light_curve()
+    mask = (time < 0.3) | (time > 0.6)
+    spline = banded_spline.BandedSpline()
+    with self.assertRaises(banded_spline.IllConditionedError):
+      spline.fit(time, flux, mask, 0.05)
+    with self.assertRaises(ValueError):
+      spline.evaluate(time)
+
+
+if __name__ == "__main__":
+  absltest.main()
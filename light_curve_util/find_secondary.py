@@ -20,6 +20,8 @@ from __future__ import division
 from __future__ import print_function
 import numpy as np
 
+from light_curve_util import util
+
 
 def mask_transit(time, duration, period, mask_width=2, phase_limit=0.1):
     """
@@ -31,8 +33,7 @@ def mask_transit(time, duration, period, mask_width=2, phase_limit=0.1):
     :param phase_limit: minimum phase to search for secondary eclipse.
     :return: mask: 1D array of booleans
     """
-    mask = [(abs(t) > duration*mask_width/2) and (abs(t) > period*phase_limit) for t in time]
-    return np.array(mask)
+    return util.mask_transit(time, duration, period, mask_width, phase_limit)
 
 
 def square_error(x, model):
@@ -1,9 +1,13 @@
 """Functions for computing normalization splines for Kepler light curves."""
+import functools
 import warnings
 
 import numpy as np
 from pydl.pydlutils import bspline
 
+from light_curve_util import banded_spline
+from light_curve_util import util
+
 
 class InsufficientPointsError(Exception):
   """Indicates that insufficient points were available for spline fitting."""
@@ -28,31 +32,67 @@ def split(all_time, all_flux, gap_width=0.75):
     out_time: List of numpy arrays; the split time arrays.
     out_flux: List of numpy arrays; the split flux arrays.
   """
-  # Handle single-segment inputs.
-  if isinstance(all_time, np.ndarray) and all_time.ndim == 1:
-    all_time = [all_time]
-    all_flux = [all_flux]
+  return util.split(all_time, all_flux, gap_width=gap_width)
 
-  out_time = []
-  out_flux = []
-  for time, flux in zip(all_time, all_flux):
-    start = 0
-    for end in range(1, len(time) + 1):
-      # Choose the largest endpoint such that time[start:end] has no gaps.
-      if end == len(time) or time[end] - time[end - 1] > gap_width:
-        out_time.append(time[start:end])
-        out_flux.append(flux[start:end])
-        start = end
 
-  return out_time, out_flux
+THREE_SIGMA_FACTOR = -0.15405 + (0.90723 + (-0.23584 + 0.020142 * 3) * 3) * 3
 
+# Inputs of robust_mean_mask from this size on use np.median, which is faster
+# than selection there (see scripts/benchmark_robust_mean_mask.py).
+_PARTITION_MAX_SIZE = 10000
 
-THREE_SIGMA_FACTOR = -0.15405 + (0.90723 + (-0.23584 + 0.020142 * 3) * 3) * 3
+def _partition_median(work):
+  """np.median of work, partially sorting it in place."""
+  n = len(work)
+  kth = [(n - 1) // 2, n // 2, n - 1]
+  work.partition(kth)
+  if np.isnan(work[-1]):
+    # NaNs are partitioned to the end; np.median returns NaN for them.
+    return np.nan
+  return (work[(n - 1) // 2] + work[n // 2]) / 2
 
-def robust_mean_mask(y):
-  """Optimized version of robust_mean."""
-  absdev = np.abs(y - np.median(y))
-  sigma = 1.4826 * np.median(absdev)
+
+def robust_mean_mask(y, scratch=None):
+  """Optimized version of robust_mean.
+
+  For inputs of fewer than _PARTITION_MAX_SIZE points, the medians are found
+  by selection (np.partition) rather than by sorting, and the median of y and
+  of the absolute deviations partition the same work buffer in turn. Larger
+  inputs use np.median, which is faster for them.
+
+  Args:
+    y: 1D numpy array.
+    scratch: Optional numpy array of at least 2 * len(y) elements of the
+      dtype of y (float64 for integer y), used as work space to avoid
+      allocating it on every call. Unused for large inputs.
+
+  Returns:
+    Boolean numpy array with the same length as y; False for outliers.
+  """
+  y = np.asarray(y)
+  n = len(y)
+  if not n:
+    return np.zeros(0, dtype=bool)
+  if n >= _PARTITION_MAX_SIZE:
+    absdev = np.abs(y - np.median(y))
+    sigma = 1.4826 * np.median(absdev)
+    if sigma < 1.0e-24:
+      sigma = 1.253 * np.mean(absdev)
+    mask = absdev <= 3 * sigma
+    sigma = np.std(y[mask]) / THREE_SIGMA_FACTOR
+    return absdev <= 3 * sigma
+
+  dtype = y.dtype if np.issubdtype(y.dtype, np.floating) else np.float64
+  if scratch is None or len(scratch) < 2 * n or scratch.dtype != dtype:
+    scratch = np.empty(2 * n, dtype=dtype)
+  work = scratch[:n]
+  absdev = scratch[n:2 * n]
+
+  work[:] = y
+  np.subtract(y, _partition_median(work), out=absdev)
+  np.abs(absdev, out=absdev)
+  work[:] = absdev
+  sigma = 1.4826 * _partition_median(work)
 
   if sigma < 1.0e-24:
     sigma = 1.253 * np.mean(absdev)
@@ -63,6 +103,77 @@ def robust_mean_mask(y):
 
   return absdev <= 3 * sigma
 
+
+def _segment_median(y, segment, offsets):
+  """Median of each segment of a ragged array; NaN for empty segments."""
+  counts = np.diff(offsets)
+  sorted_y = y[np.lexsort((y, segment))]
+  nonempty = counts > 0
+  lo = offsets[:-1][nonempty] + (counts[nonempty] - 1) // 2
+  hi = offsets[:-1][nonempty] + counts[nonempty] // 2
+  median = np.full(len(counts), np.nan)
+  median[nonempty] = (sorted_y[lo] + sorted_y[hi]) / 2
+  return median
+
+
+def segmented_robust_mean_mask(y, offsets):
+  """Applies robust_mean_mask to every segment of a ragged array at once.
+
+  Args:
+    y: 1D numpy array holding the concatenated values of all segments.
+    offsets: 1D integer numpy array of length num_segments + 1; segment i is
+      y[offsets[i]:offsets[i + 1]].
+
+  Returns:
+    Boolean numpy array with the same length as y; the robust_mean_mask of each
+    segment, concatenated.
+  """
+  y = np.asarray(y, dtype=float)
+  offsets = np.asarray(offsets)
+  counts = np.diff(offsets)
+  num_segments = len(counts)
+  segment = np.repeat(np.arange(num_segments), counts)
+
+  absdev = np.abs(y - _segment_median(y, segment, offsets)[segment])
+  sigma = 1.4826 * _segment_median(absdev, segment, offsets)
+
+  with np.errstate(invalid='ignore', divide='ignore'):
+    fallback = sigma < 1.0e-24
+    if np.any(fallback):
+      mean_absdev = np.bincount(segment, weights=absdev, minlength=num_segments) / counts
+      sigma = np.where(fallback, 1.253 * mean_absdev, sigma)
+
+    mask = absdev <= 3 * sigma[segment]
+
+    # Standard deviation of the non-outliers of each segment. Segments without
+    # any are NaN, which rejects all of their points, as np.std([]) would.
+    num_kept = np.bincount(segment, weights=mask, minlength=num_segments)
+    kept = np.where(mask, y, 0.0)
+    mean = np.bincount(segment, weights=kept, minlength=num_segments) / num_kept
+    sq_dev = np.where(mask, (y - mean[segment])**2, 0.0)
+    std = np.sqrt(np.bincount(segment, weights=sq_dev, minlength=num_segments) / num_kept)
+
+    # bincount sums sequentially while np.std sums pairwise, so std can differ
+    # from np.std in its last bits. That only matters for a segment with a
+    # point within the bound of that difference of its threshold; those
+    # segments, and those with a zero or NaN std, are recomputed with np.std.
+    max_abs = np.zeros(num_segments)
+    nonempty = counts > 0
+    if np.any(nonempty):
+      max_abs[nonempty] = np.maximum.reduceat(np.abs(y), offsets[:-1][nonempty])
+    rel_err = 8 * (num_kept + 1) * np.finfo(float).eps * (1 + (max_abs / std)**2)
+    threshold = 3 * (std / THREE_SIGMA_FACTOR)
+    near = np.abs(absdev - threshold[segment]) <= rel_err[segment] * threshold[segment]
+    inexact = ~(std > 0) | ~np.isfinite(rel_err)
+    inexact[segment[near]] = True
+    for i in np.flatnonzero(inexact & (num_kept > 0)):
+      start, end = offsets[i], offsets[i + 1]
+      std[i] = np.std(y[start:end][mask[start:end]])
+
+    sigma = std / THREE_SIGMA_FACTOR
+    return absdev <= 3 * sigma[segment]
+
+
 def robust_mean(y, cut):
   """Computes a robust mean estimate in the presence of outliers.
   Args:
@@ -121,7 +232,7 @@ def robust_mean(y, cut):
 
   return mean, mean_stddev, mask
 
-def kepler_spline(time, flux, bkspace, maxiter=5, input_mask=None):
+def kepler_spline(time, flux, bkspace, maxiter=5, input_mask=None, warm_start=False):
   """Computes a best-fit spline curve for a light curve segment.
 
   The spline is fit using an iterative process to remove outliers that may cause
@@ -139,6 +250,10 @@ def kepler_spline(time, flux, bkspace, maxiter=5, input_mask=None):
       fit points.
     outlier_cut: The maximum number of standard deviations from the median
       spline residual before a point is considered an outlier.
+    warm_start: Whether to fit with banded_spline.BandedSpline, which updates
+      the least-squares fit incrementally between iterations as only a few
+      points usually change, rather than refitting with bspline.iterfit each
+      time. The spline agrees with the default path to within rounding error.
 
   Returns:
     spline: The values of the fitted spline corresponding to the input time
@@ -168,6 +283,11 @@ def kepler_spline(time, flux, bkspace, maxiter=5, input_mask=None):
 
   assert input_mask is not None
 
+  fitter = banded_spline.BandedSpline() if warm_start else None
+  scratch = None  # Work space of robust_mean_mask.
+  if len(flux) < _PARTITION_MAX_SIZE:
+    scratch = np.empty(2 * len(flux))
+
   for _ in range(maxiter):
     if spline is None:
       mask = input_mask  # Try to fit all points, or at least the ones in our input mask.
@@ -176,7 +296,7 @@ def kepler_spline(time, flux, bkspace, maxiter=5, input_mask=None):
       # less than outlier_cut*sigma, where sigma is a robust estimate of the
       # standard deviation of the residuals from the previous spline.
       residuals = flux - spline
-      new_mask = robust_mean_mask(residuals)
+      new_mask = robust_mean_mask(residuals, scratch)
       new_mask = np.logical_and(new_mask, input_mask)
       if np.all(new_mask == mask):
         break  # Spline converged.
@@ -192,16 +312,25 @@ def kepler_spline(time, flux, bkspace, maxiter=5, input_mask=None):
       return None, None, True, False
 
     try:
-      with warnings.catch_warnings():
-        # Suppress warning messages printed by pydlutils.bspline. Instead we
-        # catch any exception and raise a more informative error.
-        warnings.simplefilter("ignore")
-
-        # Fit the spline on non-outlier points.
-        curve = bspline.iterfit(time[mask], flux[mask], bkspace=bkspace)[0]
-
-      # Evaluate spline at the time points.
-      spline = curve.value(time)[0]
+      new_spline = None
+      if fitter is not None:
+        try:
+          new_spline = fitter.fit(time, flux, mask, bkspace).evaluate(time)
+        except banded_spline.IllConditionedError:
+          # Let iterfit mask the unconstrained breakpoints, or fail.
+          pass
+      if new_spline is None:
+        with warnings.catch_warnings():
+          # Suppress warning messages printed by pydlutils.bspline. Instead we
+          # catch any exception and raise a more informative error.
+          warnings.simplefilter("ignore")
+
+          # Fit the spline on non-outlier points.
+          curve = bspline.iterfit(time[mask], flux[mask], bkspace=bkspace)[0]
+
+        # Evaluate spline at the time points.
+        new_spline = curve.value(time)[0]
+      spline = new_spline
     except (IndexError, ValueError, TypeError) as e:
       # This might be caused by the breakpoint spacing being too small,
       # and/or there being insufficient points to fit the spline in one of the intervals.
@@ -229,6 +358,8 @@ class SplineMetadata(object):
       Information Criterion.
     bic: The value of the Bayesian Information Criterion; equal to
       likelihood_term + penalty_coeff * penalty_term.
+    num_skipped: Number of break-point spacings that were not fit because the
+      search stopped early.
   """
 
   def __init__(self):
@@ -239,6 +370,73 @@ class SplineMetadata(object):
     self.likelihood_term = None
     self.penalty_term = None
     self.bic = None
+    self.num_skipped = 0
+
+
+def _fit_bkspace(bkspace, all_time, all_flux, all_input_mask, maxiter, warm_start=False):
+  """Fits a piecewise spline with a single break-point spacing.
+
+  Args:
+    bkspace: Spline break point spacing in time units.
+    all_time: List of 1D numpy arrays; the time values of the light curve.
+    all_flux: List of 1D numpy arrays; the flux values of the light curve.
+    all_input_mask: List of 1D boolean numpy arrays; the points to fit.
+    maxiter: Maximum number of attempts to fit each spline after removing badly
+      fit points.
+    warm_start: Passed to kepler_spline.
+
+  Returns:
+    spline: List of numpy arrays; values of the spline for each segment.
+    light_curve_mask: List of boolean numpy arrays; the points used in the fit.
+    bad_bkspace: Whether fitting failed for this bkspace.
+    nparams: Total number of free parameters in the piecewise spline.
+    npoints: Total number of data points used to fit the piecewise spline.
+    ssr: Sum of squared residuals between the model and the spline.
+  """
+  nparams = 0
+  npoints = 0
+  ssr = 0
+
+  spline = []
+  light_curve_mask = []
+  bad_bkspace = False
+  for time, flux, this_input_mask in zip(all_time, all_flux, all_input_mask):
+    # Fit B-spline to this light-curve segment.
+    spline_piece, mask, too_few_points, bad_bkspace = kepler_spline(
+        time, flux, bkspace=bkspace, maxiter=maxiter, input_mask=this_input_mask,
+        warm_start=warm_start)
+    if too_few_points:
+      # It's expected to occasionally see intervals with insufficient points,
+      # especially if periodic signals have been removed from the light curve.
+      # Skip this interval, but continue fitting the spline.
+      spline.append(flux)
+      light_curve_mask.append(np.zeros_like(flux, dtype=bool))
+      continue
+    elif bad_bkspace:
+      # It's expected to get a SplineError occasionally for small values of
+      # bkspace. Skip this bkspace.
+      break
+
+    spline.append(spline_piece)
+    light_curve_mask.append(mask)
+
+    # Accumulate the number of free parameters.
+    total_time = np.max(time) - np.min(time)
+    nknots = int(total_time / bkspace) + 1  # From the bspline implementation.
+    nparams += nknots + 3 - 1  # number of knots + degree of spline - 1
+
+    # Accumulate the number of points and the squared residuals.
+    npoints += np.sum(mask)
+    ssr += np.sum((flux[mask] - spline_piece[mask])**2)
+
+  return spline, light_curve_mask, bad_bkspace, nparams, npoints, ssr
+
+
+def _map_in_batches(executor, fn, items, batch_size):
+  """Like executor.map, but only submits the next batch once it is needed."""
+  for start in range(0, len(items), batch_size):
+    for result in executor.map(fn, items[start:start + batch_size]):
+      yield result
 
 
 def choose_kepler_spline(all_time,
@@ -247,7 +445,10 @@ def choose_kepler_spline(all_time,
                          maxiter=5,
                          penalty_coeff=1.0,
                          verbose=True,
-                         all_input_mask=None):
+                         all_input_mask=None,
+                         executor=None,
+                         patience=None,
+                         warm_start=False):
   """Computes the best-fit Kepler spline across a break-point spacings.
 
   Some Kepler light curves have low-frequency variability, while others have
@@ -273,6 +474,21 @@ def choose_kepler_spline(all_time,
     verbose: Whether to log individual spline errors. Note that if bkspaces
       contains many values (particularly small ones) then this may cause logging
       pollution if calling this function for many light curves.
+    all_input_mask: List of 1D boolean numpy arrays; the points to fit. All
+      points are fit if not given.
+    executor: Optional concurrent.futures.Executor used to fit the break-point
+      spacings concurrently. The selected spline is the same as without one.
+      A ProcessPoolExecutor is preferred: the fits mostly hold the GIL, and
+      the warning filters used by kepler_spline are process global.
+    patience: Optional number of consecutive break-point spacings with an
+      increasing BIC after which the remaining spacings are skipped. The BIC
+      usually has a single minimum over log-spaced bkspaces, so a patience of
+      2 or 3 typically selects the same spacing as the exhaustive search;
+      larger values trade speed for robustness to noise in the BIC curve.
+      keplersplinev2_test bounds the relative BIC gap to the exhaustive
+      search: 0 for a patience of 2 or more, and 0.5% for a patience of 1.
+    warm_start: Whether kepler_spline updates its fits incrementally between
+      outlier iterations.
 
   Returns:
     spline: List of numpy arrays; values of the best-fit spline corresponding to
@@ -311,43 +527,27 @@ def choose_kepler_spline(all_time,
         for eachtime in all_time:
             all_input_mask.append(np.ones_like(eachtime, dtype=bool))
             
-  for bkspace in bkspaces:
-    nparams = 0  # Total number of free parameters in the piecewise spline.
-    npoints = 0  # Total number of data points used to fit the piecewise spline.
-    ssr = 0  # Sum of squared residuals between the model and the spline.
-
-    spline = []
-    light_curve_mask = []
-    bad_bkspace = False  # Indicates that the current bkspace should be skipped.
-    for time, flux, this_input_mask in zip(all_time, all_flux, all_input_mask):
-      # Fit B-spline to this light-curve segment.
-      spline_piece, mask, too_few_points, bad_bkspace = kepler_spline(
-          time, flux, bkspace=bkspace, maxiter=maxiter, input_mask=this_input_mask)
-      if too_few_points:
-        # It's expected to occasionally see intervals with insufficient points,
-        # especially if periodic signals have been removed from the light curve.
-        # Skip this interval, but continue fitting the spline.
-        spline.append(flux)
-        light_curve_mask.append(np.zeros_like(flux, dtype=bool))
-        continue
-      elif bad_bkspace:
-        # It's expected to get a SplineError occasionally for small values of
-        # bkspace. Skip this bkspace.
-        metadata.bad_bkspaces.append(bkspace)
-        break
-
-      spline.append(spline_piece)
-      light_curve_mask.append(mask)
-
-      # Accumulate the number of free parameters.
-      total_time = np.max(time) - np.min(time)
-      nknots = int(total_time / bkspace) + 1  # From the bspline implementation.
-      nparams += nknots + 3 - 1  # number of knots + degree of spline - 1
-
-      # Accumulate the number of points and the squared residuals.
-      npoints += np.sum(mask)
-      ssr += np.sum((flux[mask] - spline_piece[mask])**2)
-
+  fit = functools.partial(
+      _fit_bkspace, all_time=all_time, all_flux=all_flux,
+      all_input_mask=all_input_mask, maxiter=maxiter, warm_start=warm_start)
+  if executor is None:
+    fits = map(fit, bkspaces)
+  elif patience is None:
+    # Executor.map yields the results in the order of bkspaces, so the
+    # selection below is identical to the serial path.
+    fits = executor.map(fit, bkspaces)
+  else:
+    # Submit patience spacings at a time so that few fits are wasted after
+    # the search stops.
+    fits = _map_in_batches(executor, fit, bkspaces, patience)
+
+  num_increases = 0  # Consecutive spacings for which the BIC increased.
+  prev_bic = None
+  for i, (spline, light_curve_mask, bad_bkspace, nparams, npoints,
+          ssr) in enumerate(fits):
+    bkspace = bkspaces[i]
+    if bad_bkspace:
+      metadata.bad_bkspaces.append(bkspace)
     if bad_bkspace or not npoints:
       continue
 
@@ -371,6 +571,13 @@ def choose_kepler_spline(all_time,
       metadata.penalty_term = penalty_term
       metadata.bic = bic
 
+    if patience is not None:
+      num_increases = num_increases + 1 if prev_bic is not None and bic > prev_bic else 0
+      prev_bic = bic
+      if num_increases >= patience:
+        metadata.num_skipped = len(bkspaces) - i - 1
+        break
+
   if best_spline is None:
     # All bkspaces resulted in a SplineError, or all light curve intervals had
     # insufficient points.
@@ -387,7 +594,8 @@ def choose_kepler_spline(all_time,
 
 def choosekeplersplinev2(time, flux, bkspace_min=0.5, bkspace_max=20, bkspace_num=20, 
                          maxiter=5, input_mask=None, gap_width_in=None,
-                         return_metadata=False, fixed_bkspace=None):
+                         return_metadata=False, fixed_bkspace=None, executor=None,
+                         patience=None, warm_start=False):
     if gap_width_in == None:
         gap_width_in = bkspace_min
         if fixed_bkspace is not None:
@@ -395,8 +603,8 @@ def choosekeplersplinev2(time, flux, bkspace_min=0.5, bkspace_max=20, bkspace_nu
     if np.all(input_mask == None):
         input_mask = np.ones(len(time), dtype=bool)
 
-    all_time, all_flux = split(time, flux, gap_width=gap_width_in) 
-    all_time2, all_input_mask = split(time, input_mask, gap_width=gap_width_in)
+    all_time, all_flux, all_input_mask = util.split_arrays(
+        time, flux, input_mask, gap_width=gap_width_in)
     
     if fixed_bkspace:
         bkspaces = [fixed_bkspace]
@@ -405,7 +613,8 @@ def choosekeplersplinev2(time, flux, bkspace_min=0.5, bkspace_max=20, bkspace_nu
           np.log10(bkspace_min), np.log10(bkspace_max), num=bkspace_num)
     
     spline, metadata = choose_kepler_spline(
-        all_time, all_flux, bkspaces=bkspaces, all_input_mask=all_input_mask)
+        all_time, all_flux, bkspaces=bkspaces, all_input_mask=all_input_mask,
+        executor=executor, patience=patience, warm_start=warm_start)
     
     spline = np.concatenate(spline)
     assert len(spline) == len(flux) == len(time), (len(spline), len(time), len(flux))
@@ -0,0 +1,194 @@
+"""Tests for keplersplinev2.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from concurrent import futures
+
+from absl.testing import absltest
+import numpy as np
+
+from light_curve_util import keplersplinev2
+
+
+def _median_robust_mean_mask(y):
+  absdev = np.abs(y - np.median(y))
+  sigma = 1.4826 * np.median(absdev)
+  if sigma < 1.0e-24:
+    sigma = 1.253 * np.mean(absdev)
+  mask = absdev <= 3 * sigma
+  sigma = np.std(y[mask]) / keplersplinev2.THREE_SIGMA_FACTOR
+  return absdev <= 3 * sigma
+
+
+class RobustMeanMaskTest(absltest.TestCase):
+
+  def testMatchesMedian(self):
+    rng = np.random.RandomState(0)
+    scratch = np.empty(2 * 10001)
+    # Includes sizes on both sides of the switch to np.median.
+    for n in list(range(1, 40)) + [1000, 1001, 9999, 10000, 10001]:
+      y = rng.standard_t(3, size=n)
+      expected = _median_robust_mean_mask(y)
+      np.testing.assert_array_equal(keplersplinev2.robust_mean_mask(y), expected)
+      np.testing.assert_array_equal(keplersplinev2.robust_mean_mask(y, scratch), expected)
+      y = np.round(y)  # Ties.
+      np.testing.assert_array_equal(
+          keplersplinev2.robust_mean_mask(y, scratch), _median_robust_mean_mask(y))
+
+  def testSpecialInputs(self):
+    y = np.ones(6)  # Zero deviation; uses the mean fallback.
+    np.testing.assert_array_equal(keplersplinev2.robust_mean_mask(y), _median_robust_mean_mask(y))
+    y = np.array([1.0, np.nan, 2.0, 3.0])
+    np.testing.assert_array_equal(keplersplinev2.robust_mean_mask(y), _median_robust_mean_mask(y))
+    y = np.random.RandomState(1).randn(101).astype(np.float32)
+    # A float64 scratch buffer is not used for float32 input.
+    np.testing.assert_array_equal(
+        keplersplinev2.robust_mean_mask(y, np.empty(202)), _median_robust_mean_mask(y))
+    y = np.arange(11)
+    np.testing.assert_array_equal(keplersplinev2.robust_mean_mask(y), _median_robust_mean_mask(y))
+    self.assertEmpty(keplersplinev2.robust_mean_mask(np.array([])))
+
+  def testDoesNotModifyInput(self):
+    y = np.random.RandomState(2).randn(50)
+    expected = y.copy()
+    keplersplinev2.robust_mean_mask(y)
+    np.testing.assert_array_equal(y, expected)
+
+
+class SegmentedRobustMeanMaskTest(absltest.TestCase):
+
+  def testMatchesPerSegment(self):
+    rng = np.random.RandomState(0)
+    segments = [rng.randn(n) for n in rng.randint(2, 300, size=50)]
+    for s in segments[::7]:
+      s[rng.randint(len(s))] = 20.0  # Outlier.
+    segments.append(np.ones(6))  # Zero deviation; uses the mean fallback.
+    segments.append(np.array([1.0, 1.0, 2.0, 2.0]))
+    segments.append(np.array([3.0]))
+    segments.insert(10, np.array([]))
+
+    offsets = np.cumsum([0] + [len(s) for s in segments])
+    mask = keplersplinev2.segmented_robust_mean_mask(np.concatenate(segments), offsets)
+
+    self.assertLen(mask, offsets[-1])
+    for i, s in enumerate(segments):
+      if not len(s):
+        continue
+      expected = keplersplinev2.robust_mean_mask(s)
+      np.testing.assert_array_equal(mask[offsets[i]:offsets[i + 1]], expected)
+
+  def testPointAtThreshold(self):
+    # Half of the points are close to the median and half far from it, so the
+    # clipped standard deviation is large and the last point is only rejected
+    # by the first, MAD based, cut. It is placed exactly at the threshold of the
+    # second cut, where the way the standard deviation is summed matters.
+    for seed in [3, 15]:
+      rng = np.random.RandomState(seed)
+      x = np.concatenate([rng.randn(24) * 0.01, [-1.0, 1.0],
+                          rng.choice([-4.4, 4.4], 24) + rng.randn(24) * 0.01])
+      median = np.median(np.append(x, np.inf))
+      threshold = 3 * (np.std(x) / keplersplinev2.THREE_SIGMA_FACTOR)
+      p = median + threshold
+      while p - median > threshold:
+        p = np.nextafter(p, -np.inf)
+      while np.nextafter(p, np.inf) - median <= threshold:
+        p = np.nextafter(p, np.inf)
+      y = np.append(x, p)
+      expected = keplersplinev2.robust_mean_mask(y)
+      self.assertTrue(expected[-1])
+
+      segments = [rng.randn(30), y, rng.randn(20)]
+      offsets = np.cumsum([0] + [len(s) for s in segments])
+      mask = keplersplinev2.segmented_robust_mean_mask(np.concatenate(segments), offsets)
+      np.testing.assert_array_equal(mask[offsets[1]:offsets[2]], expected)
+
+  def testEmpty(self):
+    mask = keplersplinev2.segmented_robust_mean_mask(np.array([]), np.zeros(4, dtype=int))
+    self.assertEmpty(mask)
+
+
+class ChooseKeplerSplineTest(absltest.TestCase):
+
+  def testExecutorMatchesSerial(self):
+    rng = np.random.RandomState(0)
+    time = np.arange(1325.0, 1352.0, 30.0 / 60.0 / 24)
+    time = time[(time < 1338.0) | (time > 1339.5)]
+    flux = 1.0 + 0.01 * np.sin(time / 1.3) + 1e-3 * rng.randn(len(time))
+    # Include spacings too small to fit some segments.
+    kwargs = dict(bkspace_min=0.01, bkspace_num=8, gap_width_in=0.75, return_metadata=True)
+
+    expected, expected_metadata = keplersplinev2.choosekeplersplinev2(time, flux, **kwargs)
+    self.assertNotEmpty(expected_metadata.bad_bkspaces)
+    for executor_cls in [futures.ThreadPoolExecutor, futures.ProcessPoolExecutor]:
+      with executor_cls(max_workers=3) as executor:
+        spline, metadata = keplersplinev2.choosekeplersplinev2(
+            time, flux, executor=executor, **kwargs)
+      np.testing.assert_array_equal(spline, expected)
+      np.testing.assert_array_equal(metadata.light_curve_mask, expected_metadata.light_curve_mask)
+      self.assertEqual(metadata.bkspace, expected_metadata.bkspace)
+      self.assertEqual(metadata.bic, expected_metadata.bic)
+      self.assertEqual(metadata.bad_bkspaces, expected_metadata.bad_bkspaces)
+
+  def testPatience(self):
+    rng = np.random.RandomState(1)
+    time = np.arange(1325.0, 1352.0, 10.0 / 60.0 / 24)
+    time = time[(time < 1338.0) | (time > 1339.5)]
+    flux = 1.0 + 0.01 * np.sin(time / 1.3) + 1e-3 * rng.randn(len(time))
+
+    expected, expected_metadata = keplersplinev2.choosekeplersplinev2(
+        time, flux, return_metadata=True)
+    self.assertEqual(expected_metadata.num_skipped, 0)
+
+    spline, metadata = keplersplinev2.choosekeplersplinev2(
+        time, flux, return_metadata=True, patience=3)
+    self.assertGreater(metadata.num_skipped, 0)
+    self.assertEqual(metadata.bkspace, expected_metadata.bkspace)
+    np.testing.assert_array_equal(spline, expected)
+
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+      _, parallel_metadata = keplersplinev2.choosekeplersplinev2(
+          time, flux, return_metadata=True, patience=3, executor=executor)
+    self.assertEqual(parallel_metadata.bkspace, metadata.bkspace)
+    self.assertEqual(parallel_metadata.num_skipped, metadata.num_skipped)
+
+  def testPatienceBicGap(self):
+    # The BIC of the spacing selected with a patience stays close to that of
+    # the exhaustive search, for light curves with a range of variability.
+    for seed in range(6):
+      rng = np.random.RandomState(seed)
+      time = np.arange(1325.0, 1352.0, 30.0 / 60.0 / 24)
+      time = time[(time < 1338.0) | (time > 1339.5)]
+      flux = (1.0 + 0.01 * np.sin(time / [0.4, 1.3, 4.0][seed % 3]) +
+              0.003 * np.sin(time / 7.1 + seed) + 1e-3 * rng.randn(len(time)))
+      _, expected = keplersplinev2.choosekeplersplinev2(time, flux, return_metadata=True)
+      for patience in [1, 2, 3]:
+        _, metadata = keplersplinev2.choosekeplersplinev2(
+            time, flux, return_metadata=True, patience=patience)
+        gap = (metadata.bic - expected.bic) / abs(expected.bic)
+        self.assertBetween(gap, 0.0, 0.005 if patience == 1 else 0.0)
+
+  def testWarmStart(self):
+    rng = np.random.RandomState(2)
+    time = np.arange(1325.0, 1352.0, 10.0 / 60.0 / 24)
+    time = time[(time < 1338.0) | (time > 1339.5)]
+    flux = 1.0 + 0.01 * np.sin(time / 1.3) + 1e-3 * rng.randn(len(time))
+    flux[rng.randint(0, len(time), 30)] += 0.02  # Outliers, so that refits happen.
+    input_mask = np.ones_like(time, dtype=bool)
+    input_mask[np.abs(time - 1330.0) < 0.1] = False
+
+    # Includes spacings too small to fit, which take the iterfit path.
+    kwargs = dict(bkspace_min=0.01, bkspace_num=8, gap_width_in=0.75, input_mask=input_mask,
+                  return_metadata=True)
+    expected, expected_metadata = keplersplinev2.choosekeplersplinev2(time, flux, **kwargs)
+    spline, metadata = keplersplinev2.choosekeplersplinev2(time, flux, warm_start=True, **kwargs)
+    np.testing.assert_allclose(spline, expected, rtol=1e-10)
+    np.testing.assert_array_equal(metadata.light_curve_mask, expected_metadata.light_curve_mask)
+    self.assertEqual(metadata.bkspace, expected_metadata.bkspace)
+    self.assertEqual(metadata.bad_bkspaces, expected_metadata.bad_bkspaces)
+    self.assertNotEmpty(metadata.bad_bkspaces)
+
+
+if __name__ == "__main__":
+  absltest.main()
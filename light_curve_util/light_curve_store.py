@@ -0,0 +1,155 @@
+"""A columnar HDF5 store of TESS light curves.
+
+Decoding a QLP FITS file with astropy is much slower than the preprocessing
+that follows it, and vetting reads every file once per aperture. ingest()
+converts a directory of FITS files into a single HDF5 file with one group per
+light curve, named by its path relative to the directory (the File column of
+the TCE tables):
+
+  <name>/TIME      float64 [num_cadences]
+  <name>/QUALITY   int32 [num_cadences]
+  <name>/FLUX      float64 [num_apertures, num_cadences], with the SAP_FLUX*
+                   column names in the flux_keys attribute.
+
+The datasets are stored contiguously and uncompressed, so LightCurveStore
+reads them as views of a memory map of the file, and all apertures of a light
+curve come from a single read.
+"""
+
+import glob
+import os
+
+from absl import logging
+import h5py
+import numpy as np
+from astropy.io import fits
+
+from light_curve_util import tess_io
+
+FLUX_KEY_PREFIX = "SAP_FLUX"
+
+
+def _write_light_curve(h5, name, filename):
+  with fits.open(filename) as f:
+    data = f[1].data
+    flux_keys = [k for k in data.columns.names if k.startswith(FLUX_KEY_PREFIX)]
+    time = data["TIME"].astype("<f8")
+    quality = data["QUALITY"].astype("<i4")
+    flux = np.stack([data[k].astype("<f8") for k in flux_keys]) if flux_keys else (
+        np.zeros((0, len(time)), dtype="<f8"))
+
+  group = h5.create_group(name)
+  group.create_dataset("TIME", data=time)
+  group.create_dataset("QUALITY", data=quality)
+  group.create_dataset("FLUX", data=flux)
+  group.attrs["flux_keys"] = flux_keys
+
+
+def ingest(tess_data_dir, output_file, pattern="**/*.fits*", overwrite=False):
+  """Adds the FITS files in a directory to a light curve store.
+
+  Files which are already in the store are skipped unless overwrite is set, so
+  a store can be updated incrementally as new sectors are downloaded.
+
+  Args:
+    tess_data_dir: Directory containing QLP FITS files.
+    output_file: Path of the HDF5 store; created if it does not exist.
+    pattern: Glob pattern of the FITS files, relative to tess_data_dir.
+    overwrite: Whether to replace light curves which are already in the store.
+
+  Returns:
+    The number of light curves written.
+  """
+  filenames = sorted(glob.glob(os.path.join(tess_data_dir, pattern), recursive=True))
+  num_written = 0
+  with h5py.File(output_file, "a") as h5:
+    for i, filename in enumerate(filenames):
+      name = os.path.relpath(filename, tess_data_dir)
+      if name in h5:
+        if not overwrite:
+          continue
+        del h5[name]
+      try:
+        _write_light_curve(h5, name, filename)
+      except (OSError, KeyError, IndexError) as e:
+        logging.warning("Skipping %s: %s", filename, e)
+        continue
+      num_written += 1
+      if (i + 1) % 1000 == 0:
+        logging.info("Ingested %d/%d files", i + 1, len(filenames))
+  return num_written
+
+
+class LightCurveStore(object):
+  """Reads light curves from a store written by ingest().
+
+  The store is opened lazily, so instances can be pickled and sent to worker
+  processes before they are used.
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self._h5 = None
+    self._mmap = None
+
+  def __getstate__(self):
+    return {"filename": self.filename}
+
+  def __setstate__(self, state):
+    self.__init__(state["filename"])
+
+  def _open(self):
+    if self._h5 is None:
+      self._h5 = h5py.File(self.filename, "r")
+      self._mmap = np.memmap(self.filename, mode="r", dtype=np.uint8)
+    return self._h5
+
+  def close(self):
+    if self._h5 is not None:
+      self._h5.close()
+    self._h5 = None
+    self._mmap = None
+
+  def __contains__(self, name):
+    return name in self._open()
+
+  def _dataset(self, dataset):
+    """Returns a read-only view of a dataset in the memory map, if possible."""
+    offset = dataset.id.get_offset()
+    if offset is None or dataset.dtype.byteorder == ">":
+      return dataset[()]  # Chunked, compressed or empty.
+    nbytes = dataset.size * dataset.dtype.itemsize
+    return self._mmap[offset:offset + nbytes].view(dataset.dtype).reshape(dataset.shape)
+
+  def read(self, name):
+    """Reads the columns of a light curve.
+
+    Args:
+      name: Path of the original FITS file relative to tess_data_dir.
+
+    Returns:
+      time: Numpy array; the time values of the light curve.
+      quality: Numpy array of quality flags corresponding to the time array.
+      fluxes: Dict mapping each SAP_FLUX* column name to a numpy array
+        corresponding to the time array.
+
+    Raises:
+      KeyError: If the light curve is not in the store.
+    """
+    h5 = self._open()
+    if name not in h5:
+      raise KeyError(f"{name} is not in {self.filename}")
+    group = h5[name]
+    time = self._dataset(group["TIME"])
+    quality = self._dataset(group["QUALITY"])
+    flux = self._dataset(group["FLUX"])
+    return time, quality, dict(zip(group.attrs["flux_keys"], flux))
+
+  def read_tess_light_curve(self, name, flux_key):
+    """Equivalent of tess_io.read_tess_light_curve for a light curve in the store."""
+    return self.read_tess_light_curves(name, [flux_key])[flux_key]
+
+  def read_tess_light_curves(self, name, flux_keys):
+    """Equivalent of tess_io.read_tess_light_curves for a light curve in the store."""
+    time, quality, fluxes = self.read(name)
+    return tess_io.clean_light_curves(time, {key: fluxes[key] for key in flux_keys}, quality)
@@ -0,0 +1,93 @@
+"""Tests for light_curve_store.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import pickle
+import shutil
+import tempfile
+
+from absl.testing import absltest
+import numpy as np
+from astropy.io import fits
+
+from light_curve_util import light_curve_store
+from light_curve_util import tess_io
+
+_FLUX_KEYS = ["SAP_FLUX", "SAP_FLUX_SML", "SAP_FLUX_MID", "SAP_FLUX_LAG"]
+
+
+def _write_fits(filename, seed):
+  rng = np.random.RandomState(seed)
+  n = 500
+  columns = [
+      fits.Column(name="TIME", format="D", array=np.linspace(2000.0, 2027.0, n)),
+      fits.Column(name="QUALITY", format="J", array=(rng.rand(n) < 0.05).astype(np.int32)),
+  ]
+  for key in _FLUX_KEYS:
+    flux = (1.0 + 1e-3 * rng.randn(n)).astype(np.float32)
+    flux[rng.randint(0, n, 10)] = np.nan
+    columns.append(fits.Column(name=key, format="E", array=flux))
+  os.makedirs(os.path.dirname(filename), exist_ok=True)
+  fits.BinTableHDU.from_columns(columns).writeto(filename)
+
+
+class LightCurveStoreTest(absltest.TestCase):
+
+  def setUp(self):
+    super(LightCurveStoreTest, self).setUp()
+    self.tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tempdir)
+    self.data_dir = os.path.join(self.tempdir, "lc")
+    self.names = [os.path.join("sector-26", f"{tic}.fits") for tic in [11, 12]]
+    for seed, name in enumerate(self.names):
+      _write_fits(os.path.join(self.data_dir, name), seed)
+    self.store_file = os.path.join(self.tempdir, "lc.h5")
+
+  def testMatchesFits(self):
+    self.assertEqual(light_curve_store.ingest(self.data_dir, self.store_file), 2)
+    store = light_curve_store.LightCurveStore(self.store_file)
+    self.addCleanup(store.close)
+    for name in self.names:
+      self.assertIn(name, store)
+      _, _, fluxes = store.read(name)
+      self.assertCountEqual(fluxes, _FLUX_KEYS)
+      for key in _FLUX_KEYS:
+        expected_time, expected_flux = tess_io.read_tess_light_curve(
+            os.path.join(self.data_dir, name), key)
+        time, flux = store.read_tess_light_curve(name, key)
+        np.testing.assert_array_equal(time, expected_time)
+        np.testing.assert_array_equal(flux, expected_flux)
+    self.assertNotIn("missing.fits", store)
+    with self.assertRaises(KeyError):
+      store.read("missing.fits")
+
+  def testMemoryMapped(self):
+    light_curve_store.ingest(self.data_dir, self.store_file)
+    store = light_curve_store.LightCurveStore(self.store_file)
+    self.addCleanup(store.close)
+    time, _, fluxes = store.read(self.names[0])
+    self.assertIsInstance(time, np.memmap)
+    self.assertIsInstance(fluxes["SAP_FLUX_MID"], np.memmap)
+
+  def testIncremental(self):
+    light_curve_store.ingest(self.data_dir, self.store_file)
+    self.assertEqual(light_curve_store.ingest(self.data_dir, self.store_file), 0)
+    self.assertEqual(light_curve_store.ingest(self.data_dir, self.store_file, overwrite=True), 2)
+    _write_fits(os.path.join(self.data_dir, "sector-27", "11.fits"), 5)
+    self.assertEqual(light_curve_store.ingest(self.data_dir, self.store_file), 1)
+
+  def testPickle(self):
+    light_curve_store.ingest(self.data_dir, self.store_file)
+    store = light_curve_store.LightCurveStore(self.store_file)
+    expected = store.read_tess_light_curve(self.names[1], "SAP_FLUX")
+    store = pickle.loads(pickle.dumps(store))
+    self.addCleanup(store.close)
+    np.testing.assert_array_equal(store.read_tess_light_curve(self.names[1], "SAP_FLUX")[1],
+                                  expected[1])
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -28,65 +28,228 @@ HC_PHASE1 = 30.0 / 60.0 / 24 / 2
 HC_PHASE2 = 10.0 / 60.0 / 24 / 2
 
 
-def get_overlap(hbw, t, c):
-    hc = HC_PHASE1 if t < PHASE2_T else HC_PHASE2
-    bin_overlap = max(0, min(hbw, t + hc) - max(-hbw, t - hc))
-    return bin_overlap
+def half_cadence(time):
+  """Returns the half exposure time of each point given its absolute time.
 
+  Full frame images were taken every 30 minutes before PHASE2_T and every 10
+  minutes afterwards.
+  """
+  return np.where(np.asarray(time) < PHASE2_T, HC_PHASE1, HC_PHASE2)
 
-def new_binning(time, flux, period, num_bins, t_min, t_max, method='weighted_mean', trim_edges=False):
-  t = time.copy()
-  
-  bins_left_edge, step = np.linspace(
-      t_min, t_max, num=num_bins, endpoint=False, retstep=True)
 
-  bin_width = step
+def overlap_weights(hbw, t_c, hc):
+  """Returns the overlap between the exposure of each point and its bin.
+
+  Args:
+    hbw: Half of the bin width.
+    t_c: Numpy array of point times relative to the bin center.
+    hc: Numpy array (or scalar) of the half exposure time of each point.
+
+  Returns:
+    Numpy array; the overlap between each point's exposure and the bin.
+  """
+  return np.maximum(0, np.minimum(hbw, t_c + hc) - np.maximum(-hbw, t_c - hc))
+
+
+def _ranges_to_indices(starts, ends):
+  """Expands [start, end) index ranges into one flat array of indices."""
+  lengths = ends - starts
+  total = np.sum(lengths)
+  if not total:
+    return np.zeros(0, dtype=int)
+  range_offsets = np.cumsum(lengths) - lengths
+  return np.arange(total) - np.repeat(range_offsets - starts, lengths)
+
+
+class BinIndex(object):
+  """Membership of phase-folded light curve points in uniformly spaced bins.
+
+  Points belonging to bin i are indices[offsets[i]:offsets[i + 1]], listed in
+  the order they appear in the input time array.
+
+  Attributes:
+    bins_center: Numpy array of bin centers.
+    bin_width: The width of each bin.
+    offsets: Numpy array of length num_bins + 1; start of each bin in indices.
+    indices: Numpy array; indices into the time array of each bin member.
+    t_c: Numpy array parallel to indices; time of each member relative to its
+      bin center.
+    hc: Numpy array parallel to indices; half exposure time of each member.
+  """
+
+  def __init__(self, time, period, num_bins, t_min, t_max, half_cadence):
+    """Initializes the BinIndex.
+
+    Args:
+      time: 1D numpy array of phase folded time values.
+      period: The period the time values were folded over.
+      num_bins: The number of intervals to divide the time axis into.
+      t_min: The inclusive leftmost value to consider on the time axis.
+      t_max: The exclusive rightmost value to consider on the time axis.
+      half_cadence: Numpy array parallel to time; the half exposure time of
+        each point, from its unfolded time (see half_cadence()).
+    """
+    bins_left_edge, step = np.linspace(
+        t_min, t_max, num=num_bins, endpoint=False, retstep=True)
+    self.bin_width = step
+    hbw = self.bin_width / 2
+    self.bins_center = bins_left_edge + 0.5 * self.bin_width
+
+    time = np.asarray(time)
+    n = len(time)
+
+    # Points are matched to bins in phase space, so sort them once by phase and
+    # look up each bin's candidate members with a binary search. The search
+    # window is padded slightly and every candidate is then checked with the
+    # exact per-point criterion, so membership doesn't depend on rounding.
+    phase = time % period
+    order = np.argsort(phase, kind='stable')
+    sorted_phase = phase[order]
+
+    radius = hbw + max(HC_PHASE1, HC_PHASE2)
+    pad = 1e-9 * (abs(period) + radius)
+    center_phase = self.bins_center % period
+    lo = center_phase - radius - pad
+    hi = center_phase + radius + pad
+
+    # Each bin's window covers at most two runs of the sorted phase array: the
+    # window itself, and the part of it that wraps around the period.
+    everything = (hi - lo) >= period
+    wrap_lo = np.logical_and(lo < 0, ~everything)
+    wrap_hi = np.logical_and(hi >= period, ~everything)
+    start1 = np.searchsorted(sorted_phase, np.where(wrap_lo, 0.0, lo), 'left')
+    end1 = np.searchsorted(sorted_phase, np.where(wrap_hi, period, hi), 'right')
+    start2 = np.where(
+        wrap_lo, np.searchsorted(sorted_phase, lo + period, 'left'),
+        np.where(wrap_hi, 0, n))
+    end2 = np.where(
+        wrap_lo, n,
+        np.where(wrap_hi, np.searchsorted(sorted_phase, hi - period, 'right'), n))
+    start1 = np.where(everything, 0, start1)
+    end1 = np.where(everything, n, end1)
+    start2 = np.where(everything, n, start2)
+    end1 = np.maximum(end1, start1)
+    end2 = np.maximum(end2, start2)
+
+    starts = np.stack([start1, start2], axis=-1).reshape(-1)
+    ends = np.stack([end1, end2], axis=-1).reshape(-1)
+    candidates = order[_ranges_to_indices(starts, ends)]
+    candidate_bin = np.repeat(np.arange(num_bins), (end1 - start1) + (end2 - start2))
+
+    # The exact membership test from the original per-bin implementation.
+    t_c = tmod(time[candidates], period, self.bins_center[candidate_bin])
+    hc = np.asarray(half_cadence)[candidates]
+    in_bin = abs(t_c) <= hbw + hc
+    candidates = candidates[in_bin]
+    candidate_bin = candidate_bin[in_bin]
+    t_c = t_c[in_bin]
+    hc = hc[in_bin]
+
+    # Restore the input ordering of points within each bin.
+    key = np.argsort(candidate_bin * max(n, 1) + candidates, kind='stable')
+    self.indices = candidates[key]
+    self.t_c = t_c[key]
+    self.hc = hc[key]
+    self.offsets = np.zeros(num_bins + 1, dtype=int)
+    np.cumsum(np.bincount(candidate_bin, minlength=num_bins), out=self.offsets[1:])
+
+  @property
+  def num_bins(self):
+    return len(self.bins_center)
+
+  def subset(self, keep):
+    """Returns the index of a subset of the points, without re-searching.
+
+    Args:
+      keep: Boolean numpy array over the original time array, selecting the
+        points that make up the new light curve.
+
+    Returns:
+      A BinIndex over the array time[keep].
+    """
+    keep = np.asarray(keep, dtype=bool)
+    member_bin = np.repeat(np.arange(self.num_bins), np.diff(self.offsets))
+    member_keep = keep[self.indices]
+    new_position = np.cumsum(keep) - 1
+
+    index = BinIndex.__new__(BinIndex)
+    index.bin_width = self.bin_width
+    index.bins_center = self.bins_center
+    index.indices = new_position[self.indices[member_keep]]
+    index.t_c = self.t_c[member_keep]
+    index.hc = self.hc[member_keep]
+    index.offsets = np.zeros(self.num_bins + 1, dtype=int)
+    np.cumsum(np.bincount(member_bin[member_keep], minlength=self.num_bins),
+              out=index.offsets[1:])
+    return index
+
+
+def new_binning(time, flux, period, num_bins, t_min, t_max, method='weighted_mean', trim_edges=False,
+                bin_index=None, half_cadence=None):
+  """Bins a phase folded light curve.
+
+  The exposure time of each point depends on its unfolded time, so either
+  half_cadence or a bin_index built from it must be given.
+
+  Args:
+    time: 1D numpy array of phase folded time values.
+    flux: 1D numpy array of flux values.
+    period: The period the time values were folded over.
+    num_bins: The number of intervals to divide the time axis into.
+    t_min: The inclusive leftmost value to consider on the time axis.
+    t_max: The exclusive rightmost value to consider on the time axis.
+    method: 'weighted_mean' or 'max'.
+    trim_edges: Whether to also mask the neighbours of empty bins.
+    bin_index: Optional BinIndex of time for this window.
+    half_cadence: Numpy array parallel to time of the half exposure time of
+      each point, see half_cadence(). Required if bin_index is None.
+
+  Returns:
+    (view, mask, std) numpy arrays of length num_bins.
+  """
+  if bin_index is None:
+    if half_cadence is None:
+      raise ValueError('new_binning needs half_cadence or a bin_index.')
+    bin_index = BinIndex(time, period, num_bins, t_min, t_max, half_cadence)
+
+  bin_width = bin_index.bin_width
   hbw = bin_width / 2
-  
-  bins_center = bins_left_edge + 0.5 * bin_width
+  flux = np.asarray(flux)
+  offsets = bin_index.offsets
+
+  if method == 'weighted_mean':
+    # calculate the robust mean of every bin at once to remove outliers
+    robust_mask = keplersplinev2.segmented_robust_mean_mask(flux[bin_index.indices], offsets)
+    weights = overlap_weights(hbw, bin_index.t_c, bin_index.hc) / bin_width
 
   f = np.zeros(num_bins)
   s = np.zeros(num_bins)
   m = np.ones(num_bins)
-  for i, b in enumerate(bins_center):
-    # time from bin center
-    t_c = tmod(t, period, b)
-    
-    # find which points are within the bin
-    bin_mask = abs(t_c) <= hbw + np.where(t_c > PHASE2_T, HC_PHASE2, HC_PHASE1)
-
-    if not any(bin_mask):
+  for i in range(num_bins):
+    start, end = offsets[i], offsets[i + 1]
+    if start == end:
         m[i] = 0.0
         continue
 
-    in_bin = t_c[bin_mask]
-    f_x = flux[bin_mask]
-    
-    if not len(f_x):
-        m[i] = 0.0
-        continue
+    f_x = flux[bin_index.indices[start:end]]
 
     if len(f_x) == 1:
         f[i] = f_x[0]
         continue
     
     if method == 'weighted_mean':
-        # calculate the robust mean to remove outliers
-        mask = keplersplinev2.robust_mean_mask(f_x)
+        mask = robust_mask[start:end]
 
         # remove outliers
         f_x = f_x[mask]
-        in_bin = in_bin[mask]
     
     if not len(f_x):
         m[i] = 0.0
         continue
 
     if method == 'weighted_mean':
-        if len(in_bin) > 1:
-            weight = [get_overlap(hbw, in_bin[j], b) / bin_width
-                      for j in range(len(in_bin))]
-            f[i] = np.average(f_x, weights=weight)
+        if len(f_x) > 1:
+            f[i] = np.average(f_x, weights=weights[start:end][mask])
         else:
             f[i], = f_x
     elif method == 'max':
@@ -0,0 +1,202 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for median_filter2.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import numpy as np
+
+from light_curve_util import keplersplinev2
+from light_curve_util import median_filter2
+from light_curve_util import util
+
+
+def _reference_binning(time, flux, period, num_bins, t_min, t_max, method='weighted_mean', trim_edges=False,
+                       half_cadence=None):
+  """The original O(num_bins * N) implementation of new_binning."""
+  t = time.copy()
+  bins_left_edge, step = np.linspace(
+      t_min, t_max, num=num_bins, endpoint=False, retstep=True)
+  bin_width = step
+  hbw = bin_width / 2
+  bins_center = bins_left_edge + 0.5 * bin_width
+
+  f = np.zeros(num_bins)
+  s = np.zeros(num_bins)
+  m = np.ones(num_bins)
+  for i, b in enumerate(bins_center):
+    t_c = median_filter2.tmod(t, period, b)
+    bin_mask = abs(t_c) <= hbw + half_cadence
+    if not any(bin_mask):
+      m[i] = 0.0
+      continue
+    in_bin = t_c[bin_mask]
+    hc = half_cadence[bin_mask]
+    f_x = flux[bin_mask]
+    if len(f_x) == 1:
+      f[i] = f_x[0]
+      continue
+    if method == 'weighted_mean':
+      mask = keplersplinev2.robust_mean_mask(f_x)
+      f_x = f_x[mask]
+      in_bin = in_bin[mask]
+      hc = hc[mask]
+    if not len(f_x):
+      m[i] = 0.0
+      continue
+    if method == 'weighted_mean':
+      if len(in_bin) > 1:
+        weight = [max(0, min(hbw, in_bin[j] + hc[j]) - max(-hbw, in_bin[j] - hc[j])) / bin_width
+                  for j in range(len(in_bin))]
+        f[i] = np.average(f_x, weights=weight)
+      else:
+        f[i], = f_x
+    elif method == 'max':
+      f[i] = np.max(f_x)
+    s[i] = np.std(f_x)
+
+  if trim_edges:
+    clear_bins = set()
+    for i in range(len(m)):
+      if m[i] < 1:
+        if i > 0:
+          clear_bins.add(i - 1)
+        if i < len(m) - 1:
+          clear_bins.add(i + 1)
+    for i in list(clear_bins):
+      m[i] = 0.0
+
+  return f, m, s
+
+
+def _folded_light_curve(period, duration, seed=0):
+  """Returns folded time, flux, fold number and half cadence, sorted by time.
+
+  Half of the points are from before PHASE2_T, with the 30 minute cadence, and
+  half from after it, with the 10 minute cadence.
+  """
+  rng = np.random.RandomState(seed)
+  time = np.concatenate([np.arange(2023.0, 2036.0, 30.0 / 60.0 / 24),
+                         np.arange(2040.0, 2044.5, 10.0 / 60.0 / 24)])
+  # Leave a gap so that some bins are empty.
+  time = time[(time < 2030.0) | (time > 2031.5)]
+  flux = 1.0 + 1e-3 * rng.randn(len(time))
+  flux[rng.randint(0, len(time), 20)] += 0.02
+  folded, fold_num = util.phase_fold_time(time, period, 2024.3)
+  flux[np.abs(folded) < duration / 2] -= 0.01
+  order = np.argsort(folded)
+  half_cadence = median_filter2.half_cadence(time)
+  return folded[order], flux[order], fold_num[order], half_cadence[order]
+
+
+class NewBinningTest(absltest.TestCase):
+
+  def assertMatchesReference(self, *args, **kwargs):
+    expected = _reference_binning(*args, **kwargs)
+    actual = median_filter2.new_binning(*args, **kwargs)
+    for e, a in zip(expected, actual):
+      np.testing.assert_array_equal(a, e)
+
+  def testGlobalAndLocalWindows(self):
+    for period, duration in [(3.7, 0.12), (0.41, 0.05), (11.3, 0.3)]:
+      time, flux, _, hc = _folded_light_curve(period, duration)
+      for method in ['weighted_mean', 'max']:
+        self.assertMatchesReference(
+            time, flux, period, 201, -period / 2, period / 2, method=method,
+            half_cadence=hc)
+        self.assertMatchesReference(
+            time, flux, period, 61, max(-period / 2, -2 * duration),
+            min(period / 2, 2 * duration), method=method, half_cadence=hc)
+
+  def testShiftedWindows(self):
+    # Secondary views use time in [0, period) and sample segment views use bins
+    # offset by a whole number of periods.
+    period, duration = 3.7, 0.12
+    time, flux, fold_num, hc = _folded_light_curve(period, duration)
+    shifted = time.copy()
+    shifted[shifted < 0] += period
+    order = np.argsort(shifted)
+    self.assertMatchesReference(
+        shifted[order], flux[order], period, 61, 1.6, 2.1, half_cadence=hc[order])
+
+    segment = fold_num == 2
+    self.assertMatchesReference(
+        time[segment], flux[segment], period, 201,
+        period * 2 - period / 2, period * 2 + period / 2, trim_edges=True,
+        half_cadence=hc[segment])
+
+  def testTinyPeriod(self):
+    # Bins wider than the period contain every point.
+    time, flux, _, hc = _folded_light_curve(0.02, 0.005)
+    self.assertMatchesReference(time, flux, 0.02, 5, -0.01, 0.01, half_cadence=hc)
+
+  def testSubsetIndex(self):
+    period, duration = 3.7, 0.12
+    time, flux, fold_num, hc = _folded_light_curve(period, duration)
+    t_min, t_max = -2 * duration, 2 * duration
+    index = median_filter2.BinIndex(time, period, 61, t_min, t_max, hc)
+    odd = fold_num % 2 == 1
+    expected = median_filter2.new_binning(
+        time[odd], flux[odd], period, 61, t_min, t_max, half_cadence=hc[odd])
+    actual = median_filter2.new_binning(
+        time[odd], flux[odd], period, 61, t_min, t_max, bin_index=index.subset(odd))
+    for e, a in zip(expected, actual):
+      np.testing.assert_array_equal(a, e)
+
+  def testOverlapWeights(self):
+    hbw = 0.01
+    t_c = np.linspace(-0.04, 0.04, 81)
+    for hc in [median_filter2.HC_PHASE1, median_filter2.HC_PHASE2]:
+      expected = [max(0, min(hbw, t + hc) - max(-hbw, t - hc)) for t in t_c]
+      np.testing.assert_array_equal(
+          median_filter2.overlap_weights(hbw, t_c, hc), expected)
+
+  def testHalfCadenceFromAbsoluteTime(self):
+    period = 4.0
+    # 10 minute cadence data from the second phase of the mission.
+    time = np.arange(2040.0, 2060.0, 10.0 / 60.0 / 24)
+    folded, _ = util.phase_fold_time(time, period, 2041.0)
+    order = np.argsort(folded)
+    folded, time = folded[order], time[order]
+    half_cadence = median_filter2.half_cadence(time)
+    np.testing.assert_array_equal(half_cadence, median_filter2.HC_PHASE2)
+
+    index = median_filter2.BinIndex(folded, period, 101, -0.5, 0.5, half_cadence=half_cadence)
+    hbw = index.bin_width / 2
+    for i in range(index.num_bins):
+      t_c = median_filter2.tmod(folded, period, index.bins_center[i])
+      expected = np.flatnonzero(np.abs(t_c) <= hbw + median_filter2.HC_PHASE2)
+      np.testing.assert_array_equal(
+          index.indices[index.offsets[i]:index.offsets[i + 1]], expected)
+    np.testing.assert_array_equal(index.hc, median_filter2.HC_PHASE2)
+
+  def testRequiresHalfCadence(self):
+    time, flux, _, _ = _folded_light_curve(3.7, 0.12)
+    with self.assertRaisesRegex(ValueError, 'half_cadence'):
+      median_filter2.new_binning(time, flux, 3.7, 61, -0.24, 0.24)
+
+  def testEmpty(self):
+    view, mask, std = median_filter2.new_binning(
+        np.array([]), np.array([]), 2.0, 11, -1.0, 1.0, half_cadence=np.array([]))
+    np.testing.assert_array_equal(view, np.zeros(11))
+    np.testing.assert_array_equal(mask, np.zeros(11))
+    np.testing.assert_array_equal(std, np.zeros(11))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,75 @@
+"""Tests for tess_io.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+from absl.testing import absltest
+import numpy as np
+from astropy.io import fits
+
+from light_curve_util import tess_io
+
+_FLUX_KEYS = ["SAP_FLUX", "SAP_FLUX_SML", "SAP_FLUX_MID", "SAP_FLUX_LAG"]
+
+
+class ReadTessLightCurvesTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ReadTessLightCurvesTest, self).setUp()
+    self.tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tempdir)
+
+  def _write_fits(self, start_time, num_points=1500, seed=0):
+    rng = np.random.RandomState(seed)
+    self.time = np.linspace(start_time, start_time + 27.0, num_points)
+    self.quality = (rng.rand(num_points) < 0.1).astype(np.int32)
+    self.fluxes = {}
+    columns = [
+        fits.Column(name="TIME", format="D", array=self.time),
+        fits.Column(name="QUALITY", format="J", array=self.quality),
+    ]
+    for key in _FLUX_KEYS:
+      flux = (1.0 + 1e-3 * rng.randn(num_points)).astype(np.float32)
+      flux[rng.randint(0, num_points, 50)] = np.nan
+      self.fluxes[key] = flux.astype(float)
+      columns.append(fits.Column(name=key, format="E", array=flux))
+    filename = os.path.join(self.tempdir, f"{start_time}.fits")
+    fits.BinTableHDU.from_columns(columns).writeto(filename)
+    return filename
+
+  def testQualityFlags(self):
+    filename = self._write_fits(2000.0)
+    light_curves = tess_io.read_tess_light_curves(filename, _FLUX_KEYS)
+    self.assertCountEqual(light_curves, _FLUX_KEYS)
+    for key in _FLUX_KEYS:
+      keep = (self.quality == 0) & np.isfinite(self.fluxes[key])
+      time, flux = light_curves[key]
+      np.testing.assert_array_equal(time, self.time[keep])
+      np.testing.assert_array_equal(flux, self.fluxes[key][keep])
+      time, flux = tess_io.read_tess_light_curve(filename, key)
+      np.testing.assert_array_equal(time, self.time[keep])
+      np.testing.assert_array_equal(flux, self.fluxes[key][keep])
+
+  def testSectorOne(self):
+    # Sector 1 ignores the quality flags and removes a fixed list of cadences.
+    filename = self._write_fits(1325.0)
+    light_curves = tess_io.read_tess_light_curves(filename, ["SAP_FLUX", "SAP_FLUX_MID"])
+    self.assertCountEqual(light_curves, ["SAP_FLUX", "SAP_FLUX_MID"])
+    for key, (time, flux) in light_curves.items():
+      keep = np.isfinite(self.fluxes[key])
+      keep[[0, 1, 2, 31, 1280]] = False
+      self.assertNotIn(self.time[1280], time)
+      self.assertLess(len(time), np.sum(keep))
+      np.testing.assert_array_equal(flux, self.fluxes[key][np.isin(self.time, time)])
+      time_single, flux_single = tess_io.read_tess_light_curve(filename, key)
+      np.testing.assert_array_equal(time, time_single)
+      np.testing.assert_array_equal(flux, flux_single)
+
+
+if __name__ == "__main__":
+  absltest.main()
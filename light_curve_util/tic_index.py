@@ -0,0 +1,189 @@
+"""An index from TIC IDs to the light curve files of a directory.
+
+tess_io.tess_filenames used to glob the data directory, which can hold
+hundreds of thousands of files, once per pattern for every lookup. TicIndex
+lists the directory once, parses the TIC and sector of each file name that
+matches one of FILE_PATTERNS, and keeps them in an sqlite table indexed by TIC.
+The listing is only repeated when the directory's mtime changes, i.e. when
+files are added or removed, and then only the difference is applied.
+"""
+
+import os
+import re
+import sqlite3
+
+SECTOR_RE = re.compile('.*-s([^-]+)-.*')
+
+# Glob patterns of light curve file names, in order of preference. The TIC is
+# formatted into the %.16d or %d.
+FILE_PATTERNS = (
+    "mk_hlsp_qlp_tess_ffi-*%.16d_tess_v01_llc.fits",
+    "hlsp_qlp_tess_ffi-s0026-%.16d_tess_v01_llc.fits",
+#     "*tess*-%.16d_*.fits",
+    "tess*-%.16d-*-cr_llc.fits.gz",
+    "tess*-%d-cr_llc.fits.gz",
+)
+
+
+def _sector(f):
+    m = SECTOR_RE.match(f)
+    if m is None:
+        return ''
+    return m.group(1)
+
+
+def _pattern_regex(pattern):
+    """Translates a FILE_PATTERNS glob into a regex capturing the TIC."""
+    parts = []
+    for part in re.split(r'(\*|%\.16d|%d)', pattern):
+        if part == '*':
+            parts.append('.*')
+        elif part == '%.16d':
+            parts.append(r'(\d{16,})')
+        elif part == '%d':
+            parts.append(r'(\d+)')
+        else:
+            parts.append(re.escape(part))
+    return re.compile(''.join(parts) + r'\Z')
+
+
+_PATTERN_REGEXES = [_pattern_regex(p) for p in FILE_PATTERNS]
+
+
+def parse_filename(name):
+    """Returns the (TIC, pattern number, sector) of each pattern matching a file name."""
+    matches = []
+    for i, (pattern, regex) in enumerate(zip(FILE_PATTERNS, _PATTERN_REGEXES)):
+        m = regex.match(name)
+        if m is None:
+            continue
+        tic = int(m.group(1))
+        # Like glob, only match names containing the TIC exactly as formatted.
+        tic_format = '%.16d' if '%.16d' in pattern else '%d'
+        if tic_format % tic != m.group(1):
+            continue
+        matches.append((tic, i, _sector(name)))
+    return matches
+
+
+class TicIndex(object):
+    """Maps TIC IDs to the light curve files in a directory.
+
+    Attributes:
+      base_dir: Directory containing the light curve files.
+      index_file: Path of the sqlite database of the index, or ":memory:" to
+        keep it in memory for the lifetime of the object.
+    """
+
+    def __init__(self, base_dir, index_file=':memory:'):
+        self.base_dir = base_dir
+        self.index_file = index_file
+        self._db = None
+
+    def __getstate__(self):
+        return {'base_dir': self.base_dir, 'index_file': self.index_file}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.index_file)
+            with self._db:
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS files ('
+                    'name TEXT, tic INTEGER, pattern INTEGER, sector TEXT, '
+                    'PRIMARY KEY (name, pattern))')
+                self._db.execute(
+                    'CREATE INDEX IF NOT EXISTS files_by_tic ON files (tic, pattern, sector)')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        return self._db
+
+    def _meta(self, key):
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def refresh(self, force=False):
+        """Updates the index if files were added to or removed from base_dir.
+
+        Args:
+          force: Rescan base_dir even if its mtime has not changed.
+
+        Returns:
+          The number of file names added and removed.
+        """
+        db = self._connection()
+        mtime = str(os.stat(self.base_dir).st_mtime_ns)
+        patterns = repr(FILE_PATTERNS)
+        if self._meta('patterns') != patterns:
+            with db:
+                db.execute('DELETE FROM files')
+        elif not force and self._meta('mtime') == mtime:
+            return 0
+
+        with os.scandir(self.base_dir) as entries:
+            names = {entry.name for entry in entries}
+        indexed = {name for name, in db.execute('SELECT DISTINCT name FROM files')}
+        # Names which match no pattern are not stored and so are parsed again on
+        # every rescan, which is cheap compared to listing the directory.
+        added = [name for name in names - indexed if parse_filename(name)]
+        removed = indexed - names
+        with db:
+            db.executemany('DELETE FROM files WHERE name = ?', [(name,) for name in removed])
+            db.executemany(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                [(name,) + match for name in added for match in parse_filename(name)])
+            db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                           [('mtime', mtime), ('patterns', patterns)])
+        return len(added) + len(removed)
+
+    def filenames(self, tic):
+        """Returns all files of a TIC as (path, pattern number, sector), best first."""
+        self.refresh()
+        rows = self._connection().execute(
+            'SELECT name, pattern, sector FROM files WHERE tic = ? '
+            'ORDER BY pattern, sector DESC, name', (int(tic),))
+        return [(os.path.join(self.base_dir, name), pattern, sector)
+                for name, pattern, sector in rows]
+
+    def filename(self, tic):
+        """Returns the light curve file of a TIC.
+
+        Files matching an earlier pattern of FILE_PATTERNS are preferred, and of
+        several files matching the same pattern the one of the latest sector is
+        selected.
+
+        Args:
+          tic: TIC of the target star. May be an int or a possibly zero-padded
+            string.
+
+        Returns:
+          Path of the file in base_dir.
+
+        Raises:
+          ValueError: If there is no file for the TIC.
+        """
+        candidates = self.filenames(tic)
+        if not candidates:
+            raise ValueError(f'found 0 files for {tic}: []')
+        best_pattern = candidates[0][1]
+        file_names = [name for name, pattern, _ in candidates if pattern == best_pattern]
+        if len(file_names) > 1:
+            print(f'multiple matches, selected {file_names[:1]}')
+        return file_names[0]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+        self._db = None
+
+
+_default_indexes = {}
+
+
+def default_index(base_dir):
+    """Returns an in-memory TicIndex of base_dir, shared within the process."""
+    if base_dir not in _default_indexes:
+        _default_indexes[base_dir] = TicIndex(base_dir)
+    return _default_indexes[base_dir]
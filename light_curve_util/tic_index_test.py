@@ -0,0 +1,93 @@
+"""Tests for tic_index.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import os
+import pickle
+import shutil
+import tempfile
+
+from absl.testing import absltest
+
+from light_curve_util import tess_io
+from light_curve_util import tic_index
+
+_FILE_NAMES = [
+    "mk_hlsp_qlp_tess_ffi-s0001-0000000000000011_tess_v01_llc.fits",
+    "mk_hlsp_qlp_tess_ffi-s0014-0000000000000011_tess_v01_llc.fits",
+    "mk_hlsp_qlp_tess_ffi-s0003-0000000000000011_tess_v01_llc.fits",
+    "hlsp_qlp_tess_ffi-s0026-0000000000000011_tess_v01_llc.fits",
+    "hlsp_qlp_tess_ffi-s0026-0000000000000012_tess_v01_llc.fits",
+    "tess2019-s0010-0000000000000013-0120-cr_llc.fits.gz",
+    "tess2019-s0010-0000000000000017-1600-cr_llc.fits.gz",
+    "tess2019-14-cr_llc.fits.gz",
+    "tess2019-014-cr_llc.fits.gz",
+    "mk_hlsp_qlp_tess_ffi-s0001-15_tess_v01_llc.fits",
+    "README",
+]
+
+
+def _glob_filename(tic, base_dir):
+  """The original glob based lookup of tess_io.tess_filenames."""
+  for fmt in tic_index.FILE_PATTERNS:
+    file_names = glob.glob(os.path.join(base_dir, fmt % int(tic)))
+    if file_names:
+      break
+  if len(file_names) > 1:
+    file_names = sorted(file_names, reverse=True, key=tic_index._sector)[:1]
+  if len(file_names) != 1:
+    raise ValueError(f"found {len(file_names)} files for {tic}: {file_names}")
+  return file_names[0]
+
+
+class TicIndexTest(absltest.TestCase):
+
+  def setUp(self):
+    super(TicIndexTest, self).setUp()
+    self.tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tempdir)
+    self.data_dir = os.path.join(self.tempdir, "lc")
+    os.makedirs(self.data_dir)
+    for name in _FILE_NAMES:
+      self._touch(name)
+
+  def _touch(self, name):
+    open(os.path.join(self.data_dir, name), "w").close()
+
+  def testMatchesGlob(self):
+    index = tic_index.TicIndex(self.data_dir)
+    self.addCleanup(index.close)
+    for tic in [11, "0000000000000012", 13, 14, 17, 1600]:
+      self.assertEqual(index.filename(tic), _glob_filename(tic, self.data_dir))
+      self.assertEqual(tess_io.tess_filenames(tic, self.data_dir, index),
+                       _glob_filename(tic, self.data_dir))
+    self.assertEqual(os.path.basename(index.filename(11)), _FILE_NAMES[1])
+    for tic in [15, 16]:
+      with self.assertRaises(ValueError):
+        _glob_filename(tic, self.data_dir)
+      with self.assertRaisesRegex(ValueError, "found 0 files"):
+        index.filename(tic)
+
+  def testIncrementalRefresh(self):
+    index_file = os.path.join(self.tempdir, "index.sqlite")
+    index = tic_index.TicIndex(self.data_dir, index_file)
+    self.assertEqual(index.refresh(), 8)  # Files which match a pattern.
+    self.assertEqual(index.refresh(), 0)
+    index.close()
+
+    index = pickle.loads(pickle.dumps(tic_index.TicIndex(self.data_dir, index_file)))
+    self.addCleanup(index.close)
+    self.assertEqual(index.refresh(), 0)  # Persisted.
+    self._touch("mk_hlsp_qlp_tess_ffi-s0020-0000000000000011_tess_v01_llc.fits")
+    os.remove(os.path.join(self.data_dir, _FILE_NAMES[4]))
+    self.assertEqual(index.refresh(force=True), 2)
+    self.assertIn("s0020", index.filename(11))
+    with self.assertRaises(ValueError):
+      index.filename(12)
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -46,6 +46,74 @@ def phase_fold_time(time, period, t0):
   return result, fold_num
     
 
+def mask_transit(time, duration, period, mask_width=2, phase_limit=0.1):
+  """Masks out the points near the transit of a phase folded light curve.
+
+  Args:
+    time: 1D numpy array of time values, phase folded with the transit located
+        at time 0.
+    duration: The duration of the event (in days).
+    period: The period of the event (in days).
+    mask_width: Number of durations to mask out.
+    phase_limit: Minimum phase to keep.
+
+  Returns:
+    Boolean numpy array; True for points outside both limits.
+  """
+  limit = max(duration * mask_width / 2, period * phase_limit)
+  return np.abs(time) > limit
+
+
+def mask_transit_with_fallback(time, duration, period, mask_width=2, phase_limit=0.1):
+  """Like mask_transit, relaxing the limits if no points would remain.
+
+  The limits tried are (mask_width, phase_limit), then (mask_width / 2,
+  phase_limit) and finally (mask_width / 2, phase_limit / 10). The first that
+  keeps any point is used, which only depends on the largest absolute time, so
+  the light curve is scanned once whichever limit is chosen.
+
+  Args:
+    time: 1D numpy array of time values, phase folded with the transit located
+        at time 0.
+    duration: The duration of the event (in days).
+    period: The period of the event (in days).
+    mask_width: Number of durations to mask out.
+    phase_limit: Minimum phase to keep.
+
+  Returns:
+    Boolean numpy array; True for points outside the chosen limits.
+  """
+  abs_time = np.abs(time)
+  max_abs_time = np.max(abs_time) if len(abs_time) else -np.inf
+  limits = [
+      max(duration * mask_width / 2, period * phase_limit),
+      max(duration * (mask_width / 2) / 2, period * phase_limit),
+      max(duration * (mask_width / 2) / 2, period * (phase_limit / 10)),
+  ]
+  limit = next((l for l in limits if max_abs_time > l), limits[-1])
+  return abs_time > limit
+
+
+def split_arrays(time, *arrays, gap_width=0.75):
+  """Splits a light curve segment and its per-point arrays on gaps in time.
+
+  Args:
+    time: 1D numpy array of time values.
+    *arrays: 1D numpy arrays with the same length as time, e.g. flux values and
+        masks.
+    gap_width: Minimum gap size (in time units) for a split.
+
+  Returns:
+    A list for time and each of arrays; each is a list of views of the split
+    segments of the corresponding array.
+  """
+  if not len(time):
+    return [[] for _ in range(len(arrays) + 1)]
+  breaks = np.flatnonzero(np.diff(time) > gap_width) + 1
+  bounds = list(zip(np.concatenate([[0], breaks]), np.concatenate([breaks, [len(time)]])))
+  return [[a[start:end] for start, end in bounds] for a in (time,) + arrays]
+
+
 def split(all_time, all_flux, gap_width=0.75):
   """Splits a light curve on discontinuities (gaps).
 
@@ -71,13 +139,9 @@ def split(all_time, all_flux, gap_width=0.75):
   out_time = []
   out_flux = []
   for time, flux in zip(all_time, all_flux):
-    start = 0
-    for end in range(1, len(time) + 1):
-      # Choose the largest endpoint such that time[start:end] has no gaps.
-      if end == len(time) or time[end] - time[end - 1] > gap_width:
-        out_time.append(time[start:end])
-        out_flux.append(flux[start:end])
-        start = end
+    split_time, split_flux = split_arrays(time, flux, gap_width=gap_width)
+    out_time.extend(split_time)
+    out_flux.extend(split_flux)
 
   return out_time, out_flux
 
@@ -0,0 +1,114 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for util.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import numpy as np
+
+from light_curve_util import util
+
+
+def _list_mask(time, duration, period, mask_width, phase_limit):
+  return np.array([(abs(t) > duration * mask_width / 2) and (abs(t) > period * phase_limit)
+                   for t in time])
+
+
+def _loop_split(time, flux, gap_width):
+  out_time, out_flux = [], []
+  start = 0
+  for end in range(1, len(time) + 1):
+    if end == len(time) or time[end] - time[end - 1] > gap_width:
+      out_time.append(time[start:end])
+      out_flux.append(flux[start:end])
+      start = end
+  return out_time, out_flux
+
+
+class SplitTest(absltest.TestCase):
+
+  def testSplitArrays(self):
+    time = np.array([1.0, 2.0, 3.0, 5.0, 6.0, 9.0])
+    flux = np.arange(6.0)
+    mask = np.array([True, False, True, True, False, True])
+    split_time, split_flux, split_mask = util.split_arrays(time, flux, mask, gap_width=1.5)
+    self.assertLen(split_time, 3)
+    for actual, expected in zip(split_flux, [[0, 1, 2], [3, 4], [5]]):
+      np.testing.assert_array_equal(actual, expected)
+    np.testing.assert_array_equal(split_mask[1], [True, False])
+    for segment in split_time + split_flux + split_mask:
+      self.assertIsNotNone(segment.base)  # Views, not copies.
+
+    self.assertEqual(util.split_arrays(np.array([]), np.array([])), [[], []])
+    self.assertLen(util.split_arrays(np.array([2.0]))[0], 1)
+
+  def testMatchesLoop(self):
+    rng = np.random.RandomState(0)
+    time = np.cumsum(rng.exponential(0.2, size=1000))
+    flux = rng.randn(1000)
+    all_time = [time[:400], time[400:]]
+    all_flux = [flux[:400], flux[400:]]
+    for gap_width in [0.1, 0.5, 2.0]:
+      expected_time, expected_flux = [], []
+      for t, f in zip(all_time, all_flux):
+        segment_time, segment_flux = _loop_split(t, f, gap_width)
+        expected_time.extend(segment_time)
+        expected_flux.extend(segment_flux)
+      out_time, out_flux = util.split(all_time, all_flux, gap_width=gap_width)
+      self.assertLen(out_time, len(expected_time))
+      for a, e in zip(out_time + out_flux, expected_time + expected_flux):
+        np.testing.assert_array_equal(a, e)
+
+
+class MaskTransitTest(absltest.TestCase):
+
+  def testMaskTransit(self):
+    time = np.linspace(-2.0, 2.0, 401)
+    for duration, period in [(0.3, 4.0), (1.5, 4.0)]:
+      np.testing.assert_array_equal(
+          util.mask_transit(time, duration, period, 2, 0.1),
+          _list_mask(time, duration, period, 2, 0.1))
+
+  def testFallback(self):
+    time = np.linspace(-0.5, 0.5, 101)
+    period = 1.0
+
+    # The first limits keep some points.
+    np.testing.assert_array_equal(
+        util.mask_transit_with_fallback(time, 0.2, period),
+        _list_mask(time, 0.2, period, 2, 0.1))
+
+    # Halving the mask width is needed.
+    mask = util.mask_transit_with_fallback(time, 0.8, period)
+    self.assertFalse(np.any(_list_mask(time, 0.8, period, 2, 0.1)))
+    np.testing.assert_array_equal(mask, _list_mask(time, 0.8, period, 1, 0.1))
+    self.assertTrue(np.any(mask))
+
+    # The phase limit is relaxed too.
+    time = np.linspace(-0.06, 0.06, 13)
+    mask = util.mask_transit_with_fallback(time, 0.05, period)
+    np.testing.assert_array_equal(mask, _list_mask(time, 0.05, period, 1, 0.01))
+    self.assertTrue(np.any(mask))
+
+    # Nothing can be kept.
+    mask = util.mask_transit_with_fallback(time, 0.5, period)
+    self.assertFalse(np.any(mask))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,75 @@
+"""Benchmarks banded_spline.BandedSpline against pydl's bspline.iterfit.
+
+Times a single least-squares fit with each implementation, and kepler_spline
+(up to 5 fits with outlier removal) with and without warm_start, on synthetic
+light curve segments of increasing length. The maximum relative difference
+between the splines is printed alongside.
+
+Usage:
+  python -m scripts.benchmark_banded_spline [--bkspace=0.5] [--repeats=3]
+"""
+
+import argparse
+import timeit
+import warnings
+
+import numpy as np
+from pydl.pydlutils import bspline
+
+from light_curve_util import banded_spline
+from light_curve_util import keplersplinev2
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--bkspace", type=float, default=0.5)
+parser.add_argument("--repeats", type=int, default=3)
+
+
+def _light_curve(num_points, seed=0):
+  rng = np.random.RandomState(seed)
+  # A 27 day sector at the given cadence.
+  time = np.linspace(0.0, 27.0, num_points)
+  flux = 1.0 + 0.01 * np.sin(time / 1.3) + 1e-3 * rng.randn(num_points)
+  flux[rng.randint(0, num_points, num_points // 200)] += 0.02  # Outliers.
+  return time, flux
+
+
+def _iterfit(time, flux, bkspace):
+  with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    return bspline.iterfit(time, flux, bkspace=bkspace)[0].value(time)[0]
+
+
+def _time(fn, repeats):
+  return min(timeit.repeat(fn, number=1, repeat=repeats))
+
+
+def main():
+  args = parser.parse_args()
+  print(f"{'points':>8} {'iterfit':>9} {'banded':>9} {'kepler':>9} {'warm':>9} {'max rel diff':>13}")
+  for num_points in [2000, 20000, 100000]:
+    time, flux = _light_curve(num_points)
+    mask = np.ones_like(time, dtype=bool)
+
+    iterfit_seconds = _time(lambda: _iterfit(time, flux, args.bkspace), args.repeats)
+    banded_seconds = _time(
+        lambda: banded_spline.BandedSpline().fit(time, flux, mask, args.bkspace).evaluate(time),
+        args.repeats)
+    kepler_seconds = _time(
+        lambda: keplersplinev2.kepler_spline(time, flux, args.bkspace, input_mask=mask),
+        args.repeats)
+    warm_seconds = _time(
+        lambda: keplersplinev2.kepler_spline(
+            time, flux, args.bkspace, input_mask=mask, warm_start=True),
+        args.repeats)
+
+    expected = keplersplinev2.kepler_spline(time, flux, args.bkspace, input_mask=mask)[0]
+    actual = keplersplinev2.kepler_spline(
+        time, flux, args.bkspace, input_mask=mask, warm_start=True)[0]
+    diff = np.max(np.abs(actual - expected) / np.abs(expected))
+    print(f"{num_points:>8} {iterfit_seconds:>9.4f} {banded_seconds:>9.4f} "
+          f"{kepler_seconds:>9.4f} {warm_seconds:>9.4f} {diff:>13.2e}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,51 @@
+"""Benchmarks preprocess.find_secondary against the period / duration ratio.
+
+The secondary eclipse search evaluates trial epochs spaced by a tenth of the
+transit duration, so the number of trials grows with period / duration. This
+script times the search on synthetic light curves with the same number of
+points and an increasing ratio; the run time should stay roughly flat.
+
+Usage:
+  python -m scripts.benchmark_find_secondary [--num_points=20000] [--repeats=5]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from astronet.preprocess import preprocess
+from light_curve_util import util
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--num_points", type=int, default=20000)
+parser.add_argument("--repeats", type=int, default=5)
+
+
+def _light_curve(num_points, period, duration, seed=0):
+  rng = np.random.RandomState(seed)
+  # At least two sectors, and at least two transits.
+  time = np.sort(rng.uniform(0, max(54.0, 2 * period), num_points))
+  flux = 1.0 + 1e-3 * rng.randn(num_points)
+  folded, _ = util.phase_fold_time(time, period, 0.0)
+  flux[np.abs(folded) < duration / 2] -= 0.01
+  order = np.argsort(folded)
+  return folded[order], flux[order]
+
+
+def main():
+  args = parser.parse_args()
+  duration = 0.05
+  print(f"{'period/duration':>16} {'trials':>8} {'seconds':>10}")
+  for ratio in [20, 100, 1000, 10000]:
+    period = ratio * duration
+    time, flux = _light_curve(args.num_points, period, duration)
+    seconds = min(timeit.repeat(
+        lambda: preprocess.find_secondary(time, flux, duration, period),
+        number=1, repeat=args.repeats))
+    print(f"{ratio:>16} {int(10 * ratio):>8} {seconds:>10.4f}")
+
+
+if __name__ == "__main__":
+  main()
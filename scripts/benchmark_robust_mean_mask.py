@@ -0,0 +1,55 @@
+"""Benchmarks keplersplinev2.robust_mean_mask against the np.median version.
+
+robust_mean_mask runs on every spline residual vector. This script times the
+previous sort based implementation and robust_mean_mask, with and without a
+preallocated scratch buffer, across typical input sizes. robust_mean_mask
+only uses selection below keplersplinev2._PARTITION_MAX_SIZE points, since
+np.median is faster for larger inputs.
+
+Usage:
+  python -m scripts.benchmark_robust_mean_mask [--number=200]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from light_curve_util import keplersplinev2
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--number", type=int, default=200)
+
+
+def _median_robust_mean_mask(y):
+  """The previous implementation, which sorts y twice in np.median."""
+  absdev = np.abs(y - np.median(y))
+  sigma = 1.4826 * np.median(absdev)
+  if sigma < 1.0e-24:
+    sigma = 1.253 * np.mean(absdev)
+  mask = absdev <= 3 * sigma
+  sigma = np.std(y[mask]) / keplersplinev2.THREE_SIGMA_FACTOR
+  return absdev <= 3 * sigma
+
+
+def main():
+  args = parser.parse_args()
+  rng = np.random.RandomState(0)
+  print(f"{'points':>8} {'median (us)':>12} {'default':>10} {'scratch':>10}")
+  for n in [10, 100, 1000, 5000, 9999, 10000, 50000]:
+    y = rng.standard_t(3, size=n)
+    scratch = np.empty(2 * n)
+    assert np.array_equal(_median_robust_mean_mask(y), keplersplinev2.robust_mean_mask(y))
+
+    def _time(fn):
+      return min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number * 1e6
+
+    median_us = _time(lambda: _median_robust_mean_mask(y))
+    default_us = _time(lambda: keplersplinev2.robust_mean_mask(y))
+    scratch_us = _time(lambda: keplersplinev2.robust_mean_mask(y, scratch))
+    print(f"{n:>8} {median_us:>12.1f} {default_us:>10.1f} {scratch_us:>10.1f}")
+
+
+if __name__ == "__main__":
+  main()